@@ -0,0 +1,203 @@
+import statistics
+import threading
+from typing import Dict, Iterable, List
+
+from agents.specialized_agents import SpecializedAgent
+from utils.context_builder import count_tokens
+from utils.task_graph import TaskGraph
+from utils.telemetry import Telemetry, estimate_cost
+
+DEFAULT_OUTPUT_RATIO = 0.5
+DEFAULT_TTFT = 1.0
+DEFAULT_TOKENS_PER_SECOND = 50.0
+
+
+class CostEstimator:
+    def __init__(self, agents: Dict[str, SpecializedAgent], telemetry: Telemetry | None = None,
+                 history: int = 2000):
+        self.agents = agents
+        self.output_tokens: Dict[str, float] = {}
+        self.seconds_per_token: Dict[str, float] = {}
+        self._samples: Dict[str, List[int]] = {}
+        self._timings: Dict[str, List[float]] = {}
+        if telemetry:
+            self.learn(telemetry.events(limit=history))
+
+    def learn(self, events: Iterable[Dict]):
+        for event in events:
+            output_tokens = event.get("output_tokens") or 0
+            if event.get("error") or event.get("cache_hit") or output_tokens <= 0 or not event.get("agent_type"):
+                continue
+            self._samples.setdefault(event["agent_type"], []).append(output_tokens)
+            if event.get("latency") and event.get("model"):
+                timing = self._timings.setdefault(event["model"], [0.0, 0.0])
+                timing[0] += event["latency"]
+                timing[1] += output_tokens
+        self.output_tokens = {agent_type: statistics.median(samples) for agent_type, samples in self._samples.items()}
+        self.seconds_per_token = {model: seconds / tokens for model, (seconds, tokens) in self._timings.items()}
+
+    def learn_results(self, results: Iterable[Dict]):
+        self.learn({
+            "agent_type": result.get("agent_type"),
+            "output_tokens": (result.get("usage") or {}).get("output_tokens", 0)
+        } for result in results if result and result.get("status") == "completed" and not result.get("reused_from"))
+
+    def _agent(self, task: Dict) -> SpecializedAgent:
+        return self.agents.get(task.get("assigned_agent", "research")) or self.agents["research"]
+
+    def seconds(self, model: str, output_tokens: float) -> float:
+        if model in self.seconds_per_token:
+            return output_tokens * self.seconds_per_token[model]
+        return DEFAULT_TTFT + output_tokens / DEFAULT_TOKENS_PER_SECOND
+
+    def estimate_task(self, task: Dict, context: Dict | None, model: str | None = None) -> Dict:
+        agent = self._agent(task)
+        model = model or agent.model
+        messages = agent.build_messages(task, context, model)
+        input_tokens = sum(count_tokens(str(message["content"]), model) for message in messages)
+        output_tokens = int(min(agent.max_tokens,
+                                self.output_tokens.get(agent.agent_type, agent.max_tokens * DEFAULT_OUTPUT_RATIO)))
+        return {
+            "task_id": task.get("task_id"),
+            "agent_type": agent.agent_type,
+            "model": model,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost_usd": round(estimate_cost(model, {"input_tokens": input_tokens, "output_tokens": output_tokens}), 6),
+            "seconds": round(self.seconds(model, output_tokens), 3),
+            "skipped": None
+        }
+
+    def estimate(self, plan: Dict, context: Dict | None, skip: Dict[str, str] | None = None,
+                 workers: int = 4) -> Dict:
+        graph = TaskGraph(plan)
+        skip = skip or {}
+        tasks = {}
+        for task_id in graph.order:
+            task = {**graph.tasks[task_id], "task_id": task_id}
+            if task_id in skip:
+                tasks[task_id] = {"task_id": task_id, "agent_type": self._agent(task).agent_type, "model": None,
+                                  "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "seconds": 0.0,
+                                  "skipped": skip[task_id]}
+            else:
+                tasks[task_id] = self.estimate_task(task, context)
+
+        finish: Dict[str, float] = {}
+        previous: Dict[str, str | None] = {}
+        while len(finish) < len(graph.order):
+            for task_id in graph.ready_tasks(set(finish), set(finish)):
+                before = max(graph.dependencies[task_id], key=finish.__getitem__, default=None)
+                previous[task_id] = before
+                finish[task_id] = tasks[task_id]["seconds"] + (finish[before] if before else 0.0)
+        critical_path = []
+        task_id = max(finish, key=finish.__getitem__, default=None)
+        while task_id:
+            critical_path.append(task_id)
+            task_id = previous[task_id]
+
+        by_agent: Dict[str, Dict] = {}
+        for entry in tasks.values():
+            totals = by_agent.setdefault(entry["agent_type"], {"tasks": 0, "input_tokens": 0, "output_tokens": 0,
+                                                               "cost_usd": 0.0})
+            if not entry["skipped"]:
+                totals["tasks"] += 1
+                for key in ("input_tokens", "output_tokens", "cost_usd"):
+                    totals[key] += entry[key]
+
+        task_seconds = sum(entry["seconds"] for entry in tasks.values())
+        critical_seconds = max(finish.values(), default=0.0)
+        return {
+            "tasks": tasks,
+            "by_agent": by_agent,
+            "critical_path": critical_path[::-1],
+            "totals": {
+                "tasks": sum(1 for entry in tasks.values() if not entry["skipped"]),
+                "skipped": sum(1 for entry in tasks.values() if entry["skipped"]),
+                "input_tokens": sum(entry["input_tokens"] for entry in tasks.values()),
+                "output_tokens": sum(entry["output_tokens"] for entry in tasks.values()),
+                "cost_usd": round(sum(entry["cost_usd"] for entry in tasks.values()), 6),
+                "task_seconds": round(task_seconds, 2),
+                "critical_path_seconds": round(critical_seconds, 2),
+                "wall_seconds": round(max(critical_seconds, task_seconds / max(1, workers)), 2),
+                "workers": workers
+            }
+        }
+
+
+class RunBudget:
+    def __init__(self, max_tokens: int | None = None, max_cost: float | None = None,
+                 fallback_model: str | None = None):
+        self.max_tokens = max_tokens or None
+        self.max_cost = max_cost or None
+        self.fallback_model = fallback_model or None
+        self.spent_tokens = 0
+        self.spent_cost = 0.0
+        self.downgraded: List[str] = []
+        self.refused: List[str] = []
+        self._reserved: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self) -> bool:
+        return self.max_tokens is not None or self.max_cost is not None
+
+    @property
+    def exhausted(self) -> bool:
+        if self.max_tokens is not None and self.spent_tokens >= self.max_tokens:
+            return True
+        return self.max_cost is not None and self.spent_cost >= self.max_cost
+
+    def _fits(self, tokens: int, cost: float) -> bool:
+        reserved_tokens = sum(entry["tokens"] for entry in self._reserved.values())
+        reserved_cost = sum(entry["cost"] for entry in self._reserved.values())
+        if self.max_tokens is not None and self.spent_tokens + reserved_tokens + tokens > self.max_tokens:
+            return False
+        return self.max_cost is None or self.spent_cost + reserved_cost + cost <= self.max_cost
+
+    def reserve(self, task_id: str, estimate: Dict, downgraded: bool = False) -> bool:
+        tokens = estimate["input_tokens"] + estimate["output_tokens"]
+        with self._lock:
+            if not self._fits(tokens, estimate["cost_usd"]):
+                return False
+            self._reserved[task_id] = {"tokens": tokens, "cost": estimate["cost_usd"]}
+            if downgraded:
+                self.downgraded.append(task_id)
+            return True
+
+    @property
+    def pending(self) -> bool:
+        with self._lock:
+            return bool(self._reserved)
+
+    def refuse(self, task_id: str):
+        with self._lock:
+            self.refused.append(task_id)
+
+    def charge(self, result: Dict, model: str):
+        usage = result.get("usage") or {}
+        if usage.get("local_cache_hit"):
+            return
+        with self._lock:
+            self.spent_tokens += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+            self.spent_cost += estimate_cost(result.get("model") or model, usage)
+
+    def release(self, task_id: str):
+        with self._lock:
+            self._reserved.pop(task_id, None)
+
+    def settle(self, task_id: str, result: Dict, model: str):
+        self.release(task_id)
+        self.charge(result, model)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "max_tokens": self.max_tokens,
+                "max_cost": self.max_cost,
+                "spent_tokens": self.spent_tokens,
+                "spent_cost": round(self.spent_cost, 6),
+                "reserved": len(self._reserved),
+                "exhausted": self.exhausted,
+                "downgraded": list(self.downgraded),
+                "refused": list(self.refused)
+            }
@@ -1,13 +1,26 @@
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Tuple
+import asyncio
 import json
+from agents.routing import AGENT_TYPES
+from agents.schemas import IDEA_SCHEMA, PHASE_DETAIL_SCHEMA, PLAN_SCHEMA, SKELETON_SCHEMA
+from utils.json_output import normalize_schema, parse_json_response, validate_schema
 from utils.llm_client import LLMClient
+from utils.task_graph import TaskGraph
+from utils.telemetry import call_context
+
+PLAN_MAX_TOKENS = 4000
 
 class MasterAgent:
-    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o"):
+    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o", chunk_size: int = 12,
+                 max_parallel_expansions: int = 8, max_skeleton_rounds: int = 8):
         self.llm_client = llm_client
         self.model = model
+        self.chunk_size = max(1, chunk_size)
+        self.max_parallel_expansions = max(1, max_parallel_expansions)
+        self.max_skeleton_rounds = max(1, max_skeleton_rounds)
     
-    def generate_idea(self, project_description: str) -> Dict:
+    def _idea_messages(self, project_description: str) -> List[Dict[str, str]]:
         if not project_description or not project_description.strip():
             raise ValueError("Vui lòng nhập mô tả dự án")
         
@@ -26,30 +39,34 @@ Hãy trả về kết quả dưới dạng JSON với cấu trúc sau:
     "tech_stack_suggestions": ["Công nghệ 1", "Công nghệ 2", ...]
 }}"""
         
-        messages = [
+        return [
             {"role": "system", "content": "Bạn là chuyên gia tư vấn sản phẩm. Luôn trả về JSON hợp lệ."},
             {"role": "user", "content": prompt}
         ]
+    
+    def _parse_idea(self, response: str) -> Dict:
+        idea = parse_json_response(response)
+        if not isinstance(idea, dict):
+            raise ValueError("Ý tưởng không hợp lệ: AI không trả về JSON object")
+        
+        required_fields = ["project_name", "overview", "key_features"]
+        for field in required_fields:
+            if field not in idea:
+                raise ValueError(f"Ý tưởng thiếu trường bắt buộc: {field}")
+        
+        errors = validate_schema(normalize_schema(idea, IDEA_SCHEMA), IDEA_SCHEMA)
+        if errors:
+            raise ValueError(f"Ý tưởng không đúng cấu trúc: {'; '.join(errors[:5])}")
+        
+        return idea
+    
+    def generate_idea(self, project_description: str) -> Dict:
+        messages = self._idea_messages(project_description)
         
         try:
-            response = self.llm_client.chat(messages, model=self.model, temperature=0.8)
-            
-            response_clean = response.strip()
-            if response_clean.startswith("```json"):
-                response_clean = response_clean[7:]
-            if response_clean.startswith("```"):
-                response_clean = response_clean[3:]
-            if response_clean.endswith("```"):
-                response_clean = response_clean[:-3]
-            
-            idea = json.loads(response_clean.strip())
-            
-            required_fields = ["project_name", "overview", "key_features"]
-            for field in required_fields:
-                if field not in idea:
-                    raise ValueError(f"Ý tưởng thiếu trường bắt buộc: {field}")
-            
-            return idea
+            with call_context(agent_type="master", task_id="idea"):
+                response = self.llm_client.chat(messages, model=self.model, temperature=0.8, json_schema=IDEA_SCHEMA)
+            return self._parse_idea(response)
         except json.JSONDecodeError as e:
             raise ValueError(f"AI trả về JSON không hợp lệ. Vui lòng thử lại. Lỗi: {str(e)}")
         except ValueError as e:
@@ -57,7 +74,22 @@ Hãy trả về kết quả dưới dạng JSON với cấu trúc sau:
         except Exception as e:
             raise ValueError(f"Lỗi khi tạo ý tưởng: {str(e)}")
     
-    def create_project_plan(self, idea: Dict) -> Dict:
+    async def agenerate_idea(self, project_description: str) -> Dict:
+        messages = self._idea_messages(project_description)
+        
+        try:
+            with call_context(agent_type="master", task_id="idea"):
+                response = await self.llm_client.achat(messages, model=self.model, temperature=0.8,
+                                                       json_schema=IDEA_SCHEMA)
+            return self._parse_idea(response)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"AI trả về JSON không hợp lệ. Vui lòng thử lại. Lỗi: {str(e)}")
+        except ValueError as e:
+            raise e
+        except Exception as e:
+            raise ValueError(f"Lỗi khi tạo ý tưởng: {str(e)}")
+    
+    def _plan_messages(self, idea: Dict) -> List[Dict[str, str]]:
         if not idea or not isinstance(idea, dict):
             raise ValueError("Ý tưởng không hợp lệ")
         
@@ -90,32 +122,451 @@ Hãy tạo kế hoạch với ít nhất 2-3 phases và mỗi phase có ít nh
 
 QUAN TRỌNG: Phải có ít nhất 2 phases và mỗi phase phải có ít nhất 2 tasks."""
         
-        messages = [
+        return [
             {"role": "system", "content": "Bạn là project manager chuyên nghiệp. Luôn trả về JSON hợp lệ với đầy đủ phases và tasks."},
             {"role": "user", "content": prompt}
         ]
+    
+    def _parse_plan(self, response: str) -> Dict:
+        plan = parse_json_response(response)
+        if not isinstance(plan, dict):
+            raise ValueError("Kế hoạch không hợp lệ: AI không trả về JSON object")
         
-        try:
-            response = self.llm_client.chat(messages, model=self.model, temperature=0.7, max_tokens=4000)
+        if "phases" not in plan or not plan["phases"]:
+            raise ValueError("Kế hoạch phải chứa ít nhất 1 phase")
+        
+        for phase in plan["phases"]:
+            if isinstance(phase, dict) and isinstance(phase.get("tasks"), list):
+                phase["tasks"] = [task for task in phase["tasks"] if isinstance(task, dict) and task.get("name")]
+        
+        errors = validate_schema(normalize_schema(plan, PLAN_SCHEMA), PLAN_SCHEMA)
+        if errors:
+            raise ValueError(f"Kế hoạch không đúng cấu trúc: {'; '.join(errors[:5])}")
+        
+        total_tasks = sum(len(phase.get("tasks", [])) for phase in plan["phases"])
+        if total_tasks == 0:
+            raise ValueError("Kế hoạch phải chứa ít nhất 1 task")
+        
+        return plan
+    
+    def _skeleton_messages(self, idea: Dict, listed: Dict | None = None) -> List[Dict[str, str]]:
+        if not idea or not isinstance(idea, dict):
+            raise ValueError("Ý tưởng không hợp lệ")
+        
+        prompt = f"""Dựa trên ý tưởng dự án sau, hãy lập KHUNG kế hoạch thực hiện:
+
+Ý TƯỞNG DỰ ÁN:
+{json.dumps(idea, ensure_ascii=False, indent=2)}
+
+Chỉ liệt kê các phase và tên các task, KHÔNG viết mô tả chi tiết (sẽ được chi tiết hóa ở bước sau).
+Số phase và số task tùy theo quy mô dự án. Trả về JSON với cấu trúc:
+{{
+    "phases": [
+        {{
+            "name": "Tên phase",
+            "description": "Mục tiêu của phase (1 câu)",
+            "tasks": [
+                {{
+                    "task_id": "unique_id",
+                    "name": "Tên task",
+                    "assigned_agent": "ideation/design/coding/testing/research/documentation",
+                    "dependencies": ["task_id của task cần làm trước, có thể ở phase trước"]
+                }}
+            ]
+        }}
+    ],
+    "timeline": "Tổng thời gian dự kiến",
+    "resources_needed": ["Resource 1", "Resource 2", ...]
+}}
+
+QUAN TRỌNG: Phải có ít nhất 2 phases, mỗi phase ít nhất 2 tasks và task_id không được trùng nhau."""
+        
+        if listed:
+            outline = [
+                {"name": phase["name"], "tasks": [{"task_id": stub.get("task_id", ""), "name": stub["name"]} for stub in phase["tasks"]]}
+                for phase in listed["phases"]
+            ]
+            prompt += f"""
+
+KHUNG ĐÃ LIỆT KÊ (bị cắt vì quá dài):
+{json.dumps(outline, ensure_ascii=False)}
+
+Hãy trả về phần CÒN LẠI của khung theo cùng cấu trúc: chỉ gồm các task chưa liệt kê. Nếu phase cuối chưa đủ task,
+tiếp tục phase đó với đúng tên cũ. Trả về "phases": [] nếu khung đã đầy đủ."""
+        
+        return [
+            {"role": "system", "content": "Bạn là project manager chuyên nghiệp. Luôn trả về JSON hợp lệ và ngắn gọn."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _parse_skeleton(self, response: str) -> Dict:
+        skeleton = parse_json_response(response)
+        if not isinstance(skeleton, dict):
+            raise ValueError("Khung kế hoạch không hợp lệ: AI không trả về JSON object")
+        
+        skeleton.setdefault("phases", [])
+        for phase in skeleton["phases"] if isinstance(skeleton["phases"], list) else []:
+            if isinstance(phase, dict) and isinstance(phase.get("tasks"), list):
+                phase["tasks"] = [task for task in phase["tasks"] if isinstance(task, dict) and task.get("name")]
+        
+        errors = validate_schema(normalize_schema(skeleton, SKELETON_SCHEMA), SKELETON_SCHEMA)
+        if errors:
+            raise ValueError(f"Khung kế hoạch không đúng cấu trúc: {'; '.join(errors[:5])}")
+        return skeleton
+    
+    @staticmethod
+    def _extend_skeleton(skeleton: Dict | None, part: Dict, truncated: bool) -> Dict:
+        if truncated:
+            while part["phases"] and not part["phases"][-1]["tasks"]:
+                part["phases"].pop()
+            if part["phases"]:
+                part["phases"][-1]["tasks"].pop()
+        if skeleton is None:
+            return part
+        
+        listed = {str(stub.get("task_id") or stub["name"]) for phase in skeleton["phases"] for stub in phase["tasks"]}
+        for phase in part["phases"]:
+            tasks = [stub for stub in phase["tasks"] if str(stub.get("task_id") or stub["name"]) not in listed]
+            if skeleton["phases"] and phase["name"] == skeleton["phases"][-1]["name"]:
+                skeleton["phases"][-1]["tasks"].extend(tasks)
+            elif tasks:
+                skeleton["phases"].append({**phase, "tasks": tasks})
+        return skeleton
+    
+    def _finish_skeleton(self, skeleton: Dict) -> Dict:
+        skeleton["phases"] = [phase for phase in skeleton["phases"] if phase["tasks"]]
+        if not skeleton["phases"]:
+            raise ValueError("Kế hoạch phải chứa ít nhất 1 task")
+        
+        seen = set()
+        for phase_idx, phase in enumerate(skeleton["phases"]):
+            for task_idx, stub in enumerate(phase["tasks"]):
+                stub["source_id"] = str(stub.get("task_id") or "").strip()
+                stub["task_id"] = self._unique_id(stub["source_id"] or f"p{phase_idx + 1}_t{task_idx + 1}",
+                                                  phase_idx, seen)
+        return skeleton
+    
+    def _skeleton_round(self, skeleton: Dict | None, response: Dict, round_idx: int,
+                        progress_callback: Callable | None) -> Tuple[Dict, bool]:
+        truncated = response["usage"].get("output_tokens", 0) >= PLAN_MAX_TOKENS
+        skeleton = self._extend_skeleton(skeleton, self._parse_skeleton(response["content"]), truncated)
+        if truncated and progress_callback and round_idx + 1 < self.max_skeleton_rounds:
+            tasks = sum(len(phase["tasks"]) for phase in skeleton["phases"])
+            progress_callback(f"🗂️ Khung kế hoạch dài ({tasks} tasks), đang lấy tiếp phần còn lại...", 0.0)
+        return skeleton, truncated
+    
+    def _create_skeleton(self, idea: Dict, progress_callback: Callable | None) -> Dict:
+        skeleton = None
+        for round_idx in range(self.max_skeleton_rounds):
+            messages = self._skeleton_messages(idea, skeleton)
+            with call_context(agent_type="master", task_id=f"plan:skeleton{round_idx + 1}"):
+                response = self.llm_client.chat_with_usage(messages, model=self.model, temperature=0.7,
+                                                           max_tokens=PLAN_MAX_TOKENS, json_schema=SKELETON_SCHEMA)
+            skeleton, truncated = self._skeleton_round(skeleton, response, round_idx, progress_callback)
+            if not truncated:
+                break
+        return self._finish_skeleton(skeleton)
+    
+    async def _acreate_skeleton(self, idea: Dict, progress_callback: Callable | None) -> Dict:
+        skeleton = None
+        for round_idx in range(self.max_skeleton_rounds):
+            messages = self._skeleton_messages(idea, skeleton)
+            with call_context(agent_type="master", task_id=f"plan:skeleton{round_idx + 1}"):
+                response = await self.llm_client.achat_with_usage(messages, model=self.model, temperature=0.7,
+                                                                  max_tokens=PLAN_MAX_TOKENS,
+                                                                  json_schema=SKELETON_SCHEMA)
+            skeleton, truncated = self._skeleton_round(skeleton, response, round_idx, progress_callback)
+            if not truncated:
+                break
+        return self._finish_skeleton(skeleton)
+    
+    @staticmethod
+    def _unique_id(candidate: str, phase_idx: int, seen: set) -> str:
+        task_id = candidate if candidate not in seen else f"p{phase_idx + 1}_{candidate}"
+        suffix = 2
+        while task_id in seen:
+            task_id = f"p{phase_idx + 1}_{candidate}_{suffix}"
+            suffix += 1
+        seen.add(task_id)
+        return task_id
+    
+    def _expansion_jobs(self, skeleton: Dict) -> List[Dict]:
+        jobs = []
+        for phase_idx, phase in enumerate(skeleton["phases"]):
+            stubs = phase["tasks"]
+            for start in range(0, len(stubs), self.chunk_size):
+                jobs.append({
+                    "phase_idx": phase_idx,
+                    "part": start // self.chunk_size + 1,
+                    "parts": -(-len(stubs) // self.chunk_size),
+                    "stubs": stubs[start:start + self.chunk_size]
+                })
+        return jobs
+    
+    def _detail_messages(self, idea: Dict, skeleton: Dict, job: Dict) -> List[Dict[str, str]]:
+        outline = []
+        for phase_idx, phase in enumerate(skeleton["phases"][:job["phase_idx"] + 1]):
+            outline.append(f"Phase {phase_idx + 1}: {phase['name']}")
+            outline.extend(f"- {stub['task_id']}: {stub['name']}" for stub in phase["tasks"])
+        phase = skeleton["phases"][job["phase_idx"]]
+        stubs = [
+            {key: stub[key] for key in ("task_id", "name", "assigned_agent", "dependencies") if stub.get(key)}
+            for stub in job["stubs"]
+        ]
+        
+        prompt = f"""Ý TƯỞNG DỰ ÁN:
+{json.dumps(idea, ensure_ascii=False, indent=2)}
+
+KHUNG KẾ HOẠCH (các phase đến phase hiện tại):
+{chr(10).join(outline)}
+
+Hãy chi tiết hóa các task sau của phase "{phase['name']}" ({phase.get('description', '')}):
+{json.dumps(stubs, ensure_ascii=False, indent=2)}
+
+Với mỗi task: giữ nguyên task_id, viết mô tả chi tiết (việc cần làm, đầu ra mong đợi), chọn assigned_agent
+(ideation/design/coding/testing/research/documentation), ước lượng estimated_duration và liệt kê dependencies
+bằng task_id trong khung kế hoạch. Task quá lớn có thể tách thành nhiều task nhỏ với task_id mới.
+Trả về JSON: {{"tasks": [{{"task_id": "...", "name": "...", "description": "...", "assigned_agent": "...", "estimated_duration": "...", "dependencies": ["..."]}}]}}"""
+        
+        return [
+            {"role": "system", "content": "Bạn là project manager chuyên nghiệp. Luôn trả về JSON hợp lệ."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _parse_detail(self, response: str) -> List[Dict]:
+        detail = parse_json_response(response)
+        if isinstance(detail, list):
+            detail = {"tasks": detail}
+        if not isinstance(detail, dict) or not isinstance(detail.get("tasks"), list):
+            raise ValueError("Chi tiết phase không hợp lệ: thiếu danh sách tasks")
+        
+        detail["tasks"] = [task for task in detail["tasks"] if isinstance(task, dict) and task.get("name")]
+        errors = validate_schema(normalize_schema(detail, PHASE_DETAIL_SCHEMA), PHASE_DETAIL_SCHEMA)
+        if errors:
+            raise ValueError(f"Chi tiết phase không đúng cấu trúc: {'; '.join(errors[:5])}")
+        return detail["tasks"]
+    
+    def _expand(self, idea: Dict, skeleton: Dict, job: Dict) -> List[Dict]:
+        messages = self._detail_messages(idea, skeleton, job)
+        with call_context(agent_type="master", task_id=f"plan:phase{job['phase_idx'] + 1}.{job['part']}"):
+            response = self.llm_client.chat(messages, model=self.model, temperature=0.7, max_tokens=PLAN_MAX_TOKENS,
+                                            json_schema=PHASE_DETAIL_SCHEMA)
+        return self._parse_detail(response)
+    
+    async def _aexpand(self, idea: Dict, skeleton: Dict, job: Dict) -> List[Dict]:
+        messages = self._detail_messages(idea, skeleton, job)
+        with call_context(agent_type="master", task_id=f"plan:phase{job['phase_idx'] + 1}.{job['part']}"):
+            response = await self.llm_client.achat(messages, model=self.model, temperature=0.7,
+                                                   max_tokens=PLAN_MAX_TOKENS, json_schema=PHASE_DETAIL_SCHEMA)
+        return self._parse_detail(response)
+    
+    @staticmethod
+    def _key(value) -> str:
+        return " ".join(str(value or "").lower().split())
+    
+    def _merge_plan(self, skeleton: Dict, jobs: List[Dict], details: List) -> Dict:
+        seen = {stub["task_id"] for phase in skeleton["phases"] for stub in phase["tasks"]}
+        lookup: Dict[str, str] = {}
+        for phase in skeleton["phases"]:
+            for stub in phase["tasks"]:
+                for alias in (stub["task_id"], stub["source_id"], stub["name"]):
+                    if alias:
+                        lookup.setdefault(self._key(alias), stub["task_id"])
+        
+        phases = [
+            {"name": phase["name"], "description": phase.get("description", ""), "tasks": []}
+            for phase in skeleton["phases"]
+        ]
+        raw_dependencies: Dict[str, List] = {}
+        for job, detail in zip(jobs, details):
+            phase_idx = job["phase_idx"]
+            by_id = {stub["task_id"]: stub for stub in job["stubs"]}
+            by_alias: Dict[str, str] = {}
+            for field in ("task_id", "source_id", "name"):
+                for stub in job["stubs"]:
+                    if stub[field]:
+                        by_alias.setdefault(self._key(stub[field]), stub["task_id"])
+            detailed: Dict[str, Dict] = {}
+            extras = []
+            for task in detail if isinstance(detail, list) else []:
+                stub_id = by_alias.get(self._key(task.get("task_id"))) or by_alias.get(self._key(task.get("name")))
+                if stub_id and stub_id not in detailed:
+                    detailed[stub_id] = task
+                else:
+                    extras.append(task)
+            
+            merged = []
+            for stub_id, stub in by_id.items():
+                task = detailed.get(stub_id, {})
+                merged.append((stub_id, stub, task))
+            for task in extras:
+                source_id = str(task.get("task_id") or "").strip()
+                task_id = self._unique_id(source_id or f"p{phase_idx + 1}_x{len(seen) + 1}", phase_idx, seen)
+                for alias in (source_id, task_id, task.get("name")):
+                    if alias:
+                        lookup.setdefault(self._key(alias), task_id)
+                merged.append((task_id, {}, task))
             
-            response_clean = response.strip()
-            if response_clean.startswith("```json"):
-                response_clean = response_clean[7:]
-            if response_clean.startswith("```"):
-                response_clean = response_clean[3:]
-            if response_clean.endswith("```"):
-                response_clean = response_clean[:-3]
+            for task_id, stub, task in merged:
+                agent = task.get("assigned_agent") if task.get("assigned_agent") in AGENT_TYPES else stub.get("assigned_agent")
+                name = task.get("name") or stub["name"]
+                phases[phase_idx]["tasks"].append({
+                    "task_id": task_id,
+                    "name": name,
+                    "description": task.get("description") or name,
+                    "assigned_agent": agent if agent in AGENT_TYPES else "research",
+                    "estimated_duration": task.get("estimated_duration") or "N/A",
+                    "dependencies": []
+                })
+                raw_dependencies[task_id] = [*(stub.get("dependencies") or []), *(task.get("dependencies") or [])]
+        
+        tasks = [task for phase in phases for task in phase["tasks"]]
+        for task in tasks:
+            for dependency in raw_dependencies[task["task_id"]]:
+                resolved = lookup.get(self._key(dependency))
+                if resolved and resolved != task["task_id"] and resolved not in task["dependencies"]:
+                    task["dependencies"].append(resolved)
+        self._break_cycles(tasks)
+        
+        plan = {
+            "phases": [phase for phase in phases if phase["tasks"]],
+            "timeline": skeleton.get("timeline", "N/A"),
+            "resources_needed": skeleton.get("resources_needed", [])
+        }
+        errors = validate_schema(normalize_schema(plan, PLAN_SCHEMA), PLAN_SCHEMA)
+        if errors:
+            raise ValueError(f"Kế hoạch không đúng cấu trúc: {'; '.join(errors[:5])}")
+        TaskGraph(plan)
+        return plan
+    
+    @staticmethod
+    def _depends_on(by_id: Dict[str, Dict], task_id: str, target: str) -> bool:
+        seen = set()
+        stack = [task_id]
+        while stack:
+            current = stack.pop()
+            if current == target:
+                return True
+            if current not in seen:
+                seen.add(current)
+                stack.extend(by_id[current]["dependencies"])
+        return False
+    
+    def _break_cycles(self, tasks: List[Dict]):
+        by_id = {task["task_id"]: task for task in tasks}
+        position = {task["task_id"]: index for index, task in enumerate(tasks)}
+        forward = []
+        for task in tasks:
+            later = [dep for dep in task["dependencies"] if position[dep] > position[task["task_id"]]]
+            task["dependencies"] = [dep for dep in task["dependencies"] if dep not in later]
+            forward.extend((task, dep) for dep in later)
+        for task, dep in forward:
+            if not self._depends_on(by_id, dep, task["task_id"]):
+                task["dependencies"].append(dep)
+    
+    def _report_skeleton(self, skeleton: Dict, jobs: List[Dict], progress_callback: Callable | None):
+        if progress_callback:
+            phases = ", ".join(f"{phase['name']} ({len(phase['tasks'])})" for phase in skeleton["phases"])
+            progress_callback(f"🗂️ Khung kế hoạch: {phases} — chi tiết hóa {len(jobs)} phần song song", 0.0)
+    
+    def _report_expansion(self, job: Dict, skeleton: Dict, error: Exception | None, done: int, total: int,
+                          progress_callback: Callable | None):
+        if progress_callback:
+            name = skeleton["phases"][job["phase_idx"]]["name"]
+            part = f" (phần {job['part']}/{job['parts']})" if job["parts"] > 1 else ""
+            if error is None:
+                progress_callback(f"✅ {name}{part}", done / total)
+            else:
+                progress_callback(f"⚠️ {name}{part}: dùng khung task do lỗi {str(error)}", done / total)
+    
+    def create_project_plan(self, idea: Dict, hierarchical: bool = True,
+                            progress_callback: Callable | None = None) -> Dict:
+        if not hierarchical:
+            return self._create_flat_plan(idea)
+        try:
+            skeleton = self._create_skeleton(idea, progress_callback)
+            jobs = self._expansion_jobs(skeleton)
+            self._report_skeleton(skeleton, jobs, progress_callback)
             
-            plan = json.loads(response_clean.strip())
+            details: List = [None] * len(jobs)
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel_expansions, len(jobs))) as pool:
+                futures = {pool.submit(self._expand, idea, skeleton, job): index for index, job in enumerate(jobs)}
+                try:
+                    for done, future in enumerate(as_completed(futures), 1):
+                        index = futures[future]
+                        try:
+                            details[index] = future.result()
+                            error = None
+                        except Exception as e:
+                            error = e
+                        self._report_expansion(jobs[index], skeleton, error, done, len(jobs), progress_callback)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            return self._merge_plan(skeleton, jobs, details)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"AI trả về JSON không hợp lệ. Vui lòng thử lại. Lỗi: {str(e)}")
+        except ValueError as e:
+            raise e
+        except Exception as e:
+            raise ValueError(f"Lỗi khi tạo kế hoạch: {str(e)}")
+    
+    async def acreate_project_plan(self, idea: Dict, hierarchical: bool = True,
+                                   progress_callback: Callable | None = None) -> Dict:
+        if not hierarchical:
+            return await self._acreate_flat_plan(idea)
+        try:
+            skeleton = await self._acreate_skeleton(idea, progress_callback)
+            jobs = self._expansion_jobs(skeleton)
+            self._report_skeleton(skeleton, jobs, progress_callback)
             
-            if "phases" not in plan or not plan["phases"]:
-                raise ValueError("Kế hoạch phải chứa ít nhất 1 phase")
+            semaphore = asyncio.Semaphore(self.max_parallel_expansions)
+            completed = 0
             
-            total_tasks = sum(len(phase.get("tasks", [])) for phase in plan["phases"])
-            if total_tasks == 0:
-                raise ValueError("Kế hoạch phải chứa ít nhất 1 task")
+            async def expand(job: Dict):
+                nonlocal completed
+                async with semaphore:
+                    try:
+                        detail, error = await self._aexpand(idea, skeleton, job), None
+                    except Exception as e:
+                        detail, error = None, e
+                completed += 1
+                self._report_expansion(job, skeleton, error, completed, len(jobs), progress_callback)
+                return detail
             
-            return plan
+            details = await asyncio.gather(*(expand(job) for job in jobs))
+            return self._merge_plan(skeleton, jobs, details)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"AI trả về JSON không hợp lệ. Vui lòng thử lại. Lỗi: {str(e)}")
+        except ValueError as e:
+            raise e
+        except Exception as e:
+            raise ValueError(f"Lỗi khi tạo kế hoạch: {str(e)}")
+    
+    def _create_flat_plan(self, idea: Dict) -> Dict:
+        messages = self._plan_messages(idea)
+        
+        try:
+            with call_context(agent_type="master", task_id="plan"):
+                response = self.llm_client.chat(messages, model=self.model, temperature=0.7, max_tokens=4000,
+                                                json_schema=PLAN_SCHEMA)
+            return self._parse_plan(response)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"AI trả về JSON không hợp lệ. Vui lòng thử lại. Lỗi: {str(e)}")
+        except ValueError as e:
+            raise e
+        except Exception as e:
+            raise ValueError(f"Lỗi khi tạo kế hoạch: {str(e)}")
+    
+    async def _acreate_flat_plan(self, idea: Dict) -> Dict:
+        messages = self._plan_messages(idea)
+        
+        try:
+            with call_context(agent_type="master", task_id="plan"):
+                response = await self.llm_client.achat(messages, model=self.model, temperature=0.7, max_tokens=4000,
+                                                       json_schema=PLAN_SCHEMA)
+            return self._parse_plan(response)
         except json.JSONDecodeError as e:
             raise ValueError(f"AI trả về JSON không hợp lệ. Vui lòng thử lại. Lỗi: {str(e)}")
         except ValueError as e:
@@ -1,86 +1,561 @@
-from typing import Dict, List, Callable
+import asyncio
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Callable, Set, Tuple
+from agents.cost_estimator import CostEstimator, RunBudget
+from agents.report_builder import ReportBuilder
+from agents.routing import RoutingPolicy
 from agents.specialized_agents import (
     IdeationAgent, DesignAgent, CodingAgent,
     TestingAgent, ResearchAgent, DocumentationAgent
 )
+from utils.batch_transport import AnthropicBatchTransport, BatchTransport, OpenAIBatchTransport
+from utils.context_builder import ContextBuilder
+from utils.digest_store import DigestStore
 from utils.llm_client import LLMClient
+from utils.run_store import RunStore
+from utils.similarity_index import SimilarityIndex
+from utils.task_graph import TaskGraph, content_hash
+from utils.telemetry import call_context
 
-class TaskOrchestrator:
-    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini"):
-        self.llm_client = llm_client
-        self.agents = {
-            "ideation": IdeationAgent(llm_client, model),
-            "design": DesignAgent(llm_client, model),
-            "coding": CodingAgent(llm_client, model),
-            "testing": TestingAgent(llm_client, model),
-            "research": ResearchAgent(llm_client, model),
-            "documentation": DocumentationAgent(llm_client, model)
-        }
-        self.task_results = {}
-    
-    def execute_plan(self, plan: Dict, context: Dict, progress_callback: Callable | None = None) -> List[Dict]:
+DEFER_BACKOFF = (0.05, 2.0)
+
+class PlanExecution:
+    def __init__(self, plan: Dict, progress_callback: Callable | None = None,
+                 result_callback: Callable[[str, Dict], None] | None = None):
         if not plan or not isinstance(plan, dict):
             raise ValueError("Kế hoạch không hợp lệ hoặc rỗng")
         
-        phases = plan.get("phases", [])
-        if not phases or not isinstance(phases, list):
+        self.phases = plan.get("phases", [])
+        if not self.phases or not isinstance(self.phases, list):
             raise ValueError("Kế hoạch không chứa phases hợp lệ. Vui lòng tạo lại kế hoạch.")
         
-        all_results = []
-        total_tasks = sum(len(phase.get("tasks", [])) for phase in phases)
+        self.graph = TaskGraph(plan)
+        self.total_tasks = len(self.graph)
         
-        if total_tasks == 0:
+        if self.total_tasks == 0:
             raise ValueError("Kế hoạch không chứa tasks nào. Vui lòng tạo lại kế hoạch với các tasks cụ thể.")
         
-        completed_tasks = 0
+        self.progress_callback = progress_callback
+        self.result_callback = result_callback
+        self.results_by_id: Dict[str, Dict] = {}
+        self.started: Set[str] = set()
+        self.completed: Set[str] = set()
+        self.failed: Set[str] = set()
+        self.started_phases: Set[int] = set()
+    
+    @property
+    def finished(self) -> bool:
+        return len(self.results_by_id) >= self.total_tasks
+    
+    def report(self, message: str):
+        if self.progress_callback:
+            self.progress_callback(message, len(self.results_by_id) / self.total_tasks)
+    
+    def skip_blocked(self):
+        skipped = True
+        while skipped:
+            skipped = False
+            for task_id in self.graph.order:
+                if task_id in self.started:
+                    continue
+                failed_deps = [dep for dep in self.graph.dependencies[task_id] if dep in self.failed]
+                if failed_deps:
+                    self.started.add(task_id)
+                    self.failed.add(task_id)
+                    self.results_by_id[task_id] = {
+                        "task_id": task_id,
+                        "agent_type": self.graph.tasks[task_id].get("assigned_agent", "research"),
+                        "status": "failed",
+                        "result": f"Bỏ qua vì task phụ thuộc thất bại: {', '.join(failed_deps)}"
+                    }
+                    self.report(f"⏭️ Bỏ qua: {self.graph.tasks[task_id].get('name', 'Unknown Task')}")
+                    if self.result_callback:
+                        self.result_callback(task_id, self.results_by_id[task_id])
+                    skipped = True
+    
+    def start_ready(self, limit: int) -> List[Dict]:
+        self.skip_blocked()
+        started = []
+        for task_id in self.graph.ready_tasks(self.completed, self.started):
+            if len(started) >= limit:
+                break
+            task = self.graph.tasks[task_id]
+            phase_idx = self.graph.phase_of[task_id]
+            if phase_idx not in self.started_phases:
+                self.started_phases.add(phase_idx)
+                self.report(f"🔄 Bắt đầu phase: {self.phases[phase_idx].get('name', 'Unknown Phase')}")
+            self.report(f"⚙️ Đang thực hiện: {task.get('name', 'Unknown Task')} "
+                        f"(Agent: {task.get('assigned_agent', 'research')})")
+            self.started.add(task_id)
+            started.append({**task, "task_id": task_id})
+        return started
+    
+    def defer(self, task_id: str):
+        self.started.discard(task_id)
+    
+    def preload(self, results: Dict[str, Dict]):
+        for task_id in self.graph.order:
+            result = results.get(task_id)
+            if result and result.get("status") == "completed":
+                self.started.add(task_id)
+                self.completed.add(task_id)
+                self.results_by_id[task_id] = result
+                self.report(f"⏩ Đã có kết quả: {self.graph.tasks[task_id].get('name', 'Unknown Task')}")
+    
+    def finish(self, task_id: str, result: Dict):
+        self.results_by_id[task_id] = result
+        task_name = self.graph.tasks[task_id].get("name", "Unknown Task")
+        if result.get("status") == "completed":
+            self.completed.add(task_id)
+            self.report(f"✅ Hoàn thành: {task_name}")
+        else:
+            self.failed.add(task_id)
+            self.report(f"❌ Thất bại: {task_name}")
+        if self.result_callback:
+            self.result_callback(task_id, result)
+        self.skip_blocked()
+    
+    def results(self) -> List[Dict]:
+        return [self.results_by_id[task_id] for task_id in self.graph.order if task_id in self.results_by_id]
+
+
+class TaskOrchestrator:
+    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini", max_workers: int = 4,
+                 context_tokens: int = 1500, run_store: RunStore | None = None,
+                 routing: RoutingPolicy | None = None, similarity_index: SimilarityIndex | None = None,
+                 dependency_tokens: int = 1500):
+        self.llm_client = llm_client
+        self.max_workers = max_workers
+        self.run_store = run_store
+        self.routing = routing
+        self.similarity_index = similarity_index
+        self.fresh_tasks: Set[str] = set()
+        self.report_concurrency = 16
+        self.report_summaries: Dict[str, str] = {}
+        self.context_builder = ContextBuilder(max_tokens=context_tokens, model=model)
+        self.dependency_tokens = dependency_tokens
+        self.digests = DigestStore(model=model)
+        self.agents = {
+            "ideation": IdeationAgent(llm_client, model, self.context_builder),
+            "design": DesignAgent(llm_client, model, self.context_builder),
+            "coding": CodingAgent(llm_client, model, self.context_builder),
+            "testing": TestingAgent(llm_client, model, self.context_builder),
+            "research": ResearchAgent(llm_client, model, self.context_builder),
+            "documentation": DocumentationAgent(llm_client, model, self.context_builder)
+        }
+        if routing:
+            for agent_type, agent in self.agents.items():
+                agent.apply_route(routing.route(agent_type))
+        self.task_results = {}
+    
+    def task_fingerprint(self, task: Dict, context: Dict | None, results: Dict[str, Dict] | None = None) -> str:
+        results = self.task_results if results is None else results
+        assigned_agent = task.get("assigned_agent", "research")
+        agent = self.agents.get(assigned_agent)
+        dependencies = task.get("dependencies") or []
+        if isinstance(dependencies, str):
+            dependencies = [dependencies]
         
-        for phase in phases:
-            phase_name = phase.get("name", "Unknown Phase")
-            tasks = phase.get("tasks", [])
-            
-            if not tasks:
+        fingerprint = {
+            "task": {key: value for key, value in task.items() if key != "task_id"},
+            "context": self.context_builder.task_slice(task, context, include_siblings=False)
+            if isinstance(context, dict) else context,
+            "project": self.context_builder.project_slice(context) if isinstance(context, dict) else None,
+            "agent_type": assigned_agent,
+            "model": agent.model if agent else None,
+            "temperature": agent.temperature if agent else None,
+            "max_tokens": agent.max_tokens if agent else None,
+            "dependencies": {dep: content_hash((results.get(dep) or {}).get("result")) for dep in dependencies}
+        }
+        if agent and agent.fallback_models:
+            fingerprint["fallback_models"] = agent.fallback_models
+        return content_hash(fingerprint)
+    
+    def invalidated_tasks(self, plan: Dict, context: Dict | None, results: Dict[str, Dict]) -> Set[str]:
+        graph = TaskGraph(plan)
+        changed = set(results) - set(graph.tasks)
+        for task_id in graph.order:
+            result = results.get(task_id)
+            if not result:
                 continue
+            task = {**graph.tasks[task_id], "task_id": task_id}
+            if result.get("fingerprint") != self.task_fingerprint(task, context, results):
+                changed.add(task_id)
+        return changed | (graph.descendants(changed & set(graph.tasks)) & set(results))
+    
+    def _fingerprinted(self, task: Dict, context: Dict | None, result: Dict) -> Dict:
+        if result.get("status") == "completed":
+            result["fingerprint"] = self.task_fingerprint(task, context)
+            result["digest"] = self.digests.digest(result.get("task_id", task.get("task_id")), result)
+        return result
+    
+    def dependency_results(self, task: Dict, context: Dict | None) -> str:
+        dependencies = task.get("dependencies") or []
+        if isinstance(dependencies, str):
+            dependencies = [dependencies]
+        if not dependencies:
+            return ""
+        plan = context.get("plan") if isinstance(context, dict) else None
+        dependency_tasks = self.context_builder.find_tasks(plan, dependencies) if isinstance(plan, dict) else []
+        found = {dep["task_id"]: dep for dep in dependency_tasks}
+        entries = []
+        for dep in dependencies:
+            digest = self.digests.digest(dep, self.task_results.get(dep))
+            if digest:
+                info = found.get(dep, {})
+                entries.append((f"[{dep}] {info.get('name', dep)} ({info.get('assigned_agent', 'research')})", digest))
+        return self.digests.render_many(entries, self.dependency_tokens)
+    
+    def with_dependency_results(self, task: Dict, context: Dict | None) -> Dict:
+        dependency_results = self.dependency_results(task, context)
+        return {**task, "dependency_results": dependency_results} if dependency_results else task
+    
+    @staticmethod
+    def _similarity_source(task: Dict, context: Dict | None) -> str:
+        idea = context.get("idea") if isinstance(context, dict) else None
+        project_name = idea.get("project_name") if isinstance(idea, dict) else None
+        return content_hash([project_name, task.get("task_id")])[:16]
+    
+    def similar_result(self, task: Dict, context: Dict | None, record: bool = True) -> Dict | None:
+        if not self.similarity_index or task.get("task_id") in self.fresh_tasks:
+            return None
+        return self.similarity_index.lookup(task, context, self._similarity_source(task, context), record)
+    
+    @staticmethod
+    def _match_info(match: Dict) -> Dict:
+        return {"entry_id": match["entry_id"], "task_name": match["name"], "similarity": match["similarity"]}
+    
+    def reuse_result(self, task: Dict, context: Dict | None, match: Dict) -> Dict:
+        result = self._fingerprinted(task, context, {
+            "task_id": task.get("task_id", "unknown"),
+            "agent_type": task.get("assigned_agent", "research"),
+            "status": "completed",
+            "result": match["result"].get("result", ""),
+            "usage": {},
+            "reused_from": self._match_info(match)
+        })
+        self.task_results[result["task_id"]] = result
+        return result
+    
+    def _reuse_or_reference(self, task: Dict, context: Dict | None) -> Tuple[Dict | None, Dict, Dict | None]:
+        match = self.similar_result(task, context)
+        if match and match["mode"] == "reuse":
+            return self.reuse_result(task, context, match), task, match
+        agent_task = self.with_dependency_results(task, context)
+        if match:
+            return None, {**agent_task, "reference_result": match["result"].get("result", "")}, match
+        return None, agent_task, None
+    
+    def _indexed(self, task: Dict, context: Dict | None, result: Dict, match: Dict | None) -> Dict:
+        if result.get("status") != "completed":
+            return result
+        self.fresh_tasks.discard(task.get("task_id"))
+        if match and match["mode"] == "adapt":
+            result["adapted_from"] = self._match_info(match)
+        if self.similarity_index:
+            self.similarity_index.add(task, result, context, self._similarity_source(task, context))
+        return result
+    
+    def cost_estimator(self) -> CostEstimator:
+        estimator = CostEstimator(self.agents, self.llm_client.telemetry)
+        estimator.learn_results(self.task_results.values())
+        return estimator
+    
+    def estimate_plan(self, plan: Dict, context: Dict, workers: int | None = None) -> Dict:
+        graph = TaskGraph(plan)
+        skip = {}
+        for task_id in graph.order:
+            if (self.task_results.get(task_id) or {}).get("status") == "completed":
+                skip[task_id] = "completed"
+                continue
+            match = self.similar_result({**graph.tasks[task_id], "task_id": task_id}, context, record=False)
+            if match and match["mode"] == "reuse":
+                skip[task_id] = "reuse"
+        return self.cost_estimator().estimate(plan, context, skip, workers or self.max_workers)
+    
+    @staticmethod
+    def _budget_failure(task: Dict, budget: RunBudget) -> Dict:
+        spent = budget.summary()
+        return {
+            "task_id": task.get("task_id", "unknown"),
+            "agent_type": task.get("assigned_agent", "research"),
+            "status": "failed",
+            "result": f"⛔ Dừng vì vượt ngân sách lượt chạy (đã dùng {spent['spent_tokens']} tokens, "
+                      f"${spent['spent_cost']:.4f})",
+            "budget_exceeded": True
+        }
+    
+    def admit_task(self, task: Dict, context: Dict, budget: RunBudget | None,
+                   estimator: CostEstimator | None = None, wait: bool = False,
+                   cascade: bool = True) -> Tuple[str | None, Dict | None]:
+        if not budget or not budget.limited:
+            return None, None
+        match = self.similar_result(task, context, record=False)
+        if match and match["mode"] == "reuse":
+            return None, None
+        estimator = estimator or self.cost_estimator()
+        task_id = task.get("task_id", "unknown")
+        agent_task = self.with_dependency_results(task, context)
+        agent = self.agents.get(task.get("assigned_agent", "research"))
+        estimate = estimator.estimate_task(agent_task, context)
+        escalations = [estimator.estimate_task(agent_task, context, model)
+                       for model in (agent.fallback_models if agent and cascade else [])]
+        worst_case = {key: estimate[key] + sum(step[key] for step in escalations)
+                      for key in ("input_tokens", "output_tokens", "cost_usd")}
+        if budget.reserve(task_id, worst_case):
+            return None, None
+        if escalations and budget.reserve(task_id, estimate):
+            return agent.model, None
+        if budget.fallback_model and agent and budget.fallback_model != agent.model:
+            fallback_estimate = estimator.estimate_task(agent_task, context, budget.fallback_model)
+            if budget.reserve(task_id, fallback_estimate, downgraded=True):
+                return budget.fallback_model, None
+        if wait and budget.pending:
+            return None, {"task_id": task_id, "status": "deferred"}
+        budget.refuse(task_id)
+        return None, self._budget_failure(task, budget)
+    
+    def settle_task(self, budget: RunBudget | None, task: Dict, result: Dict, model: str | None = None):
+        if budget and budget.limited:
+            agent = self.agents.get(task.get("assigned_agent", "research"))
+            budget.settle(task.get("task_id", "unknown"), result, model or (agent.model if agent else ""))
+    
+    def forget(self, task_ids: Iterable[str]):
+        task_ids = list(task_ids)
+        for task_id in task_ids:
+            self.task_results.pop(task_id, None)
+        self.fresh_tasks.update(task_ids)
+        self.digests.forget(task_ids)
+    
+    def _start_execution(self, plan: Dict, context: Dict, progress_callback: Callable | None,
+                         run_id: str | None, result_callback: Callable[[str, Dict], None] | None = None) -> PlanExecution:
+        execution = PlanExecution(plan, progress_callback, result_callback)
+        if run_id and self.run_store:
+            completed = self.run_store.task_results(run_id, completed_only=True)
+            stale = self.invalidated_tasks(plan, context, completed)
+            if stale:
+                self.run_store.delete_task_results(run_id, stale)
+                self.forget(stale)
+            completed = {task_id: result for task_id, result in completed.items() if task_id not in stale}
+            self.task_results.update(completed)
+            execution.preload(completed)
+            self.run_store.update_run(run_id, plan=plan, status="completed" if execution.finished else "running")
+        return execution
+    
+    def _checkpoint(self, execution: PlanExecution, run_id: str | None, task_id: str, result: Dict):
+        execution.finish(task_id, result)
+        if run_id and self.run_store:
+            self.run_store.save_task_result(run_id, task_id, result)
+            if execution.finished:
+                self.run_store.update_run(run_id, status="failed" if execution.failed else "completed")
+    
+    def execute_plan(self, plan: Dict, context: Dict, progress_callback: Callable | None = None,
+                     max_workers: int | None = None, run_id: str | None = None,
+                     result_callback: Callable[[str, Dict], None] | None = None,
+                     budget: RunBudget | None = None) -> List[Dict]:
+        execution = self._start_execution(plan, context, progress_callback, run_id, result_callback)
+        workers = max(1, max_workers or self.max_workers)
+        estimator = self.cost_estimator() if budget and budget.limited else None
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            running: Dict[Future, Tuple[Dict, str | None]] = {}
+            backoff = DEFER_BACKOFF[0]
             
-            if progress_callback:
-                progress_callback(f"🔄 Bắt đầu phase: {phase_name}", completed_tasks / total_tasks)
-            
-            for task in tasks:
-                task_id = task.get("task_id", "unknown")
-                task_name = task.get("name", "Unknown Task")
-                assigned_agent = task.get("assigned_agent", "research")
+            while not execution.finished:
+                started = execution.start_ready(workers - len(running))
+                deferred = 0
+                for task in started:
+                    model, refused = self.admit_task(task, context, budget, estimator, wait=True)
+                    if refused and refused["status"] == "deferred":
+                        execution.defer(task["task_id"])
+                        deferred += 1
+                        continue
+                    if refused:
+                        self._checkpoint(execution, run_id, task["task_id"], refused)
+                        continue
+                    running[pool.submit(self.execute_single_task, task, context, None, model)] = (task, model)
                 
-                if progress_callback:
-                    progress_callback(f"⚙️ Đang thực hiện: {task_name} (Agent: {assigned_agent})", 
-                                    completed_tasks / total_tasks)
+                if not running:
+                    if not started:
+                        break
+                    if deferred == len(started):
+                        time.sleep(backoff)
+                        backoff = min(backoff * 2, DEFER_BACKOFF[1])
+                    continue
+                backoff = DEFER_BACKOFF[0]
                 
-                try:
-                    agent = self.agents.get(assigned_agent)
-                    if agent:
-                        result = agent.execute_task(task, context)
-                        self.task_results[task_id] = result
-                        all_results.append(result)
-                    else:
-                        all_results.append({
-                            "task_id": task_id,
-                            "agent_type": assigned_agent,
-                            "status": "failed",
-                            "result": f"Agent {assigned_agent} không tồn tại"
-                        })
-                except Exception as e:
-                    all_results.append({
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, model = running.pop(future)
+                    self.settle_task(budget, task, future.result(), model)
+                    self._checkpoint(execution, run_id, task["task_id"], future.result())
+        
+        return execution.results()
+    
+    async def aexecute_plan(self, plan: Dict, context: Dict, progress_callback: Callable | None = None,
+                            max_concurrency: int | None = None, run_id: str | None = None,
+                            result_callback: Callable[[str, Dict], None] | None = None,
+                            budget: RunBudget | None = None) -> List[Dict]:
+        execution = self._start_execution(plan, context, progress_callback, run_id, result_callback)
+        limit = max(1, max_concurrency or execution.total_tasks)
+        estimator = self.cost_estimator() if budget and budget.limited else None
+        running: Dict[asyncio.Task, Tuple[Dict, str | None]] = {}
+        backoff = DEFER_BACKOFF[0]
+        
+        try:
+            while not execution.finished:
+                started = execution.start_ready(limit - len(running))
+                deferred = 0
+                for task in started:
+                    model, refused = self.admit_task(task, context, budget, estimator, wait=True)
+                    if refused and refused["status"] == "deferred":
+                        execution.defer(task["task_id"])
+                        deferred += 1
+                        continue
+                    if refused:
+                        self._checkpoint(execution, run_id, task["task_id"], refused)
+                        continue
+                    future = asyncio.ensure_future(self.aexecute_single_task(task, context, None, model))
+                    running[future] = (task, model)
+                
+                if not running:
+                    if not started:
+                        break
+                    if deferred == len(started):
+                        await asyncio.sleep(backoff)
+                        backoff = min(backoff * 2, DEFER_BACKOFF[1])
+                    continue
+                backoff = DEFER_BACKOFF[0]
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    task, model = running.pop(future)
+                    self.settle_task(budget, task, future.result(), model)
+                    self._checkpoint(execution, run_id, task["task_id"], future.result())
+        finally:
+            for future in running:
+                future.cancel()
+        
+        return execution.results()
+    
+    def _batch_transport(self, provider: str) -> BatchTransport:
+        if provider == "openai":
+            return OpenAIBatchTransport(self.llm_client.openai_client)
+        return AnthropicBatchTransport(self.llm_client.anthropic_client)
+    
+    def execute_plan_batch(self, plan: Dict, context: Dict, transport: BatchTransport | None = None,
+                           poll_interval: float = 30.0, timeout: float | None = None,
+                           progress_callback: Callable | None = None, run_id: str | None = None,
+                           result_callback: Callable[[str, Dict], None] | None = None,
+                           budget: RunBudget | None = None) -> List[Dict]:
+        execution = self._start_execution(plan, context, progress_callback, run_id, result_callback)
+        graph = execution.graph
+        estimator = self.cost_estimator() if budget and budget.limited else None
+        order = {task_id: index for index, task_id in enumerate(graph.order)}
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        
+        while not execution.finished:
+            wave = execution.start_ready(execution.total_tasks)
+            if not wave:
+                break
+            
+            requests_by_provider: Dict[str, List[Dict]] = {}
+            pending: Dict[str, Dict] = {}
+            matches: Dict[str, Dict | None] = {}
+            models: Dict[str, str | None] = {}
+            for task in wave:
+                task_id = task["task_id"]
+                assigned_agent = task.get("assigned_agent", "research")
+                agent = self.agents.get(assigned_agent)
+                if not agent:
+                    self._checkpoint(execution, run_id, task_id, {
                         "task_id": task_id,
                         "agent_type": assigned_agent,
                         "status": "failed",
-                        "result": f"Lỗi khi thực hiện task: {str(e)}"
+                        "result": f"Agent {assigned_agent} không tồn tại"
                     })
+                    continue
+                reused, agent_task, match = self._reuse_or_reference(task, context)
+                if reused:
+                    self._checkpoint(execution, run_id, task_id, reused)
+                    continue
+                model, refused = self.admit_task(task, context, budget, estimator, cascade=False)
+                if refused:
+                    self._checkpoint(execution, run_id, task_id, refused)
+                    continue
+                custom_id = f"task-{order[task_id]}"
+                request = {"custom_id": custom_id, **agent.build_request(agent_task, context, model)}
+                provider = "batch" if transport else LLMClient.provider_name(model or agent.model)
+                requests_by_provider.setdefault(provider, []).append(request)
+                pending[custom_id] = task
+                matches[custom_id] = match
+                models[custom_id] = model
+            
+            self._run_batches(execution, context, run_id, budget, transport, requests_by_provider, pending, matches,
+                              models, poll_interval, deadline)
+        
+        return execution.results()
+    
+    def _run_batches(self, execution: PlanExecution, context: Dict, run_id: str | None, budget: RunBudget | None,
+                     transport: BatchTransport | None, requests_by_provider: Dict[str, List[Dict]],
+                     pending: Dict[str, Dict], matches: Dict[str, Dict | None], models: Dict[str, str | None],
+                     poll_interval: float, deadline: float | None):
+        batches = {}
+        batch_of: Dict[str, str] = {}
+        for provider, requests in requests_by_provider.items():
+            batch_transport = transport or self._batch_transport(provider)
+            batch_id = batch_transport.submit(requests)
+            batches[batch_id] = batch_transport
+            batch_of.update({request["custom_id"]: batch_id for request in requests})
+            execution.report(f"📦 Đã gửi batch {batch_id} ({len(requests)} tasks)")
+        
+        while batches:
+            for batch_id, batch_transport in list(batches.items()):
+                status = batch_transport.poll(batch_id)
+                if status == "in_progress":
+                    continue
                 
-                completed_tasks += 1
-                if progress_callback:
-                    progress_callback(f"✅ Hoàn thành: {task_name}", completed_tasks / total_tasks)
+                results = batch_transport.results(batch_id) if status == "completed" else {}
+                for custom_id in [custom_id for custom_id in pending if batch_of[custom_id] == batch_id
+                                  and (custom_id in results or status != "completed")]:
+                    task = pending[custom_id]
+                    entry = results.get(custom_id)
+                    if entry and "error" not in entry:
+                        agent = self.agents[task.get("assigned_agent", "research")]
+                        result = self._fingerprinted(task, context, self._indexed(
+                            task, context, agent.build_result(task, entry), matches.get(custom_id)
+                        ))
+                        self.task_results[task["task_id"]] = result
+                    else:
+                        result = {
+                            "task_id": task["task_id"],
+                            "agent_type": task.get("assigned_agent", "research"),
+                            "status": "failed",
+                            "result": f"Lỗi khi thực hiện task trong batch {batch_id}: "
+                                      f"{entry.get('error') if entry else status}"
+                        }
+                    self.settle_task(budget, task, result, models.get(custom_id))
+                    self._checkpoint(execution, run_id, task["task_id"], result)
+                    pending.pop(custom_id)
+                del batches[batch_id]
+            
+            if not batches:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise ValueError(f"Hết thời gian chờ batch: {', '.join(batches)}")
+            time.sleep(poll_interval)
         
-        return all_results
+        for custom_id, task in pending.items():
+            self._checkpoint(execution, run_id, task["task_id"], {
+                "task_id": task["task_id"],
+                "agent_type": task.get("assigned_agent", "research"),
+                "status": "failed",
+                "result": "Batch không trả về kết quả cho task này"
+            })
     
-    def execute_single_task(self, task: Dict, context: Dict) -> Dict:
+    def execute_single_task(self, task: Dict, context: Dict,
+                            on_token: Callable[[str], None] | None = None, model: str | None = None) -> Dict:
         task_id = task.get("task_id", "unknown")
         task_name = task.get("name", "Unknown Task")
         assigned_agent = task.get("assigned_agent", "research")
@@ -88,7 +563,12 @@ class TaskOrchestrator:
         try:
             agent = self.agents.get(assigned_agent)
             if agent:
-                result = agent.execute_task(task, context)
+                result, agent_task, match = self._reuse_or_reference(task, context)
+                if result is None:
+                    result = self._indexed(
+                        task, context, agent.execute_task(agent_task, context, on_token=on_token, model=model), match
+                    )
+                result = self._fingerprinted(task, context, result)
                 self.task_results[task_id] = result
                 return result
             else:
@@ -106,30 +586,105 @@ class TaskOrchestrator:
                 "result": f"Lỗi khi thực hiện task: {str(e)}"
             }
     
-    def generate_final_report(self, idea: Dict, plan: Dict, results: List[Dict]) -> str:
+    async def aexecute_single_task(self, task: Dict, context: Dict,
+                                   on_token: Callable[[str], None] | None = None,
+                                   model: str | None = None) -> Dict:
+        task_id = task.get("task_id", "unknown")
+        task_name = task.get("name", "Unknown Task")
+        assigned_agent = task.get("assigned_agent", "research")
+        
+        try:
+            agent = self.agents.get(assigned_agent)
+            if agent:
+                result, agent_task, match = self._reuse_or_reference(task, context)
+                if result is None:
+                    result = self._indexed(
+                        task, context,
+                        await agent.aexecute_task(agent_task, context, on_token=on_token, model=model), match
+                    )
+                result = self._fingerprinted(task, context, result)
+                self.task_results[task_id] = result
+                return result
+            else:
+                return {
+                    "task_id": task_id,
+                    "agent_type": assigned_agent,
+                    "status": "failed",
+                    "result": f"Agent {assigned_agent} không tồn tại"
+                }
+        except Exception as e:
+            return {
+                "task_id": task_id,
+                "agent_type": assigned_agent,
+                "status": "failed",
+                "result": f"Lỗi khi thực hiện task: {str(e)}"
+            }
+    
+    def _report_builder(self, idea: Dict, plan: Dict, results: List[Dict]) -> ReportBuilder:
         doc_agent = self.agents["documentation"]
+        return ReportBuilder(idea, plan, results, doc_agent.system_prompts["documentation"], self.context_builder,
+                             doc_agent.model, self.report_summaries, self.digests)
+    
+    def _report_call(self, job: Dict) -> str:
+        with call_context(agent_type="report", task_id=job["key"]):
+            return self.llm_client.chat_with_usage(job["messages"], model=self.agents["documentation"].model,
+                                                   temperature=0.3, max_tokens=job["max_tokens"])["content"]
+    
+    async def _areport_call(self, job: Dict) -> str:
+        with call_context(agent_type="report", task_id=job["key"]):
+            response = await self.llm_client.achat_with_usage(job["messages"], model=self.agents["documentation"].model,
+                                                              temperature=0.3, max_tokens=job["max_tokens"])
+        return response["content"]
+    
+    @staticmethod
+    def _report_outputs(jobs: List[Dict], outputs: List) -> Dict[str, str]:
+        collected = {}
+        for job, output in zip(jobs, outputs):
+            if isinstance(output, Exception):
+                if job["key"].startswith("task:"):
+                    continue
+                raise output
+            collected[job["key"]] = output
+        return collected
+    
+    def _report_progress(self, builder: ReportBuilder, jobs: List[Dict], progress_callback: Callable | None):
+        if progress_callback:
+            labels = {"tasks": "Tóm tắt kết quả task", "phases": "Tổng hợp theo phase", "final": "Viết báo cáo tổng kết"}
+            progress_callback(f"📝 {labels[builder.stage]} ({len(jobs)} lượt gọi)", 0.0)
+    
+    def generate_final_report(self, idea: Dict, plan: Dict, results: List[Dict],
+                              progress_callback: Callable | None = None) -> str:
+        builder = self._report_builder(idea, plan, results)
+        with ThreadPoolExecutor(max_workers=self.report_concurrency) as pool:
+            while True:
+                jobs = builder.next_jobs()
+                if not jobs:
+                    break
+                self._report_progress(builder, jobs, progress_callback)
+                futures = [pool.submit(self._report_call, job) for job in jobs]
+                outputs = []
+                for future in futures:
+                    try:
+                        outputs.append(future.result())
+                    except Exception as e:
+                        outputs.append(e)
+                builder.feed(self._report_outputs(jobs, outputs))
+        return builder.report or "Không thể tạo báo cáo"
+    
+    async def agenerate_final_report(self, idea: Dict, plan: Dict, results: List[Dict],
+                                     progress_callback: Callable | None = None) -> str:
+        builder = self._report_builder(idea, plan, results)
+        semaphore = asyncio.Semaphore(self.report_concurrency)
         
-        report_task = {
-            "task_id": "final_report",
-            "name": "Tạo báo cáo tổng kết dự án",
-            "description": f"""Tạo một báo cáo chi tiết về dự án với các thông tin sau:
-            
-Ý TƯỞNG DỰ ÁN:
-{idea}
-
-KẾ HOẠCH:
-{plan}
-
-KẾT QUẢ THỰC HIỆN:
-{len(results)} tasks đã hoàn thành
-
-Hãy tạo một báo cáo toàn diện với các phần:
-1. Tóm tắt Executive Summary
-2. Tổng quan dự án
-3. Kết quả chi tiết từng phase
-4. Kết luận và đề xuất bước tiếp theo
-"""
-        }
+        async def bounded(job: Dict) -> str:
+            async with semaphore:
+                return await self._areport_call(job)
         
-        report_result = doc_agent.execute_task(report_task, {"idea": idea, "plan": plan, "results": results})
-        return report_result.get("result", "Không thể tạo báo cáo")
+        while True:
+            jobs = builder.next_jobs()
+            if not jobs:
+                break
+            self._report_progress(builder, jobs, progress_callback)
+            outputs = await asyncio.gather(*(bounded(job) for job in jobs), return_exceptions=True)
+            builder.feed(self._report_outputs(jobs, outputs))
+        return builder.report or "Không thể tạo báo cáo"
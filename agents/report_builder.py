@@ -0,0 +1,221 @@
+from typing import Dict, List
+
+from utils.context_builder import ContextBuilder, count_tokens
+from utils.digest_store import DigestStore
+from utils.task_graph import TaskGraph, content_hash
+
+SUMMARY_PROMPT = """Tóm tắt kết quả của task "{name}" (agent: {agent}) trong tối đa khoảng {words} từ.
+Giữ lại: việc đã làm, quyết định chính, sản phẩm đầu ra cụ thể (file, API, module, số liệu) và vấn đề còn tồn tại.
+Không thêm lời dẫn.
+
+KẾT QUẢ:
+{content}"""
+
+PHASE_PROMPT = """Tổng hợp kết quả của phase "{name}" từ bản tóm tắt các task dưới đây trong tối đa khoảng {words} từ.
+Nêu rõ những gì đã hoàn thành, sản phẩm chính, các task thất bại và rủi ro còn lại.
+
+{content}"""
+
+FINAL_PROMPT = """Tạo báo cáo tổng kết dự án dựa trên kết quả thực tế dưới đây.
+
+THỐNG KÊ: {completed}/{total} tasks hoàn thành, {failed} tasks thất bại.{failed_names}
+
+KẾT QUẢ THEO PHASE:
+{content}
+
+Báo cáo gồm các phần:
+1. Tóm tắt Executive Summary
+2. Tổng quan dự án
+3. Kết quả chi tiết từng phase
+4. Kết luận và đề xuất bước tiếp theo"""
+
+
+class ReportBuilder:
+    def __init__(self, idea: Dict, plan: Dict, results: List[Dict], system_prompt: str,
+                 context_builder: ContextBuilder, model: str, summaries: Dict[str, str] | None = None,
+                 digests: DigestStore | None = None,
+                 task_input_tokens: int = 3000, task_summary_tokens: int = 250, group_input_tokens: int = 6000,
+                 phase_summary_tokens: int = 600, report_tokens: int = 4000, min_digest_tokens: int = 100):
+        self.model = model
+        self.task_input_tokens = task_input_tokens
+        self.task_summary_tokens = task_summary_tokens
+        self.group_input_tokens = group_input_tokens
+        self.phase_summary_tokens = phase_summary_tokens
+        self.report_tokens = report_tokens
+        self.min_digest_tokens = min_digest_tokens
+        self.summaries = summaries if summaries is not None else {}
+        self.digests = digests
+        self.report: str | None = None
+        self.calls = 0
+
+        shared = context_builder.build_shared({"idea": idea}, model)
+        self.system_prompt = f"{system_prompt}\n\nNGỮ CẢNH DỰ ÁN:\n{shared}" if shared else system_prompt
+
+        graph = TaskGraph(plan)
+        results_by_id = {result.get("task_id"): result for result in results}
+        self.phases = [
+            {"name": phase.get("name", f"Phase {phase_idx + 1}"), "task_ids": [], "items": [], "round": 0}
+            for phase_idx, phase in enumerate(plan.get("phases", []))
+        ]
+        self.tasks = {}
+        for task_id in graph.order:
+            self.phases[graph.phase_of[task_id]]["task_ids"].append(task_id)
+            self.tasks[task_id] = {"task": graph.tasks[task_id], "result": results_by_id.get(task_id)}
+        self.phases = [phase for phase in self.phases if phase["task_ids"]]
+
+        self.total = len(graph.order)
+        self.completed = sum(1 for entry in self.tasks.values()
+                             if (entry["result"] or {}).get("status") == "completed")
+        self.failed = [entry["task"].get("name", task_id) for task_id, entry in self.tasks.items()
+                       if (entry["result"] or {}).get("status") == "failed"]
+        self.stage = "tasks"
+        self.final_items: List[str] = []
+        self.final_round = 0
+
+    @property
+    def done(self) -> bool:
+        return self.stage == "done"
+
+    def _tokens(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def _clip(self, text: str, budget: int) -> str:
+        if self._tokens(text) <= budget:
+            return text
+        return text[:max(1, int(len(text) * budget / self._tokens(text) * 0.95))].rstrip() + "…"
+
+    def _job(self, key: str, prompt: str, max_tokens: int) -> Dict:
+        return {
+            "key": key,
+            "messages": [
+                {"role": "system", "content": self.system_prompt, "cache": True},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens
+        }
+
+    def _pack(self, items: List[str]) -> List[List[str]]:
+        groups, current, used = [], [], 0
+        for item in items:
+            size = self._tokens(item)
+            if current and used + size > self.group_input_tokens:
+                groups.append(current)
+                current, used = [], 0
+            current.append(item)
+            used += size
+        if current:
+            groups.append(current)
+        return groups
+
+    def _task_line(self, task_id: str, text: str) -> str:
+        task = self.tasks[task_id]["task"]
+        return f"- [{task_id}] {task.get('name', task_id)} ({task.get('assigned_agent', 'research')}): {text}"
+
+    def _digest(self, task_id: str) -> str:
+        if not self.digests:
+            return ""
+        result = self.tasks[task_id]["result"]
+        digest = self.digests.digest(task_id, result)
+        if not digest or self._tokens(str(result.get("result"))) <= self.task_summary_tokens * 1.5:
+            return ""
+        rendered = self.digests.render(digest, int(self.task_summary_tokens * 1.5), include_code=False)
+        return rendered if self._tokens(rendered) >= self.min_digest_tokens else ""
+
+    def _task_jobs(self) -> List[Dict]:
+        jobs = []
+        for task_id, entry in self.tasks.items():
+            result = entry["result"] or {}
+            if result.get("status") != "completed":
+                continue
+            content = str(result.get("result") or "")
+            if self._tokens(content) <= self.task_summary_tokens * 1.5 or content_hash(content) in self.summaries:
+                continue
+            if self._digest(task_id):
+                continue
+            prompt = SUMMARY_PROMPT.format(
+                name=entry["task"].get("name", task_id), agent=result.get("agent_type", "research"),
+                words=int(self.task_summary_tokens * 0.6), content=self._clip(content, self.task_input_tokens)
+            )
+            jobs.append(self._job(f"task:{task_id}", prompt, self.task_summary_tokens))
+        return jobs
+
+    def _task_summary(self, task_id: str) -> str:
+        result = self.tasks[task_id]["result"] or {}
+        if result.get("status") == "failed":
+            return self._task_line(task_id, f"❌ Thất bại: {self._clip(str(result.get('result') or ''), 100)}")
+        if result.get("status") != "completed":
+            return self._task_line(task_id, "⏳ Chưa thực hiện")
+        content = str(result.get("result") or "")
+        summary = (self.summaries.get(content_hash(content)) or self._digest(task_id)
+                   or self._clip(content, int(self.task_summary_tokens * 1.5)))
+        return self._task_line(task_id, summary.strip())
+
+    def _group_jobs(self, prefix: str, name: str, items: List[str], round_idx: int) -> List[Dict]:
+        return [
+            self._job(
+                f"{prefix}:{round_idx}:{group_idx}",
+                PHASE_PROMPT.format(name=name, words=int(self.phase_summary_tokens * 0.6), content="\n".join(group)),
+                self.phase_summary_tokens
+            )
+            for group_idx, group in enumerate(self._pack(items))
+        ]
+
+    def _phase_jobs(self) -> List[Dict]:
+        jobs = []
+        for phase_idx, phase in enumerate(self.phases):
+            if phase["round"] and len(phase["items"]) == 1:
+                continue
+            jobs.extend(self._group_jobs(f"phase:{phase_idx}", phase["name"], phase["items"], phase["round"]))
+        return jobs
+
+    def _final_jobs(self) -> List[Dict]:
+        if sum(self._tokens(item) for item in self.final_items) > self.group_input_tokens:
+            return self._group_jobs("final", "Toàn dự án", self.final_items, self.final_round)
+        failed_names = f"\nTasks thất bại: {', '.join(self.failed[:20])}" if self.failed else ""
+        prompt = FINAL_PROMPT.format(completed=self.completed, total=self.total, failed=len(self.failed),
+                                     failed_names=failed_names, content="\n\n".join(self.final_items))
+        return [self._job("report", prompt, self.report_tokens)]
+
+    def next_jobs(self) -> List[Dict]:
+        while not self.done:
+            if self.stage == "tasks":
+                jobs = self._task_jobs()
+            elif self.stage == "phases":
+                jobs = self._phase_jobs()
+            else:
+                jobs = self._final_jobs()
+            if jobs:
+                self.calls += len(jobs)
+                return jobs
+            self._advance()
+        return []
+
+    def _advance(self):
+        if self.stage == "tasks":
+            for phase in self.phases:
+                phase["items"] = [self._task_summary(task_id) for task_id in phase["task_ids"]]
+            self.stage = "phases"
+        elif self.stage == "phases":
+            self.final_items = [f"### {phase['name']}\n{phase['items'][0]}" for phase in self.phases]
+            self.stage = "final"
+
+    def feed(self, outputs: Dict[str, str]):
+        if self.stage == "tasks":
+            for key, text in outputs.items():
+                content = str(self.tasks[key.split(":", 1)[1]]["result"].get("result") or "")
+                self.summaries[content_hash(content)] = text
+            self._advance()
+        elif self.stage == "phases":
+            for phase_idx, phase in enumerate(self.phases):
+                keys = sorted((key for key in outputs if key.startswith(f"phase:{phase_idx}:")),
+                              key=lambda key: int(key.rsplit(":", 1)[1]))
+                if keys:
+                    phase["items"] = [outputs[key] for key in keys]
+                    phase["round"] += 1
+        elif "report" in outputs:
+            self.report = outputs["report"]
+            self.stage = "done"
+        else:
+            keys = sorted(outputs, key=lambda key: int(key.rsplit(":", 1)[1]))
+            self.final_items = [outputs[key] for key in keys]
+            self.final_round += 1
@@ -0,0 +1,74 @@
+import re
+from typing import Dict, List
+
+AGENT_TYPES = ("ideation", "design", "coding", "testing", "research", "documentation")
+DEFAULT_MAX_TOKENS = 3000
+DEFAULT_TEMPERATURE = 0.7
+CODE_BLOCK = re.compile(r"```[\w+-]*\n.*?```", re.DOTALL)
+
+CHEAP_FIRST = {
+    "ideation": {"escalate": False, "temperature": 0.9},
+    "design": {"escalate": True},
+    "coding": {"escalate": True, "max_tokens": 4000, "temperature": 0.2, "checks": ["code_block"]},
+    "testing": {"escalate": True, "temperature": 0.3},
+    "research": {"escalate": False, "temperature": 0.5},
+    "documentation": {"escalate": False, "temperature": 0.5}
+}
+DEFAULT_CHECKS = ["non_empty", "not_truncated"]
+
+
+def validation_failure(agent_type: str, response: Dict, route: Dict) -> str | None:
+    content = (response.get("content") or "").strip()
+    usage = response.get("usage") or {}
+    checks = route.get("checks", DEFAULT_CHECKS)
+
+    if "non_empty" in checks and len(content) < route.get("min_chars", 1):
+        return "kết quả rỗng hoặc quá ngắn"
+    if "not_truncated" in checks and usage.get("output_tokens", 0) >= route.get("max_tokens", DEFAULT_MAX_TOKENS):
+        return "kết quả bị cắt do chạm max_tokens"
+    if "code_block" in checks and not CODE_BLOCK.search(content):
+        return "không có code block"
+    return None
+
+
+class RoutingPolicy:
+    def __init__(self, routes: Dict[str, Dict] | None = None, default_model: str = "gpt-4o-mini"):
+        self.default_model = default_model
+        self.routes = {agent_type: dict(route) for agent_type, route in (routes or {}).items()}
+
+    @classmethod
+    def cheap_first(cls, cheap_model: str, strong_model: str,
+                    overrides: Dict[str, Dict] | None = None) -> "RoutingPolicy":
+        routes = {}
+        for agent_type, preset in CHEAP_FIRST.items():
+            route = {key: value for key, value in preset.items() if key != "escalate"}
+            route["model"] = cheap_model
+            if preset["escalate"] and strong_model != cheap_model:
+                route["fallback_models"] = [strong_model]
+            route["checks"] = DEFAULT_CHECKS + preset.get("checks", [])
+            routes[agent_type] = {**route, **(overrides or {}).get(agent_type, {})}
+        return cls(routes, cheap_model)
+
+    def route(self, agent_type: str) -> Dict:
+        route = self.routes.get(agent_type, {})
+        max_tokens = int(route.get("max_tokens") or DEFAULT_MAX_TOKENS)
+        return {
+            "model": route.get("model") or self.default_model,
+            "fallback_models": [model for model in route.get("fallback_models") or [] if model],
+            "max_tokens": max_tokens,
+            "temperature": float(route.get("temperature", DEFAULT_TEMPERATURE)),
+            "checks": list(route.get("checks", DEFAULT_CHECKS)),
+            "min_chars": int(route.get("min_chars", 1))
+        }
+
+    def models(self) -> List[str]:
+        models = []
+        for agent_type in AGENT_TYPES:
+            route = self.route(agent_type)
+            for model in [route["model"], *route["fallback_models"]]:
+                if model not in models:
+                    models.append(model)
+        return models
+
+    def to_dict(self) -> Dict[str, Dict]:
+        return {agent_type: self.route(agent_type) for agent_type in AGENT_TYPES}
@@ -0,0 +1,92 @@
+IDEA_SCHEMA = {
+    "title": "project_idea",
+    "type": "object",
+    "properties": {
+        "project_name": {"type": "string"},
+        "overview": {"type": "string"},
+        "key_features": {"type": "array", "items": {"type": "string"}},
+        "target_users": {"type": "string"},
+        "value_proposition": {"type": "string"},
+        "tech_stack_suggestions": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["project_name", "overview", "key_features"]
+}
+
+TASK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "task_id": {"type": "string"},
+        "name": {"type": "string"},
+        "description": {"type": "string"},
+        "assigned_agent": {"type": "string"},
+        "estimated_duration": {"type": "string"},
+        "dependencies": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["name"]
+}
+
+PLAN_SCHEMA = {
+    "title": "project_plan",
+    "type": "object",
+    "properties": {
+        "phases": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                    "tasks": {"type": "array", "items": TASK_SCHEMA}
+                },
+                "required": ["name", "tasks"]
+            }
+        },
+        "timeline": {"type": "string"},
+        "resources_needed": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["phases"]
+}
+
+SKELETON_SCHEMA = {
+    "title": "plan_skeleton",
+    "type": "object",
+    "properties": {
+        "phases": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                    "tasks": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "task_id": {"type": "string"},
+                                "name": {"type": "string"},
+                                "assigned_agent": {"type": "string"},
+                                "dependencies": {"type": "array", "items": {"type": "string"}}
+                            },
+                            "required": ["name"]
+                        }
+                    }
+                },
+                "required": ["name", "tasks"]
+            }
+        },
+        "timeline": {"type": "string"},
+        "resources_needed": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["phases"]
+}
+
+PHASE_DETAIL_SCHEMA = {
+    "title": "phase_detail",
+    "type": "object",
+    "properties": {
+        "tasks": {"type": "array", "items": TASK_SCHEMA}
+    },
+    "required": ["tasks"]
+}
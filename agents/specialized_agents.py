@@ -1,11 +1,23 @@
-from typing import Dict, List
+from typing import Callable, Dict, List
+from agents.routing import validation_failure
+from utils.context_builder import ContextBuilder
 from utils.llm_client import LLMClient
+from utils.telemetry import call_context
+
+REFERENCE_MAX_CHARS = 6000
 
 class SpecializedAgent:
-    def __init__(self, llm_client: LLMClient, agent_type: str, model: str = "gpt-4o-mini"):
+    def __init__(self, llm_client: LLMClient, agent_type: str, model: str = "gpt-4o-mini",
+                 context_builder: ContextBuilder | None = None):
         self.llm_client = llm_client
         self.agent_type = agent_type
         self.model = model
+        self.temperature = 0.7
+        self.max_tokens = 3000
+        self.fallback_models: List[str] = []
+        self.checks: List[str] = []
+        self.min_chars = 1
+        self.context_builder = context_builder or ContextBuilder(model=model)
         self.system_prompts = {
             "ideation": "Bạn là chuyên gia sáng tạo ý tưởng. Nhiệm vụ của bạn là phát triển và mở rộng ý tưởng sản phẩm.",
             "design": "Bạn là UI/UX designer chuyên nghiệp. Nhiệm vụ của bạn là thiết kế giao diện và trải nghiệm người dùng.",
@@ -15,12 +27,31 @@ class SpecializedAgent:
             "documentation": "Bạn là technical writer. Nhiệm vụ của bạn là viết tài liệu kỹ thuật rõ ràng và dễ hiểu."
         }
     
-    def execute_task(self, task: Dict, context: Dict | None = None) -> Dict:
+    def build_messages(self, task: Dict, context: Dict | None = None, model: str | None = None) -> List[Dict]:
         system_prompt = self.system_prompts.get(self.agent_type, "Bạn là AI assistant chuyên nghiệp.")
+        model = model or self.model
+        
+        shared_context = self.context_builder.build_shared(context, model) if isinstance(context, dict) else ""
+        if shared_context:
+            system_prompt = f"{system_prompt}\n\nNGỮ CẢNH DỰ ÁN:\n{shared_context}"
         
         context_str = ""
         if context:
-            context_str = f"\n\nNGỮ CẢNH DỰ ÁN:\n{context}"
+            task_context = self.context_builder.build(task, context, model, include_project=not shared_context)
+            if task_context:
+                context_str = f"\n\nNGỮ CẢNH TASK:\n{task_context}"
+        
+        if task.get('dependency_results'):
+            context_str += (
+                "\n\nKẾT QUẢ CỦA CÁC TASK PHỤ THUỘC (bản tóm tắt; hãy dựa trên và nhất quán với các kết quả này):\n"
+                f"{task['dependency_results']}"
+            )
+        
+        if task.get('reference_result'):
+            context_str += (
+                "\n\nKẾT QUẢ THAM KHẢO (từ một task tương tự đã thực hiện trước đó, hãy điều chỉnh cho phù hợp "
+                f"với nhiệm vụ này thay vì làm lại từ đầu):\n{str(task['reference_result'])[:REFERENCE_MAX_CHARS]}"
+            )
         
         prompt = f"""NHIỆM VỤ:
 Tên: {task.get('name', 'Không có tên')}
@@ -29,46 +60,131 @@ Mô tả: {task.get('description', 'Không có mô tả')}
 
 Hãy thực hiện nhiệm vụ này một cách chi tiết và chuyên nghiệp. Trả về kết quả đầy đủ."""
         
-        messages = [
-            {"role": "system", "content": system_prompt},
+        return [
+            {"role": "system", "content": system_prompt, "cache": True},
             {"role": "user", "content": prompt}
         ]
-        
-        result = self.llm_client.chat(messages, model=self.model, max_tokens=3000)
-        
+    
+    def apply_route(self, route: Dict):
+        self.model = route["model"]
+        self.fallback_models = [model for model in route.get("fallback_models", []) if model != self.model]
+        self.max_tokens = route.get("max_tokens", self.max_tokens)
+        self.temperature = route.get("temperature", self.temperature)
+        self.checks = route.get("checks", [])
+        self.min_chars = route.get("min_chars", 1)
+    
+    def build_request(self, task: Dict, context: Dict | None = None, model: str | None = None) -> Dict:
         return {
+            "model": model or self.model,
+            "messages": self.build_messages(task, context, model),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+    
+    def build_result(self, task: Dict, response: Dict) -> Dict:
+        result = {
             "task_id": task.get("task_id", "unknown"),
             "agent_type": self.agent_type,
             "status": "completed",
-            "result": result
+            "result": response["content"],
+            "usage": response.get("usage", {})
         }
+        if response.get("model"):
+            result["model"] = response["model"]
+        if response.get("escalations"):
+            result["escalations"] = response["escalations"]
+        if response.get("validation_error"):
+            result["validation_error"] = response["validation_error"]
+        return result
+    
+    def _validation_failure(self, response: Dict) -> str | None:
+        if not self.fallback_models and not self.checks:
+            return None
+        route = {"checks": self.checks, "max_tokens": self.max_tokens, "min_chars": self.min_chars}
+        return validation_failure(self.agent_type, response, route)
+    
+    @staticmethod
+    def _add_usage(total: Dict, response: Dict):
+        usage = response.get("usage") or {}
+        if usage.get("local_cache_hit"):
+            return
+        for key, value in usage.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    
+    def _escalate(self, response: Dict, model: str, reason: str, escalations: List[Dict], usage: Dict,
+                  on_token: Callable[[str], None] | None):
+        escalations.append({"model": model, "reason": reason})
+        self._add_usage(usage, response)
+        if on_token:
+            on_token(f"\n\n---\n⤴️ {model}: {reason}. Chuyển sang model mạnh hơn...\n\n")
+    
+    def _cascade_result(self, response: Dict, model: str, reason: str | None, escalations: List[Dict],
+                        usage: Dict) -> Dict:
+        if reason:
+            response = {**response, "validation_error": reason}
+        if not escalations:
+            return {**response, "model": model} if self.fallback_models or model != self.model else response
+        total = dict(usage)
+        self._add_usage(total, response)
+        return {**response, "usage": total, "model": model, "escalations": escalations}
+    
+    def execute_task(self, task: Dict, context: Dict | None = None,
+                     on_token: Callable[[str], None] | None = None, model: str | None = None) -> Dict:
+        models = [model] if model else [self.model, *self.fallback_models]
+        escalations: List[Dict] = []
+        usage: Dict = {}
+        with call_context(agent_type=self.agent_type, task_id=task.get("task_id")):
+            for attempt, model in enumerate(models):
+                response = self.llm_client.chat_with_usage(**self.build_request(task, context, model),
+                                                           on_token=on_token)
+                reason = self._validation_failure(response)
+                if reason is None or attempt == len(models) - 1:
+                    break
+                self._escalate(response, model, reason, escalations, usage, on_token)
+        return self.build_result(task, self._cascade_result(response, model, reason, escalations, usage))
+    
+    async def aexecute_task(self, task: Dict, context: Dict | None = None,
+                            on_token: Callable[[str], None] | None = None, model: str | None = None) -> Dict:
+        models = [model] if model else [self.model, *self.fallback_models]
+        escalations: List[Dict] = []
+        usage: Dict = {}
+        with call_context(agent_type=self.agent_type, task_id=task.get("task_id")):
+            for attempt, model in enumerate(models):
+                response = await self.llm_client.achat_with_usage(**self.build_request(task, context, model),
+                                                                  on_token=on_token)
+                reason = self._validation_failure(response)
+                if reason is None or attempt == len(models) - 1:
+                    break
+                self._escalate(response, model, reason, escalations, usage, on_token)
+        return self.build_result(task, self._cascade_result(response, model, reason, escalations, usage))
 
 
 class IdeationAgent(SpecializedAgent):
-    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini"):
-        super().__init__(llm_client, "ideation", model)
+    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini", context_builder: ContextBuilder | None = None):
+        super().__init__(llm_client, "ideation", model, context_builder)
 
 
 class DesignAgent(SpecializedAgent):
-    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini"):
-        super().__init__(llm_client, "design", model)
+    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini", context_builder: ContextBuilder | None = None):
+        super().__init__(llm_client, "design", model, context_builder)
 
 
 class CodingAgent(SpecializedAgent):
-    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini"):
-        super().__init__(llm_client, "coding", model)
+    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini", context_builder: ContextBuilder | None = None):
+        super().__init__(llm_client, "coding", model, context_builder)
 
 
 class TestingAgent(SpecializedAgent):
-    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini"):
-        super().__init__(llm_client, "testing", model)
+    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini", context_builder: ContextBuilder | None = None):
+        super().__init__(llm_client, "testing", model, context_builder)
 
 
 class ResearchAgent(SpecializedAgent):
-    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini"):
-        super().__init__(llm_client, "research", model)
+    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini", context_builder: ContextBuilder | None = None):
+        super().__init__(llm_client, "research", model, context_builder)
 
 
 class DocumentationAgent(SpecializedAgent):
-    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini"):
-        super().__init__(llm_client, "documentation", model)
+    def __init__(self, llm_client: LLMClient, model: str = "gpt-4o-mini", context_builder: ContextBuilder | None = None):
+        super().__init__(llm_client, "documentation", model, context_builder)
@@ -0,0 +1,396 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from agents.master_agent import MasterAgent
+from agents.orchestrator import PlanExecution, TaskOrchestrator
+from utils.context_builder import count_tokens
+from utils.fake_llm import FakeLLMClient, fixed, lognormal, synthetic_plan
+from utils.hedging import HedgePolicy
+from utils.quota_scheduler import QuotaScheduler
+from utils.task_graph import TaskGraph
+from utils.telemetry import Telemetry, call_context
+
+SUITES = ("scheduler", "throughput", "prompt", "planning", "tail", "fairness", "e2e")
+HIGHER_IS_BETTER = ("tasks_per_second", "efficiency")
+LOWER_IS_BETTER = ("wall_seconds", "overhead_ms_per_task", "graph_ms_per_task", "prompt_tokens_p95",
+                   "prompt_tokens_max", "report_prompt_tokens", "plan_seconds", "hedged_p99_seconds",
+                   "interactive_wait_p95_seconds")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def critical_path(plan: Dict) -> int:
+    graph = TaskGraph(plan)
+    depth: Dict[str, int] = {}
+    for task_id in graph.order:
+        depth[task_id] = 1 + max((depth.get(dep, 0) for dep in graph.dependencies[task_id]), default=0)
+    return max(depth.values(), default=0)
+
+
+def context_for(idea: Dict, plan: Dict) -> Dict:
+    return {"idea": idea, "plan": plan}
+
+
+def bench_graph(plan: Dict) -> float:
+    started_at = time.perf_counter()
+    execution = PlanExecution(plan)
+    while not execution.finished:
+        for task in execution.start_ready(execution.total_tasks):
+            execution.finish(task["task_id"], {"task_id": task["task_id"], "status": "completed"})
+    return time.perf_counter() - started_at
+
+
+def bench_scheduler(size: int, workers: int, seed: int) -> Dict:
+    plan = synthetic_plan(size, seed=seed)
+    llm_client = FakeLLMClient(plan=plan, seed=seed)
+    idea = llm_client.idea
+
+    started_at = time.perf_counter()
+    TaskOrchestrator(llm_client, max_workers=workers).execute_plan(plan, context_for(idea, plan))
+    sync_seconds = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    asyncio.run(TaskOrchestrator(llm_client).aexecute_plan(plan, context_for(idea, plan), max_concurrency=workers))
+    async_seconds = time.perf_counter() - started_at
+
+    graph_seconds = bench_graph(plan)
+    return {
+        "params": {"tasks": size, "workers": workers},
+        "metrics": {
+            "wall_seconds": round(sync_seconds, 4),
+            "async_wall_seconds": round(async_seconds, 4),
+            "overhead_ms_per_task": round(sync_seconds / size * 1000, 4),
+            "async_overhead_ms_per_task": round(async_seconds / size * 1000, 4),
+            "graph_ms_per_task": round(graph_seconds / size * 1000, 4)
+        }
+    }
+
+
+def bench_throughput(size: int, workers: int, latency: float, seed: int, use_async: bool) -> Dict:
+    plan = synthetic_plan(size, seed=seed)
+    llm_client = FakeLLMClient(ttft=fixed(latency), plan=plan, seed=seed,
+                               max_concurrency={"openai": workers, "anthropic": workers})
+    orchestrator = TaskOrchestrator(llm_client, max_workers=workers)
+    context = context_for(llm_client.idea, plan)
+
+    started_at = time.perf_counter()
+    if use_async:
+        results = asyncio.run(orchestrator.aexecute_plan(plan, context, max_concurrency=workers))
+    else:
+        results = orchestrator.execute_plan(plan, context)
+    wall_seconds = time.perf_counter() - started_at
+
+    ideal_seconds = max(-(-size // workers), critical_path(plan)) * latency
+    return {
+        "params": {"tasks": size, "workers": workers, "latency": latency, "async": use_async},
+        "metrics": {
+            "wall_seconds": round(wall_seconds, 4),
+            "tasks_per_second": round(size / wall_seconds, 2),
+            "ideal_seconds": round(ideal_seconds, 4),
+            "efficiency": round(ideal_seconds / wall_seconds, 4) if wall_seconds else None,
+            "failed_tasks": sum(1 for result in results if result.get("status") != "completed")
+        }
+    }
+
+
+def bench_prompt(size: int, seed: int, model: str = "gpt-4o-mini") -> Dict:
+    plan = synthetic_plan(size, seed=seed)
+    llm_client = FakeLLMClient(plan=plan, seed=seed)
+    orchestrator = TaskOrchestrator(llm_client, model)
+    context = context_for(llm_client.idea, plan)
+    results = orchestrator.execute_plan(plan, context)
+
+    def prompt_tokens(messages: List[Dict]) -> int:
+        return count_tokens("".join(str(msg.get("content", "")) for msg in messages), model)
+
+    tokens = []
+    dependency_tokens = []
+    for task_id in TaskGraph(plan).order:
+        task = next(t for phase in plan["phases"] for t in phase["tasks"] if t["task_id"] == task_id)
+        agent = orchestrator.agents[task["assigned_agent"]]
+        agent_task = orchestrator.with_dependency_results(task, context)
+        tokens.append(prompt_tokens(agent.build_messages(agent_task, context)))
+        dependency_tokens.append(count_tokens(agent_task.get("dependency_results", ""), model))
+
+    telemetry = Telemetry()
+    llm_client.telemetry = telemetry
+    orchestrator.generate_final_report(llm_client.idea, plan, results)
+    report_events = [event for event in telemetry.events(limit=100000) if event.get("agent_type") == "report"]
+    ordered = sorted(tokens)
+    return {
+        "params": {"tasks": size, "model": model},
+        "metrics": {
+            "prompt_tokens_mean": round(statistics.mean(tokens), 1),
+            "prompt_tokens_p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+            "prompt_tokens_max": ordered[-1],
+            "dependency_tokens_max": max(dependency_tokens),
+            "digests_extracted": orchestrator.digests.misses,
+            "report_prompt_tokens": max(event.get("input_tokens", 0) for event in report_events),
+            "report_calls": len(report_events)
+        }
+    }
+
+
+def bench_planning(size: int, latency: float, tokens_per_second: float, seed: int) -> Dict:
+    plan = synthetic_plan(size, seed=seed)
+    metrics = {}
+    for label, hierarchical in (("flat_", False), ("", True)):
+        telemetry = Telemetry()
+        llm_client = FakeLLMClient(ttft=fixed(latency), tokens_per_second=tokens_per_second, plan=plan, seed=seed,
+                                   telemetry=telemetry)
+        started_at = time.perf_counter()
+        created = asyncio.run(MasterAgent(llm_client).acreate_project_plan(llm_client.idea, hierarchical))
+        metrics[f"{label}plan_seconds"] = round(time.perf_counter() - started_at, 4)
+        metrics[f"{label}plan_tasks"] = len(TaskGraph(created))
+        metrics[f"{label}plan_calls"] = telemetry.summary()["totals"]["calls"]
+    return {
+        "params": {"tasks": size, "latency": latency, "tokens_per_second": tokens_per_second},
+        "metrics": metrics
+    }
+
+
+def bench_tail(size: int, workers: int, latency: float, stall_rate: float, seed: int) -> Dict:
+    metrics = {}
+    for label, hedging in (("", None), ("hedged_", HedgePolicy(percentile=0.9, min_samples=10, min_delay=0.0))):
+        telemetry = Telemetry()
+        llm_client = FakeLLMClient(ttft=lognormal(latency, 0.2), stall_rate=stall_rate, stall_seconds=latency * 20,
+                                   seed=seed, telemetry=telemetry, hedging=hedging,
+                                   max_concurrency={"openai": workers * 2, "anthropic": workers * 2})
+
+        async def run_calls():
+            semaphore = asyncio.Semaphore(workers)
+
+            async def one(index: int):
+                async with semaphore:
+                    await llm_client.achat([{"role": "user", "content": f"Yêu cầu {index}"}], model="gpt-4o-mini",
+                                           max_tokens=50)
+
+            await asyncio.gather(*(one(index) for index in range(size)))
+
+        started_at = time.perf_counter()
+        asyncio.run(run_calls())
+        metrics[f"{label}wall_seconds"] = round(time.perf_counter() - started_at, 4)
+        latencies = sorted(event["latency"] for event in telemetry.events(limit=size))
+        metrics[f"{label}p50_seconds"] = latencies[len(latencies) // 2]
+        metrics[f"{label}p99_seconds"] = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+        if hedging:
+            metrics["hedges_fired"] = hedging.fired
+            metrics["hedges_won"] = hedging.won
+        else:
+            metrics["stalls"] = llm_client.stalls
+    return {
+        "params": {"calls": size, "workers": workers, "latency": latency, "stall_rate": stall_rate},
+        "metrics": metrics
+    }
+
+
+def bench_fairness(size: int, workers: int, latency: float, seed: int, tenants: int = 3,
+                   interactive_calls: int = 10) -> Dict:
+    scheduler = QuotaScheduler({"openai": workers, "anthropic": workers})
+    bulk_clients = [FakeLLMClient(ttft=lognormal(latency, 0.2), seed=seed + index, scheduler=scheduler,
+                                  tenant=f"bulk{index}") for index in range(tenants)]
+    interactive_client = FakeLLMClient(ttft=lognormal(latency, 0.2), seed=seed, scheduler=scheduler,
+                                       tenant="interactive")
+    finished = []
+
+    async def run_calls():
+        async def bulk(index: int, llm_client: FakeLLMClient):
+            with call_context(priority="bulk"):
+                await asyncio.gather(*(
+                    llm_client.achat([{"role": "user", "content": f"Yêu cầu {index}.{call}"}], model="gpt-4o-mini",
+                                     max_tokens=50)
+                    for call in range(size)
+                ))
+            finished.append(time.perf_counter() - started_at)
+
+        async def interactive():
+            await asyncio.sleep(latency)
+            for call in range(interactive_calls):
+                await interactive_client.achat([{"role": "user", "content": f"Tương tác {call}"}],
+                                               model="gpt-4o-mini", max_tokens=50)
+
+        await asyncio.gather(interactive(), *(bulk(index, llm_client) for index, llm_client in enumerate(bulk_clients)))
+
+    started_at = time.perf_counter()
+    asyncio.run(run_calls())
+    stats = scheduler.stats()
+    return {
+        "params": {"calls": size, "workers": workers, "latency": latency, "tenants": tenants},
+        "metrics": {
+            "wall_seconds": round(time.perf_counter() - started_at, 4),
+            "interactive_wait_p95_seconds": stats["wait_p95"]["interactive"],
+            "bulk_wait_p95_seconds": stats["wait_p95"]["bulk"],
+            "bulk_finish_spread_seconds": round(max(finished) - min(finished), 4)
+        }
+    }
+
+
+def bench_e2e(size: int, workers: int, latency: float, tokens_per_second: float, failure_rate: float,
+              seed: int) -> Dict:
+    telemetry = Telemetry()
+    llm_client = FakeLLMClient(ttft=lognormal(latency), tokens_per_second=tokens_per_second,
+                               failure_rate=failure_rate, failure_status=429, plan_tasks=size, seed=seed,
+                               telemetry=telemetry, max_concurrency={"openai": workers, "anthropic": workers})
+
+    async def pipeline() -> Dict:
+        stages = {}
+        master_agent = MasterAgent(llm_client, "gpt-4o")
+
+        started_at = time.perf_counter()
+        idea = await master_agent.agenerate_idea("Ứng dụng quản lý công việc cho nhóm nhỏ")
+        stages["idea_seconds"] = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        plan = await master_agent.acreate_project_plan(idea)
+        stages["plan_seconds"] = time.perf_counter() - started_at
+
+        orchestrator = TaskOrchestrator(llm_client)
+        started_at = time.perf_counter()
+        results = await orchestrator.aexecute_plan(plan, context_for(idea, plan), max_concurrency=workers)
+        stages["execute_seconds"] = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        await orchestrator.agenerate_final_report(idea, plan, results)
+        stages["report_seconds"] = time.perf_counter() - started_at
+        stages["failed_tasks"] = sum(1 for result in results if result.get("status") != "completed")
+        return stages
+
+    started_at = time.perf_counter()
+    stages = asyncio.run(pipeline())
+    wall_seconds = time.perf_counter() - started_at
+    totals = telemetry.summary()["totals"]
+    return {
+        "params": {"tasks": size, "workers": workers, "latency": latency, "tokens_per_second": tokens_per_second,
+                   "failure_rate": failure_rate},
+        "metrics": {
+            "wall_seconds": round(wall_seconds, 4),
+            **{key: round(value, 4) if isinstance(value, float) else value for key, value in stages.items()},
+            "llm_calls": totals["calls"],
+            "llm_errors": totals["errors"],
+            "injected_failures": llm_client.failures,
+            "input_tokens": totals["input_tokens"],
+            "output_tokens": totals["output_tokens"],
+            "cost_usd": totals["cost_usd"]
+        }
+    }
+
+
+def run_suites(args) -> List[Dict]:
+    records = []
+    environment = {
+        "timestamp": time.time(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "label": args.label
+    }
+
+    def emit(benchmark: str, result: Dict):
+        record = {"benchmark": benchmark, **environment, **result}
+        records.append(record)
+        print(f"{benchmark} {json.dumps(result['params'])}: {json.dumps(result['metrics'])}", file=sys.stderr)
+
+    for size in args.sizes:
+        if "scheduler" in args.suites:
+            emit("scheduler", bench_scheduler(size, args.workers[-1], args.seed))
+        if "prompt" in args.suites:
+            emit("prompt", bench_prompt(size, args.seed))
+        if "planning" in args.suites:
+            emit("planning", bench_planning(size, args.latency, args.tokens_per_second or 100.0, args.seed))
+        if "tail" in args.suites:
+            emit("tail", bench_tail(size, args.workers[-1], args.latency, args.stall_rate, args.seed))
+        if "fairness" in args.suites:
+            emit("fairness", bench_fairness(size, args.workers[0], args.latency, args.seed))
+        if "throughput" in args.suites:
+            for workers in args.workers:
+                for use_async in (False, True):
+                    emit("throughput", bench_throughput(size, workers, args.latency, args.seed, use_async))
+        if "e2e" in args.suites:
+            emit("e2e", bench_e2e(size, args.workers[-1], args.latency, args.tokens_per_second,
+                                  args.failure_rate, args.seed))
+    return records
+
+
+def record_key(record: Dict) -> str:
+    return f"{record['benchmark']}:{json.dumps(record['params'], sort_keys=True)}"
+
+
+def compare(records: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    baseline = {}
+    with open(baseline_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                baseline[record_key(record)] = record
+
+    regressions = []
+    for record in records:
+        previous = baseline.get(record_key(record))
+        if not previous:
+            continue
+        for metric, value in record["metrics"].items():
+            old = previous["metrics"].get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old <= 0:
+                continue
+            if metric in HIGHER_IS_BETTER and value < old * (1 - tolerance):
+                regressions.append(f"{record_key(record)} {metric}: {old} → {value}")
+            elif metric in LOWER_IS_BETTER and value > old * (1 + tolerance):
+                regressions.append(f"{record_key(record)} {metric}: {old} → {value}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark orchestrator với LLM giả lập (không gọi API thật)")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000], help="Số task của kế hoạch giả lập")
+    parser.add_argument("--workers", nargs="+", type=int, default=[4, 16], help="Số worker/task chạy đồng thời")
+    parser.add_argument("--latency", type=float, default=0.02, help="Độ trễ (giây) của mỗi lượt gọi LLM giả lập")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Tốc độ sinh token của LLM giả lập (0 = tức thời)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Tỉ lệ lỗi 429 giả lập trong suite e2e")
+    parser.add_argument("--stall-rate", type=float, default=0.02,
+                        help="Tỉ lệ request bị treo (chờ gấp 20 lần độ trễ) trong suite tail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="Nhãn gắn vào mỗi bản ghi (vd: tên nhánh)")
+    parser.add_argument("-o", "--output", help="File JSONL để ghi thêm kết quả (mặc định: stdout)")
+    parser.add_argument("--baseline", help="File JSONL kết quả cũ để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Ngưỡng chênh lệch coi là regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    records = run_suites(args)
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for record in records:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if args.baseline:
+        regressions = compare(records, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
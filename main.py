@@ -1,8 +1,24 @@
 import streamlit as st
+import copy
 import os
+import threading
+import time
+import uuid
+from utils.fake_llm import FakeLLMClient
+from utils.hedging import HedgePolicy
+from utils.http_transport import HTTPTransport
 from utils.llm_client import LLMClient
+from utils.llm_cache import LLMCache
+from utils.quota_scheduler import QuotaScheduler
+from utils.run_store import RunStore
+from utils.similarity_index import SimilarityIndex
+from utils.task_executor import ACTIVE_STATUSES, TaskExecutor
+from utils.task_graph import TaskGraph, content_hash
+from utils.telemetry import Telemetry, call_context
+from agents.cost_estimator import RunBudget
 from agents.master_agent import MasterAgent
 from agents.orchestrator import TaskOrchestrator
+from agents.routing import AGENT_TYPES, RoutingPolicy
 import json
 
 st.set_page_config(
@@ -14,9 +30,452 @@ st.set_page_config(
 st.title("🤖 AI Project Automation System")
 st.markdown("### Hệ thống tự động hóa quy trình phát triển dự án bằng AI")
 
+@st.cache_resource
+def get_run_store():
+    return RunStore(os.getenv("RUN_STORE_PATH", ".runs/runs.sqlite"))
+
+@st.cache_resource
+def get_telemetry():
+    telemetry = Telemetry.from_env()
+    if os.getenv("METRICS_PORT"):
+        telemetry.serve(int(os.getenv("METRICS_PORT")))
+    return telemetry
+
+@st.cache_resource
+def get_http_transport():
+    return HTTPTransport.shared()
+
+@st.cache_resource
+def get_hedge_policy():
+    return HedgePolicy.from_env()
+
+@st.cache_resource
+def get_quota_scheduler():
+    return QuotaScheduler.shared()
+
+@st.cache_resource
+def get_similarity_index():
+    return SimilarityIndex.from_env()
+
+@st.cache_resource
+def get_task_executor():
+    return TaskExecutor(max_workers=int(os.getenv("TASK_WORKERS", "8")))
+
+def load_run(run_id):
+    run = st.session_state.run_store.load_run(run_id)
+    if not run:
+        return False
+    st.session_state.run_id = run_id
+    st.session_state.idea = run['idea']
+    st.session_state.plan = run['plan']
+    st.session_state.plan_source = plan_job_key(run['idea']) if run['plan'] else None
+    st.session_state.report = run['report']
+    st.session_state.task_states = {
+        task_id: {
+            'status': run['task_results'].get(task_id, {}).get('status', 'pending'),
+            'result': run['task_results'].get(task_id),
+            'notes': run['task_notes'].get(task_id, '')
+        }
+        for task_id in set(run['task_results']) | set(run['task_notes'])
+    }
+    st.session_state.orchestrator = None
+    st.query_params["run_id"] = run_id
+    return True
+
+def get_orchestrator():
+    st.session_state.setdefault('orchestrator', None)
+    if st.session_state.orchestrator is None and st.session_state.llm_client:
+        st.session_state.orchestrator = TaskOrchestrator(st.session_state.llm_client, st.session_state.worker_model,
+                                                         run_store=st.session_state.run_store,
+                                                         routing=st.session_state.get('routing'),
+                                                         similarity_index=st.session_state.similarity_index)
+        st.session_state.orchestrator.task_results.update({
+            task_id: state['result']
+            for task_id, state in st.session_state.get('task_states', {}).items()
+            if state['result'] and state['status'] == 'completed'
+        })
+    return st.session_state.orchestrator
+
+def invalidate_stale_tasks():
+    orchestrator = get_orchestrator()
+    task_states = st.session_state.setdefault('task_states', {})
+    if not orchestrator or not st.session_state.plan:
+        return set()
+    results = {
+        task_id: state['result'] for task_id, state in task_states.items()
+        if state['result'] and state['status'] == 'completed'
+    }
+    context = {"idea": st.session_state.idea, "plan": st.session_state.plan}
+    stale = orchestrator.invalidated_tasks(st.session_state.plan, context, results)
+    plan_task_ids = set(TaskGraph(st.session_state.plan).tasks)
+    for task_id in stale:
+        if task_id in plan_task_ids:
+            task_states[task_id].update({'status': 'pending', 'result': None})
+        else:
+            task_states.pop(task_id, None)
+    orchestrator.forget(stale)
+    if st.session_state.run_id and stale:
+        st.session_state.run_store.delete_task_results(st.session_state.run_id, stale)
+    return stale
+
+def job_prefix():
+    return f"{st.session_state.session_key}:{st.session_state.run_id or '-'}:"
+
+def plan_job_key(idea):
+    return f"{st.session_state.session_key}:plan:{content_hash([idea, st.session_state.master_model])[:16]}"
+
+def run_plan_job(llm_client, model, idea, cancelled, on_token=None):
+    def progress(message, _):
+        if cancelled.is_set():
+            raise ValueError("Đã hủy kế hoạch tạo trước do ý tưởng thay đổi")
+        on_token(message + "\n")
+    return MasterAgent(llm_client, model).create_project_plan(idea, progress_callback=progress)
+
+def discard_speculative_plan():
+    speculation = st.session_state.get('speculation')
+    if speculation:
+        speculation['cancelled'].set()
+        st.session_state.task_executor.cancel(speculation['key'])
+        st.session_state.task_executor.pop_finished(speculation['key'])
+        st.session_state.speculation = None
+
+def speculate_plan():
+    key = plan_job_key(st.session_state.idea)
+    speculation = st.session_state.get('speculation')
+    if speculation and speculation['key'] == key:
+        return
+    discard_speculative_plan()
+    cancelled = threading.Event()
+    if st.session_state.task_executor.submit(key, run_plan_job, st.session_state.llm_client,
+                                             st.session_state.master_model, copy.deepcopy(st.session_state.idea),
+                                             cancelled):
+        st.session_state.speculation = {'key': key, 'cancelled': cancelled}
+
+def await_speculative_plan(status):
+    speculation = st.session_state.get('speculation')
+    key = plan_job_key(st.session_state.idea)
+    if not speculation or speculation['key'] != key:
+        discard_speculative_plan()
+        return None
+    executor = st.session_state.task_executor
+    status.write("⚡ Dùng kế hoạch đang được tạo trước")
+    shown = 0
+    while True:
+        job = executor.jobs(key).get(key)
+        if job is None:
+            break
+        lines = job['partial'].splitlines()
+        for line in lines[shown:]:
+            status.write(line)
+        shown = len(lines)
+        if job['status'] not in ACTIVE_STATUSES:
+            break
+        time.sleep(0.2)
+    executor.pop_finished(key)
+    st.session_state.speculation = None
+    if job and job['status'] == 'completed':
+        return job['result']
+    if job and job['error']:
+        status.write(f"⚠️ Kế hoạch tạo trước lỗi ({job['error']}), tạo lại...")
+    return None
+
+def run_task_job(orchestrator, task, context, run_store, run_id, priority, budget, model, on_token=None):
+    with call_context(priority=priority):
+        result = orchestrator.execute_single_task(task, context, on_token=on_token, model=model)
+    orchestrator.settle_task(budget, task, result, model)
+    if run_id:
+        run_store.save_task_result(run_id, task['task_id'], result)
+    return result
+
+def get_run_budget():
+    limits = [st.session_state.get('budget_tokens') or 0, st.session_state.get('budget_cost') or 0.0,
+              st.session_state.get('budget_fallback')]
+    if not limits[0] and not limits[1]:
+        return None
+    budget_key = content_hash([st.session_state.run_id, st.session_state.get('plan_source'), limits])
+    if st.session_state.get('run_budget_key') != budget_key:
+        budget = RunBudget(int(limits[0]), float(limits[1]),
+                           limits[2] if limits[2] != BUDGET_NO_FALLBACK else None)
+        orchestrator = get_orchestrator()
+        for task_id, state in st.session_state.get('task_states', {}).items():
+            if orchestrator and state['result'] and state['status'] == 'completed':
+                task = {'task_id': task_id, 'assigned_agent': state['result'].get('agent_type')}
+                orchestrator.settle_task(budget, task, state['result'])
+        st.session_state.run_budget = budget
+        st.session_state.run_budget_key = budget_key
+    return st.session_state.run_budget
+
+def format_seconds(seconds):
+    if seconds < 90:
+        return f"{seconds:.0f}s"
+    if seconds < 5400:
+        return f"{seconds / 60:.0f} phút"
+    return f"{seconds / 3600:.1f} giờ"
+
+def render_preflight(orchestrator, plan):
+    context = {"idea": st.session_state.idea, "plan": plan}
+    workers = st.session_state.task_executor.max_workers
+    completed = sorted(task_id for task_id, state in st.session_state.get('task_states', {}).items()
+                       if state['status'] == 'completed')
+    estimate_key = content_hash([st.session_state.get('plan_source') or plan, st.session_state.get('routing_key'),
+                                 st.session_state.get('worker_model'), completed, workers,
+                                 st.session_state.telemetry.summary()['totals']['calls']])
+    if st.session_state.get('preflight_key') != estimate_key:
+        st.session_state.preflight = orchestrator.estimate_plan(plan, context, workers)
+        st.session_state.preflight_key = estimate_key
+    estimate = st.session_state.preflight
+    totals = estimate['totals']
+    
+    st.subheader("💰 Ước tính trước khi chạy")
+    col_tokens, col_cost, col_time = st.columns(3)
+    with col_tokens:
+        st.metric("Tokens (vào / ra)", f"{totals['input_tokens']:,} / {totals['output_tokens']:,}")
+    with col_cost:
+        st.metric("Chi phí ước tính", f"${totals['cost_usd']:.4f}")
+    with col_time:
+        st.metric(f"Thời gian ({workers} worker)", format_seconds(totals['wall_seconds']))
+    st.caption(
+        f"⏱️ Đường găng {format_seconds(totals['critical_path_seconds'])} qua {len(estimate['critical_path'])} tasks · "
+        f"{totals['tasks']} tasks cần chạy, {totals['skipped']} đã xong hoặc dùng lại · "
+        "token đầu ra dự đoán theo lịch sử của từng agent"
+    )
+    budget = get_run_budget()
+    if budget:
+        spent = budget.summary()
+        planned_tokens = spent['spent_tokens'] + totals['input_tokens'] + totals['output_tokens']
+        if budget.max_tokens and planned_tokens > budget.max_tokens:
+            st.warning(f"⚠️ Ước tính vượt ngân sách {budget.max_tokens:,} tokens")
+        if budget.max_cost and spent['spent_cost'] + totals['cost_usd'] > budget.max_cost:
+            st.warning(f"⚠️ Ước tính vượt ngân sách ${budget.max_cost:.2f}")
+    with st.expander("Chi tiết theo agent"):
+        st.dataframe([
+            {
+                "agent": agent_type,
+                "tasks": row['tasks'],
+                "input tokens": row['input_tokens'],
+                "output tokens": row['output_tokens'],
+                "cost ($)": round(row['cost_usd'], 4)
+            }
+            for agent_type, row in estimate['by_agent'].items()
+        ], hide_index=True)
+
+def submit_task(task_id, task, priority="interactive"):
+    orchestrator = get_orchestrator()
+    if not orchestrator:
+        st.error("❌ Vui lòng cấu hình API keys trước khi thực thi")
+        return False
+    context = copy.deepcopy({"idea": st.session_state.idea, "plan": st.session_state.plan})
+    budget = get_run_budget()
+    model, refused = orchestrator.admit_task({**task, 'task_id': task_id}, context, budget, wait=True)
+    if refused and refused['status'] == 'deferred':
+        return False
+    if refused:
+        st.session_state.task_states[task_id].update({'status': 'failed', 'result': refused})
+        return False
+    submitted = st.session_state.task_executor.submit(
+        job_prefix() + task_id, run_task_job, orchestrator, {**task, 'task_id': task_id}, context,
+        st.session_state.run_store, st.session_state.run_id, priority, budget, model
+    )
+    if not submitted and budget:
+        budget.release(task_id)
+    if submitted:
+        st.session_state.task_states[task_id]['status'] = 'running'
+        st.session_state.task_states[task_id]['result'] = None
+    return submitted
+
+def reuse_similar_result(task_id, task, match):
+    orchestrator = get_orchestrator()
+    context = {"idea": st.session_state.idea, "plan": st.session_state.plan}
+    result = orchestrator.reuse_result({**task, 'task_id': task_id}, context, match)
+    st.session_state.task_states[task_id].update({'status': 'completed', 'result': result})
+    if st.session_state.run_id:
+        st.session_state.run_store.save_task_result(st.session_state.run_id, task_id, result)
+
+def submit_ready_tasks():
+    graph = TaskGraph(st.session_state.plan)
+    task_states = st.session_state.task_states
+    completed = {task_id for task_id in graph.order if task_states.get(task_id, {}).get('status') == 'completed'}
+    started = {task_id for task_id in graph.order if task_states.get(task_id, {}).get('status') in ('completed', 'running')}
+    submitted = 0
+    for task_id in graph.ready_tasks(completed, started):
+        task_states.setdefault(task_id, {'status': 'pending', 'result': None, 'notes': ''})
+        if submit_task(task_id, graph.tasks[task_id], priority="bulk"):
+            submitted += 1
+    return submitted
+
+def collect_finished_tasks():
+    prefix = job_prefix()
+    executor = st.session_state.task_executor
+    task_states = st.session_state.setdefault('task_states', {})
+    finished = executor.pop_finished(prefix)
+    for key, job in finished.items():
+        task_id = key[len(prefix):]
+        if task_id not in task_states:
+            continue
+        result = job['result'] or {
+            'task_id': task_id,
+            'status': 'failed',
+            'result': job['error'] or 'Lỗi không xác định'
+        }
+        task_states[task_id]['status'] = result.get('status', 'completed')
+        task_states[task_id]['result'] = result
+    
+    active = {key[len(prefix):] for key in executor.jobs(prefix)}
+    for task_id, state in task_states.items():
+        if state['status'] == 'running' and task_id not in active:
+            state['status'] = 'pending'
+    
+    if finished:
+        invalidate_stale_tasks()
+        if st.session_state.auto_run_ready and st.session_state.plan:
+            submit_ready_tasks()
+    return len(finished)
+
+def render_execution_monitor():
+    if collect_finished_tasks():
+        st.rerun()
+    jobs = st.session_state.task_executor.jobs(job_prefix())
+    if not jobs:
+        return
+    queued = sum(1 for job in jobs.values() if job['status'] == 'queued')
+    running = [job for job in jobs.values() if job['status'] == 'running']
+    st.info(f"⚙️ {len(running)} task đang chạy · 🕒 {queued} task trong hàng đợi — bạn có thể tiếp tục làm việc")
+    waiting_calls = get_quota_scheduler().stats()['queued_by_tenant'].get(st.session_state.session_key, 0)
+    if waiting_calls:
+        st.caption(f"🚥 {waiting_calls} lượt gọi LLM đang chờ quota dùng chung với các phiên khác")
+    for job in running:
+        with st.expander(f"📡 {job['key'][len(job_prefix()):]}", expanded=False):
+            st.markdown(job['partial'][-1500:] + "▌")
+
+BUDGET_NO_FALLBACK = "Dừng, không chuyển model"
+
+STATUS_LABELS = {
+    'pending': '⏳ Chờ thực thi',
+    'running': '⚙️ Đang chạy...',
+    'completed': '✅ Hoàn thành',
+    'failed': '❌ Thất bại'
+}
+TASKS_PER_PAGE = 10
+RESULT_PREVIEW_CHARS = 3000
+
+@st.cache_data(max_entries=1000, show_spinner=False)
+def result_preview(text, limit=RESULT_PREVIEW_CHARS):
+    if len(text) <= limit:
+        return text, False
+    cut = text.rfind("\n", 0, limit)
+    preview = text[:cut if cut > limit // 2 else limit]
+    if preview.count("```") % 2:
+        preview += "\n```"
+    return preview + "\n\n…", True
+
+@st.fragment
+def render_task_card(task_id, task):
+    task_name = task.get('name', 'Unknown Task')
+    assigned_agent = task.get('assigned_agent', 'research')
+    task_state = st.session_state.task_states[task_id]
+    
+    with st.container():
+        st.markdown(f"### 🎯 {task_name}")
+        
+        col1, col2, col3 = st.columns([2, 1, 1])
+        
+        with col1:
+            st.markdown(f"**Trạng thái:** {STATUS_LABELS.get(task_state['status'], 'Unknown')}")
+            st.markdown(f"**Agent:** `{assigned_agent}`")
+        
+        with col2:
+            if task_state['status'] == 'pending' or task_state['status'] == 'failed':
+                if st.button(f"▶️ Thực thi", key=f"exec_{task_id}", type="primary"):
+                    if submit_task(task_id, task):
+                        st.rerun()
+            elif task_state['status'] == 'running':
+                job = st.session_state.task_executor.jobs(job_prefix() + task_id).get(job_prefix() + task_id)
+                if job and job['status'] == 'queued' and st.button("✖️ Hủy", key=f"cancel_{task_id}"):
+                    if st.session_state.task_executor.cancel(job['key']) and get_run_budget():
+                        get_run_budget().release(task_id)
+                    st.rerun()
+        
+        with col3:
+            if task_state['status'] == 'completed':
+                if st.button(f"🔄 Thực thi lại", key=f"reexec_{task_id}"):
+                    get_orchestrator().fresh_tasks.add(task_id)
+                    if submit_task(task_id, task):
+                        st.rerun()
+        
+        with st.expander("📝 Mô tả & Chi tiết"):
+            st.markdown(f"**Mô tả task:** {task.get('description', '')}")
+            if task.get('estimated_duration'):
+                st.markdown(f"**Thời gian ước tính:** {task['estimated_duration']}")
+            if task.get('dependencies'):
+                st.markdown(f"**Phụ thuộc:** {', '.join(task['dependencies'])}")
+        
+        orchestrator = get_orchestrator() if task_state['status'] in ('pending', 'failed') else None
+        match = orchestrator.similar_result(
+            {**task, 'task_id': task_id}, {"idea": st.session_state.idea}, record=False
+        ) if orchestrator else None
+        if match:
+            st.info(f"♻️ Có kết quả tương tự ({match['similarity']:.0%}) từ task \"{match['name']}\"" +
+                    (" — sẽ được dùng lại khi thực thi" if match['mode'] == 'reuse'
+                     else " — sẽ được dùng làm tham khảo khi thực thi"))
+            if st.button("♻️ Dùng lại kết quả này", key=f"reuse_{task_id}"):
+                reuse_similar_result(task_id, task, match)
+                st.rerun()
+        
+        if task_state['result']:
+            with st.expander("📊 Kết quả", expanded=True):
+                preview, truncated = result_preview(str(task_state['result'].get('result', 'N/A')))
+                if truncated and st.toggle("Xem toàn bộ kết quả", key=f"full_{task_id}"):
+                    st.markdown(task_state['result'].get('result', 'N/A'))
+                else:
+                    st.markdown(preview)
+                usage = task_state['result'].get('usage')
+                if usage:
+                    st.caption(
+                        f"🔢 Tokens: input {usage.get('input_tokens', 0)} "
+                        f"(cache {usage.get('cached_tokens', 0)}) · output {usage.get('output_tokens', 0)}"
+                    )
+                if task_state['result'].get('reused_from'):
+                    source = task_state['result']['reused_from']
+                    st.caption(f"♻️ Dùng lại kết quả của \"{source['task_name']}\" ({source['similarity']:.0%})")
+                elif task_state['result'].get('adapted_from'):
+                    source = task_state['result']['adapted_from']
+                    st.caption(f"✏️ Điều chỉnh từ kết quả của \"{source['task_name']}\" ({source['similarity']:.0%})")
+                if task_state['result'].get('escalations'):
+                    steps = " → ".join(
+                        f"{step['model']} ({step['reason']})" for step in task_state['result']['escalations']
+                    )
+                    st.caption(f"⤴️ Đã nâng cấp model: {steps} → {task_state['result'].get('model')}")
+                elif task_state['result'].get('model'):
+                    st.caption(f"🧭 Model: {task_state['result']['model']}")
+                digest = task_state['result'].get('digest')
+                if digest:
+                    st.caption(
+                        f"🧾 Bản tóm tắt cho task phụ thuộc: {len(digest['decisions'])} quyết định · "
+                        f"{len(digest['files'])} file · {len(digest['artifacts'])} đoạn code"
+                    )
+                if task_state['result'].get('validation_error'):
+                    st.caption(f"⚠️ Kết quả chưa đạt kiểm tra: {task_state['result']['validation_error']}")
+        
+        notes = st.text_area(
+            "💭 Ghi chú của bạn",
+            value=task_state['notes'],
+            key=f"notes_{task_id}",
+            placeholder="Thêm ghi chú về task này...",
+            height=80
+        )
+        if notes != task_state['notes']:
+            st.session_state.task_states[task_id]['notes'] = notes
+            if st.session_state.run_id:
+                st.session_state.run_store.save_task_notes(st.session_state.run_id, task_id, notes)
+        
+        st.divider()
+
 if "llm_client" not in st.session_state:
     st.session_state.llm_client = None
 
+if "llm_cache" not in st.session_state:
+    st.session_state.llm_cache = LLMCache.from_env()
+
 if "master_model" not in st.session_state:
     st.session_state.master_model = "gpt-4o"
 
@@ -35,6 +494,39 @@ if "results" not in st.session_state:
 if "report" not in st.session_state:
     st.session_state.report = None
 
+if "run_store" not in st.session_state:
+    st.session_state.run_store = get_run_store()
+
+if "telemetry" not in st.session_state:
+    st.session_state.telemetry = get_telemetry()
+
+if "similarity_index" not in st.session_state:
+    st.session_state.similarity_index = get_similarity_index()
+
+if "task_executor" not in st.session_state:
+    st.session_state.task_executor = get_task_executor()
+
+if "session_key" not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex
+
+if st.session_state.llm_client is None and os.getenv("LLM_BACKEND") == "fake":
+    st.session_state.llm_client = FakeLLMClient.from_env(cache=st.session_state.llm_cache,
+                                                         telemetry=st.session_state.telemetry,
+                                                         transport=get_http_transport(), hedging=get_hedge_policy(),
+                                                         scheduler=get_quota_scheduler(),
+                                                         tenant=st.session_state.session_key)
+
+if "auto_run_ready" not in st.session_state:
+    st.session_state.auto_run_ready = False
+
+if "speculative_plan" not in st.session_state:
+    st.session_state.speculative_plan = os.getenv("SPECULATIVE_PLAN", "off") == "on"
+
+if "run_id" not in st.session_state:
+    st.session_state.run_id = None
+    if st.query_params.get("run_id") and not load_run(st.query_params["run_id"]):
+        del st.query_params["run_id"]
+
 with st.sidebar:
     st.header("⚙️ Cấu hình")
     
@@ -47,7 +539,9 @@ with st.sidebar:
             os.environ["OPENAI_API_KEY"] = openai_key
         if anthropic_key:
             os.environ["ANTHROPIC_API_KEY"] = anthropic_key
-        st.session_state.llm_client = LLMClient()
+        st.session_state.llm_client = LLMClient(cache=st.session_state.llm_cache, telemetry=st.session_state.telemetry,
+                                                transport=get_http_transport(), hedging=get_hedge_policy(),
+                                                scheduler=get_quota_scheduler(), tenant=st.session_state.session_key)
         st.success("✅ Đã lưu API keys!")
     
     if st.session_state.llm_client:
@@ -67,12 +561,187 @@ with st.sidebar:
                 available_models,
                 index=available_models.index("gpt-4o-mini") if "gpt-4o-mini" in available_models else 0
             )
+            
+            st.checkbox(
+                "⚡ Tạo trước kế hoạch khi đang xem ý tưởng",
+                key="speculative_plan",
+                help="Bắt đầu tạo kế hoạch ngay khi có ý tưởng; nếu ý tưởng bị sửa, bản tạo trước bị hủy và tạo lại"
+            )
+            
+            with st.expander("🧭 Định tuyến model theo agent"):
+                cascade = st.checkbox(
+                    "Cascade: chạy Worker model trước, nâng cấp lên Master model khi kết quả không đạt",
+                    value=True
+                )
+                base_policy = (RoutingPolicy.cheap_first(st.session_state.worker_model, st.session_state.master_model)
+                               if cascade else RoutingPolicy(default_model=st.session_state.worker_model))
+                model_options = ["Mặc định"] + available_models
+                fallback_options = ["Mặc định", "Không nâng cấp"] + available_models
+                routes = {}
+                for agent_type in AGENT_TYPES:
+                    route = base_policy.route(agent_type)
+                    st.markdown(f"**{agent_type}** · {route['model']}"
+                                + (f" → {', '.join(route['fallback_models'])}" if route['fallback_models'] else ""))
+                    col_model, col_fallback = st.columns(2)
+                    with col_model:
+                        model_choice = st.selectbox("Model", model_options, key=f"route_{agent_type}_model")
+                    with col_fallback:
+                        fallback_choice = st.selectbox("Nâng cấp lên", fallback_options,
+                                                       key=f"route_{agent_type}_fallback")
+                    col_tokens, col_temperature = st.columns(2)
+                    with col_tokens:
+                        route['max_tokens'] = st.number_input("Max tokens", 256, 16000, route['max_tokens'], 256,
+                                                              key=f"route_{agent_type}_max_tokens_{cascade}")
+                    with col_temperature:
+                        route['temperature'] = st.slider("Temperature", 0.0, 1.0, route['temperature'], 0.1,
+                                                         key=f"route_{agent_type}_temperature_{cascade}")
+                    if model_choice != "Mặc định":
+                        route['model'] = model_choice
+                    if fallback_choice == "Không nâng cấp":
+                        route['fallback_models'] = []
+                    elif fallback_choice != "Mặc định":
+                        route['fallback_models'] = [fallback_choice]
+                    routes[agent_type] = route
+                
+                routing = RoutingPolicy(routes, st.session_state.worker_model)
+                routing_key = content_hash(routing.to_dict())
+                if st.session_state.get('routing_key') != routing_key:
+                    st.session_state.routing = routing
+                    st.session_state.routing_key = routing_key
+                    st.session_state.orchestrator = None
+            
+            with st.expander("💰 Ngân sách lượt chạy"):
+                st.number_input("Tối đa tokens (0 = không giới hạn)", 0, 100_000_000, 0, 10_000, key="budget_tokens")
+                st.number_input("Tối đa chi phí $ (0 = không giới hạn)", 0.0, 10_000.0, 0.0, 0.5, key="budget_cost")
+                st.selectbox("Khi sắp vượt ngân sách, chuyển task sang", [BUDGET_NO_FALLBACK] + available_models,
+                             key="budget_fallback")
+                run_budget = get_run_budget()
+                if run_budget:
+                    spent = run_budget.summary()
+                    st.caption(f"Đã dùng {spent['spent_tokens']:,} tokens · ${spent['spent_cost']:.4f}"
+                               + (f" · {len(spent['downgraded'])} task chuyển model rẻ hơn" if spent['downgraded'] else ""))
+                    if spent['exhausted']:
+                        st.warning("⛔ Đã chạm ngân sách: không chạy thêm task mới. Tăng ngân sách để tiếp tục.")
     else:
         st.warning("⚠️ Vui lòng cấu hình API keys")
     
+    if st.session_state.llm_cache:
+        st.subheader("🗄️ Cache LLM")
+        cache_stats = st.session_state.llm_cache.stats()
+        if cache_stats['replay_only']:
+            st.info("Chế độ replay-only: chỉ dùng phản hồi đã lưu trong cache")
+        col_hits, col_misses = st.columns(2)
+        with col_hits:
+            st.metric("Hits", cache_stats['hits'])
+        with col_misses:
+            st.metric("Misses", cache_stats['misses'])
+        st.caption(f"{cache_stats['entries']} mục · {cache_stats['bytes'] / 1024:.0f} KB")
+        if st.button("🧹 Xóa cache"):
+            st.session_state.llm_cache.clear()
+            st.rerun()
+    
+    if st.session_state.similarity_index:
+        st.subheader("♻️ Tái sử dụng kết quả")
+        similarity_index = st.session_state.similarity_index
+        similarity_stats = similarity_index.stats()
+        col_reuse, col_adapt = st.columns(2)
+        with col_reuse:
+            st.metric("Dùng lại", similarity_stats['reuse_hits'])
+        with col_adapt:
+            st.metric("Điều chỉnh", similarity_stats['adapt_hits'])
+        st.caption(f"Tỉ lệ trúng {similarity_stats['hit_rate']:.0%} / {similarity_stats['lookups']} lượt tra cứu · "
+                   f"{similarity_stats['entries']} kết quả đã lưu")
+        st.session_state.setdefault('auto_reuse', similarity_index.auto_reuse)
+        st.session_state.setdefault('reuse_threshold', similarity_index.reuse_threshold)
+        st.session_state.setdefault('adapt_threshold', similarity_index.adapt_threshold)
+        similarity_index.auto_reuse = st.toggle("Tự động dùng lại kết quả gần giống hệt", key='auto_reuse',
+                                                help="Tắt: chỉ dùng làm tham khảo, bấm ♻️ trên task để dùng lại")
+        if similarity_index.auto_reuse:
+            similarity_index.reuse_threshold = st.slider("Ngưỡng dùng lại nguyên kết quả", 0.5, 1.0, step=0.01,
+                                                         key='reuse_threshold')
+        similarity_index.adapt_threshold = st.slider("Ngưỡng dùng làm tham khảo", 0.3, 1.0, step=0.01,
+                                                     key='adapt_threshold')
+        if st.button("🧹 Xóa chỉ mục tương tự"):
+            similarity_index.clear()
+            st.rerun()
+    
+    telemetry_summary = st.session_state.telemetry.summary()
+    if telemetry_summary['totals']['calls']:
+        st.subheader("📈 Telemetry LLM")
+        totals = telemetry_summary['totals']
+        col_calls, col_cost = st.columns(2)
+        with col_calls:
+            st.metric("Lượt gọi", totals['calls'], delta=f"{totals['errors']} lỗi" if totals['errors'] else None,
+                      delta_color="inverse")
+        with col_cost:
+            st.metric("Chi phí ước tính", f"${totals['cost_usd']:.4f}")
+        st.caption(
+            f"🔢 input {totals['input_tokens']} (cache {totals['cached_tokens']}) · output {totals['output_tokens']}"
+        )
+        hedge_policy = get_hedge_policy()
+        if hedge_policy and hedge_policy.fired:
+            st.caption(f"🪁 Hedged {hedge_policy.fired} lượt gọi chậm · bản dự phòng về trước {hedge_policy.won} lượt")
+        quota = get_quota_scheduler().stats()
+        st.caption(
+            f"🚥 Quota chung: {sum(quota['active'].values())} đang gọi · {quota['queued']} đang chờ "
+            f"({quota['queued_by_priority']['interactive']} tương tác / {quota['queued_by_priority']['bulk']} hàng loạt) "
+            f"· {quota['tenants']} phiên · chờ p95 {quota['wait_p95']['interactive'] or 0:.2f}s / "
+            f"{quota['wait_p95']['bulk'] or 0:.2f}s"
+        )
+        with st.expander("Chi tiết theo agent/model"):
+            st.dataframe([
+                {
+                    "agent": row['agent_type'],
+                    "model": row['model'],
+                    "calls": row['calls'],
+                    "errors": row['errors'],
+                    "p50 (s)": row['latency_p50'],
+                    "p95 (s)": row['latency_p95'],
+                    "TTFT p95 (s)": row['ttft_p95'],
+                    "queue p95 (s)": row['queue_wait_p95'],
+                    "output tokens": row['output_tokens'],
+                    "cost ($)": row['cost_usd']
+                }
+                for row in telemetry_summary['series']
+            ], hide_index=True)
+            st.download_button(
+                "📥 Metrics (JSON)",
+                data=json.dumps(telemetry_summary, ensure_ascii=False, indent=2),
+                file_name="llm_metrics.json",
+                mime="application/json"
+            )
+            st.download_button(
+                "📥 Metrics (Prometheus)",
+                data=st.session_state.telemetry.prometheus(),
+                file_name="llm_metrics.prom",
+                mime="text/plain"
+            )
+    
+    st.subheader("📂 Phiên chạy")
+    if st.session_state.run_id:
+        st.caption(f"Run ID hiện tại: `{st.session_state.run_id}`")
+    saved_runs = st.session_state.run_store.list_runs()
+    if saved_runs:
+        run_labels = {
+            run['run_id']: f"{run['name']} · {run['completed_tasks']} tasks xong · {run['status']}"
+            for run in saved_runs
+        }
+        selected_run = st.selectbox("Chọn phiên để tiếp tục", list(run_labels), format_func=run_labels.get)
+        if st.button("↩️ Tiếp tục phiên này"):
+            if load_run(selected_run):
+                st.rerun()
+            else:
+                st.error("❌ Không tìm thấy phiên chạy")
+    else:
+        st.caption("Chưa có phiên chạy nào được lưu")
+    
     st.divider()
     
     if st.button("🔄 Reset toàn bộ"):
+        discard_speculative_plan()
+        st.session_state.run_id = None
+        if "run_id" in st.query_params:
+            del st.query_params["run_id"]
         st.session_state.idea = None
         st.session_state.plan = None
         st.session_state.results = None
@@ -110,6 +779,8 @@ with tab1:
             with st.spinner("🤔 AI đang phân tích và tạo ý tưởng..."):
                 master_agent = MasterAgent(st.session_state.llm_client, st.session_state.master_model)
                 st.session_state.idea = master_agent.generate_idea(project_description)
+                st.session_state.run_id = st.session_state.run_store.create_run(project_description, st.session_state.idea)
+                st.query_params["run_id"] = st.session_state.run_id
                 st.success("✅ Đã tạo ý tưởng!")
                 st.rerun()
         except ValueError as e:
@@ -206,19 +877,45 @@ with tab2:
         
         st.divider()
         
+        plan_key = plan_job_key(idea)
+        if st.session_state.speculative_plan and st.session_state.llm_client:
+            if not st.session_state.plan or st.session_state.get('plan_source') != plan_key:
+                speculate_plan()
+        elif st.session_state.get('speculation'):
+            discard_speculative_plan()
+        
         col1, col2 = st.columns([1, 4])
         with col1:
             create_plan_btn = st.button("📋 Tạo kế hoạch", type="primary")
+        with col2:
+            speculation = st.session_state.get('speculation')
+            if speculation:
+                job = st.session_state.task_executor.jobs(speculation['key']).get(speculation['key'])
+                if job and job['status'] == 'completed':
+                    st.caption("⚡ Kế hoạch đã được tạo trước, bấm để dùng ngay")
+                elif job and job['status'] in ACTIVE_STATUSES:
+                    st.caption("⚡ Đang tạo trước kế hoạch trong nền...")
         
         if create_plan_btn and st.session_state.llm_client:
             try:
-                with st.spinner("📋 AI đang tạo kế hoạch chi tiết..."):
-                    master_agent = MasterAgent(st.session_state.llm_client, st.session_state.master_model)
-                    st.session_state.plan = master_agent.create_project_plan(st.session_state.idea)
-                    if 'task_states' in st.session_state:
-                        st.session_state.task_states = {}
-                    if 'orchestrator' in st.session_state:
-                        st.session_state.orchestrator = None
+                with st.status("📋 AI đang tạo kế hoạch chi tiết...") as plan_status:
+                    plan = await_speculative_plan(plan_status)
+                    if plan is None:
+                        master_agent = MasterAgent(st.session_state.llm_client, st.session_state.master_model)
+                        plan = master_agent.create_project_plan(
+                            st.session_state.idea,
+                            progress_callback=lambda message, _: plan_status.write(message)
+                        )
+                    st.session_state.plan = plan
+                    st.session_state.plan_source = plan_key
+                    plan_status.update(label="✅ Đã tạo kế hoạch", state="complete")
+                    if st.session_state.run_id:
+                        st.session_state.run_store.update_run(st.session_state.run_id, idea=st.session_state.idea,
+                                                              plan=st.session_state.plan, status="planned")
+                    kept_before = sum(1 for state in st.session_state.get('task_states', {}).values() if state['result'])
+                    stale = invalidate_stale_tasks()
+                    if kept_before:
+                        st.toast(f"♻️ Giữ lại {kept_before - len(stale)} kết quả, {len(stale)} tasks cần chạy lại")
                     st.success("✅ Đã tạo kế hoạch!")
                     st.rerun()
             except ValueError as e:
@@ -257,6 +954,9 @@ with tab3:
         
         st.divider()
         
+        if get_orchestrator():
+            render_preflight(st.session_state.orchestrator, plan)
+        
         col1, col2 = st.columns([1, 4])
         with col1:
             execute_plan_btn = st.button("▶️ Bắt đầu thực thi", type="primary")
@@ -274,109 +974,84 @@ with tab4:
         if 'task_states' not in st.session_state:
             st.session_state.task_states = {}
         
-        if 'orchestrator' not in st.session_state:
-            st.session_state.orchestrator = TaskOrchestrator(st.session_state.llm_client, st.session_state.worker_model) if st.session_state.llm_client else None
-        
-        context = {
-            "idea": st.session_state.idea,
-            "plan": st.session_state.plan
-        }
+        get_orchestrator()
+        st.fragment(render_execution_monitor, run_every=1.0 if st.session_state.task_executor.jobs(job_prefix()) else None)()
         
         st.markdown("*Bạn có thể thực thi từng task riêng lẻ, thêm ghi chú và thực thi lại nếu cần*")
+        
+        col_run_all, col_auto = st.columns([1, 2])
+        with col_run_all:
+            if st.button("⏩ Chạy tất cả tasks sẵn sàng", disabled=not st.session_state.llm_client):
+                if submit_ready_tasks():
+                    st.rerun()
+                elif get_run_budget() and get_run_budget().exhausted:
+                    st.warning("⛔ Đã chạm ngân sách lượt chạy, không chạy thêm task mới")
+                else:
+                    st.info("ℹ️ Không có task nào sẵn sàng (các task phụ thuộc chưa hoàn thành)")
+        with col_auto:
+            st.checkbox("Tự động chạy tiếp các task vừa sẵn sàng", key="auto_run_ready")
         st.divider()
         
-        all_tasks = []
-        for phase_idx, phase in enumerate(st.session_state.plan.get('phases', [])):
-            st.subheader(f"📦 Phase {phase_idx + 1}: {phase.get('name', 'Unknown')}")
-            st.markdown(f"*{phase.get('description', '')}*")
-            
-            tasks = phase.get('tasks', [])
-            for task_idx, task in enumerate(tasks):
+        phases = st.session_state.plan.get('phases', [])
+        phase_task_ids = []
+        for phase_idx, phase in enumerate(phases):
+            task_ids = []
+            for task_idx, task in enumerate(phase.get('tasks', [])):
                 task_id = task.get('task_id', f"phase{phase_idx}_task{task_idx}")
-                task_name = task.get('name', 'Unknown Task')
-                task_desc = task.get('description', '')
-                assigned_agent = task.get('assigned_agent', 'research')
-                
+                task_ids.append((task_id, task))
                 if task_id not in st.session_state.task_states:
                     st.session_state.task_states[task_id] = {
                         'status': 'pending',
                         'result': None,
                         'notes': ''
                     }
-                
-                task_state = st.session_state.task_states[task_id]
-                
-                with st.container():
-                    st.markdown(f"### 🎯 {task_name}")
-                    
-                    col1, col2, col3 = st.columns([2, 1, 1])
-                    
-                    with col1:
-                        status_emoji = {
-                            'pending': '⏳ Chờ thực thi',
-                            'running': '⚙️ Đang chạy...',
-                            'completed': '✅ Hoàn thành',
-                            'failed': '❌ Thất bại'
-                        }
-                        st.markdown(f"**Trạng thái:** {status_emoji.get(task_state['status'], 'Unknown')}")
-                        st.markdown(f"**Agent:** `{assigned_agent}`")
-                    
-                    with col2:
-                        if task_state['status'] == 'pending' or task_state['status'] == 'failed':
-                            if st.button(f"▶️ Thực thi", key=f"exec_{task_id}", type="primary"):
-                                st.session_state.task_states[task_id]['status'] = 'running'
-                                st.rerun()
-                    
-                    with col3:
-                        if task_state['status'] == 'completed':
-                            if st.button(f"🔄 Thực thi lại", key=f"reexec_{task_id}"):
-                                st.session_state.task_states[task_id]['status'] = 'running'
-                                st.session_state.task_states[task_id]['result'] = None
-                                st.rerun()
-                    
-                    if task_state['status'] == 'running' and st.session_state.orchestrator:
-                        with st.spinner(f"⚙️ Đang thực thi task: {task_name}..."):
-                            try:
-                                result = st.session_state.orchestrator.execute_single_task(task, context)
-                                st.session_state.task_states[task_id]['status'] = 'completed'
-                                st.session_state.task_states[task_id]['result'] = result
-                                st.success(f"✅ Hoàn thành task: {task_name}")
-                                st.rerun()
-                            except Exception as e:
-                                st.session_state.task_states[task_id]['status'] = 'failed'
-                                st.session_state.task_states[task_id]['result'] = {
-                                    'task_id': task_id,
-                                    'status': 'failed',
-                                    'result': str(e)
-                                }
-                                st.error(f"❌ Lỗi: {str(e)}")
-                    
-                    with st.expander("📝 Mô tả & Chi tiết"):
-                        st.markdown(f"**Mô tả task:** {task_desc}")
-                        if task.get('estimated_duration'):
-                            st.markdown(f"**Thời gian ước tính:** {task['estimated_duration']}")
-                        if task.get('dependencies'):
-                            st.markdown(f"**Phụ thuộc:** {', '.join(task['dependencies'])}")
-                    
-                    if task_state['result']:
-                        with st.expander("📊 Kết quả", expanded=True):
-                            st.markdown(task_state['result'].get('result', 'N/A'))
-                    
-                    notes = st.text_area(
-                        "💭 Ghi chú của bạn",
-                        value=task_state['notes'],
-                        key=f"notes_{task_id}",
-                        placeholder="Thêm ghi chú về task này...",
-                        height=80
-                    )
-                    if notes != task_state['notes']:
-                        st.session_state.task_states[task_id]['notes'] = notes
-                    
-                    st.divider()
+            phase_task_ids.append(task_ids)
+        
+        phase_labels = [
+            f"Phase {phase_idx + 1}: {phase.get('name', 'Unknown')} "
+            f"({sum(1 for task_id, _ in task_ids if st.session_state.task_states[task_id]['status'] == 'completed')}"
+            f"/{len(task_ids)})"
+            for phase_idx, (phase, task_ids) in enumerate(zip(phases, phase_task_ids))
+        ]
+        
+        col_phase, col_filter = st.columns([2, 2])
+        with col_phase:
+            phase_idx = st.selectbox("📦 Phase", range(len(phases)), format_func=phase_labels.__getitem__,
+                                     key=f"exec_phase_{len(phases)}")
+        with col_filter:
+            status_filter = st.radio(
+                "Lọc theo trạng thái",
+                ['all', 'pending', 'completed', 'failed'],
+                format_func=lambda status: 'Tất cả' if status == 'all' else STATUS_LABELS[status],
+                horizontal=True,
+                key="exec_status_filter"
+            )
+        
+        if phases:
+            phase = phases[phase_idx]
+            st.subheader(f"📦 Phase {phase_idx + 1}: {phase.get('name', 'Unknown')}")
+            st.markdown(f"*{phase.get('description', '')}*")
+            
+            visible_tasks = [
+                (task_id, task) for task_id, task in phase_task_ids[phase_idx]
+                if status_filter == 'all' or st.session_state.task_states[task_id]['status'] == status_filter
+            ]
+            page_count = max(1, -(-len(visible_tasks) // TASKS_PER_PAGE))
+            page = 1
+            if page_count > 1:
+                page = st.number_input(f"Trang (1-{page_count})", min_value=1, max_value=page_count, value=1,
+                                       key=f"exec_page_{phase_idx}_{status_filter}")
+            
+            for task_id, task in visible_tasks[(page - 1) * TASKS_PER_PAGE:page * TASKS_PER_PAGE]:
+                render_task_card(task_id, task)
+            
+            if not visible_tasks:
+                st.caption("Không có task nào phù hợp bộ lọc")
         
         st.divider()
-        completed_tasks = sum(1 for state in st.session_state.task_states.values() if state['status'] == 'completed')
-        total_tasks = len(st.session_state.task_states)
+        all_task_ids = [task_id for task_ids in phase_task_ids for task_id, _ in task_ids]
+        completed_tasks = sum(1 for task_id in all_task_ids if st.session_state.task_states[task_id]['status'] == 'completed')
+        total_tasks = len(all_task_ids)
         
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -392,13 +1067,18 @@ with tab4:
             
             if st.button("📄 Tạo báo cáo tổng kết", type="primary"):
                 if st.session_state.orchestrator and st.session_state.idea and st.session_state.plan:
-                    with st.spinner("📄 Đang tạo báo cáo..."):
+                    with st.status("📄 Đang tạo báo cáo...") as report_status:
                         results = [state['result'] for state in st.session_state.task_states.values() if state['result']]
                         st.session_state.report = st.session_state.orchestrator.generate_final_report(
                             st.session_state.idea,
                             st.session_state.plan,
-                            results
+                            results,
+                            progress_callback=lambda message, _: report_status.write(message)
                         )
+                        report_status.update(label="✅ Đã tạo báo cáo", state="complete")
+                        if st.session_state.run_id:
+                            st.session_state.run_store.update_run(st.session_state.run_id, report=st.session_state.report,
+                                                                  status="completed")
                         st.balloons()
                         st.success("✅ Đã tạo báo cáo! Xem tại tab 'Báo cáo'")
     else:
@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, Optional, TextIO, Tuple
+
+from dotenv import load_dotenv
+
+from agents.cost_estimator import RunBudget
+from agents.master_agent import MasterAgent
+from agents.orchestrator import TaskOrchestrator
+from agents.routing import RoutingPolicy
+from utils.fake_llm import FakeLLMClient
+from utils.hedging import HedgePolicy
+from utils.llm_cache import LLMCache
+from utils.llm_client import LLMClient
+from utils.quota_scheduler import QuotaScheduler
+from utils.run_store import RunStore
+from utils.similarity_index import SimilarityIndex
+from utils.telemetry import Telemetry, call_context
+
+DESCRIPTION_FIELDS = ("description", "project_description", "body", "brief", "prompt")
+ID_FIELDS = ("id", "project_id", "request_id")
+
+
+def read_projects(path: str) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield f"line{line_number}", None, f"Dòng {line_number} không phải JSON hợp lệ: {e}"
+                continue
+            if isinstance(record, str):
+                record = {"description": record}
+            project_id = next((str(record[field]) for field in ID_FIELDS if record.get(field)), f"line{line_number}")
+            description = next((record[field] for field in DESCRIPTION_FIELDS if record.get(field)), None)
+            if description and record.get("title") and description != record["title"]:
+                description = f"{record['title']}\n\n{description}"
+            if not description:
+                yield project_id, None, f"Dòng {line_number} không có mô tả dự án"
+                continue
+            yield project_id, description, None
+
+
+class NDJSONWriter:
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def write(self, record: Dict):
+        self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.stream.flush()
+
+
+class PipelineRunner:
+    def __init__(self, llm_client: LLMClient, writer: NDJSONWriter, master_model: str = "gpt-4o",
+                 worker_model: str = "gpt-4o-mini", max_projects: int = 8, max_tasks_per_project: int = 4,
+                 run_store: Optional[RunStore] = None, run_prefix: str = "",
+                 routing: Optional[RoutingPolicy] = None, similarity_index: Optional[SimilarityIndex] = None,
+                 hierarchical_plan: bool = True, budget_options: Optional[Dict] = None):
+        self.llm_client = llm_client
+        self.writer = writer
+        self.master_model = master_model
+        self.worker_model = worker_model
+        self.max_projects = max(1, max_projects)
+        self.max_tasks_per_project = max(1, max_tasks_per_project)
+        self.run_store = run_store
+        self.run_prefix = run_prefix
+        self.routing = routing
+        self.similarity_index = similarity_index
+        self.hierarchical_plan = hierarchical_plan
+        self.budget_options = budget_options or {}
+
+    def _resume(self, project_id: str, description: str) -> Tuple[Optional[str], Dict]:
+        if not self.run_store:
+            return None, {}
+        run_id = f"{self.run_prefix}{project_id}"
+        run = self.run_store.load_run(run_id)
+        if run is None:
+            self.run_store.create_run(description, run_id=run_id)
+            return run_id, {}
+        return run_id, run
+
+    async def run_project(self, project_id: str, description: str) -> Dict:
+        started_at = time.monotonic()
+        run_id, run = self._resume(project_id, description)
+        stage = "idea"
+        try:
+            master_agent = MasterAgent(self.llm_client, self.master_model)
+            idea = run.get("idea") or await master_agent.agenerate_idea(description)
+            if run_id and not run.get("idea"):
+                self.run_store.update_run(run_id, idea=idea, status="planning")
+
+            stage = "plan"
+            plan = run.get("plan") or await master_agent.acreate_project_plan(idea, self.hierarchical_plan)
+            if run_id and not run.get("plan"):
+                self.run_store.update_run(run_id, plan=plan, status="planned")
+
+            stage = "execute"
+            orchestrator = TaskOrchestrator(self.llm_client, self.worker_model, run_store=self.run_store,
+                                            routing=self.routing, similarity_index=self.similarity_index)
+
+            def emit_task(task_id: str, result: Dict):
+                self.writer.write({
+                    "type": "task",
+                    "project_id": project_id,
+                    "task_id": task_id,
+                    "agent_type": result.get("agent_type"),
+                    "status": result.get("status"),
+                    "result": result.get("result"),
+                    "usage": result.get("usage", {})
+                })
+
+            estimate = orchestrator.estimate_plan(plan, {"idea": idea, "plan": plan}, self.max_tasks_per_project)
+            budget = RunBudget(**self.budget_options) if self.budget_options else None
+            results = await orchestrator.aexecute_plan(
+                plan, {"idea": idea, "plan": plan},
+                max_concurrency=self.max_tasks_per_project, run_id=run_id, result_callback=emit_task, budget=budget
+            )
+
+            stage = "report"
+            report = run.get("report") or await orchestrator.agenerate_final_report(idea, plan, results)
+            if run_id:
+                self.run_store.update_run(run_id, report=report)
+
+            record = {
+                "type": "report",
+                "project_id": project_id,
+                "project_name": idea.get("project_name"),
+                "run_id": run_id,
+                "tasks_completed": sum(1 for result in results if result.get("status") == "completed"),
+                "tasks_failed": sum(1 for result in results if result.get("status") != "completed"),
+                "elapsed_seconds": round(time.monotonic() - started_at, 2),
+                "estimate": estimate["totals"],
+                "budget": budget.summary() if budget else None,
+                "report": report
+            }
+        except Exception as e:
+            if run_id:
+                self.run_store.update_run(run_id, status="failed")
+            record = {
+                "type": "error",
+                "project_id": project_id,
+                "run_id": run_id,
+                "stage": stage,
+                "error": str(e),
+                "elapsed_seconds": round(time.monotonic() - started_at, 2)
+            }
+        self.writer.write(record)
+        return record
+
+    async def run(self, projects) -> Dict:
+        semaphore = asyncio.Semaphore(self.max_projects)
+        summary = {"projects": 0, "succeeded": 0, "failed": 0}
+
+        async def guarded(project_id: str, description: str):
+            async with semaphore:
+                with call_context(tenant=project_id, priority="bulk"):
+                    return await self.run_project(project_id, description)
+
+        pending = set()
+        for project_id, description, error in projects:
+            summary["projects"] += 1
+            if error:
+                summary["failed"] += 1
+                self.writer.write({"type": "error", "project_id": project_id, "stage": "input", "error": error})
+                continue
+            pending.add(asyncio.ensure_future(guarded(project_id, description)))
+            if len(pending) >= self.max_projects * 2:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    summary["succeeded" if future.result()["type"] == "report" else "failed"] += 1
+
+        for future in asyncio.as_completed(pending):
+            record = await future
+            summary["succeeded" if record["type"] == "report" else "failed"] += 1
+        await self.llm_client.aclose()
+        return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy pipeline ý tưởng → kế hoạch → thực thi → báo cáo không cần giao diện")
+    parser.add_argument("input", help="File JSONL, mỗi dòng là một mô tả dự án")
+    parser.add_argument("-o", "--output", help="File NDJSON kết quả (mặc định: stdout)")
+    parser.add_argument("--master-model", default="gpt-4o")
+    parser.add_argument("--worker-model", default="gpt-4o-mini")
+    parser.add_argument("--escalation-model",
+                        help="Bật cascade: chạy --worker-model trước, nâng cấp lên model này khi kết quả không đạt")
+    parser.add_argument("--routing", help="File JSON cấu hình model/max_tokens/temperature cho từng loại agent")
+    parser.add_argument("--similarity-index",
+                        help="File SQLite chỉ mục task tương tự để dùng lại/điều chỉnh kết quả cũ")
+    parser.add_argument("--reuse-threshold", type=float, default=0.9,
+                        help="Độ tương tự tối thiểu để dùng lại nguyên kết quả cũ (khi bật --auto-reuse)")
+    parser.add_argument("--auto-reuse", action="store_true",
+                        help="Tự động dùng lại nguyên kết quả gần giống hệt thay vì chỉ dùng làm tham khảo")
+    parser.add_argument("--adapt-threshold", type=float, default=0.6,
+                        help="Độ tương tự tối thiểu để dùng kết quả cũ làm tham khảo")
+    parser.add_argument("--flat-plan", action="store_true",
+                        help="Tạo kế hoạch bằng một lượt gọi duy nhất thay vì khung + chi tiết hóa song song")
+    parser.add_argument("--max-projects", type=int, default=8, help="Số dự án chạy đồng thời")
+    parser.add_argument("--max-tasks", type=int, default=4, help="Số task chạy đồng thời trong mỗi dự án")
+    parser.add_argument("--max-requests", type=int, default=32,
+                        help="Giới hạn tổng số request LLM đồng thời cho mỗi provider")
+    parser.add_argument("--run-store", help="File SQLite để checkpoint và tiếp tục khi chạy lại")
+    parser.add_argument("--run-prefix", default="", help="Tiền tố run ID trong run store")
+    parser.add_argument("--events-path", help="File JSONL ghi sự kiện telemetry của từng lượt gọi LLM")
+    parser.add_argument("--fake", action="store_true",
+                        help="Dùng LLM giả lập (cấu hình qua biến môi trường FAKE_LLM_*) thay vì gọi API thật")
+    parser.add_argument("--hedge-percentile", type=float,
+                        help="Bật hedged request: gửi bản sao khi lượt gọi chưa có token đầu sau phân vị độ trễ này (vd 0.95)")
+    parser.add_argument("--max-run-tokens", type=int,
+                        help="Ngân sách tokens cho mỗi dự án; task ước tính vượt ngân sách sẽ không được chạy")
+    parser.add_argument("--max-run-cost", type=float, help="Ngân sách chi phí ($) cho mỗi dự án")
+    parser.add_argument("--budget-fallback-model",
+                        help="Model rẻ hơn để chạy task khi model chính vượt ngân sách thay vì dừng")
+    parser.add_argument("--metrics-port", type=int, help="Mở endpoint /metrics (Prometheus) và /metrics.json")
+    parser.add_argument("--metrics-host",
+                        help="Địa chỉ lắng nghe của endpoint metrics (mặc định METRICS_HOST hoặc 127.0.0.1)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    args = parse_args(argv)
+    telemetry = Telemetry(events_path=args.events_path)
+    if args.metrics_port:
+        telemetry.serve(args.metrics_port, args.metrics_host)
+    max_concurrency = {"openai": args.max_requests, "anthropic": args.max_requests}
+    scheduler = QuotaScheduler(max_concurrency)
+    client_options = {
+        "max_concurrency": max_concurrency,
+        "scheduler": scheduler,
+        "cache": LLMCache.from_env(),
+        "telemetry": telemetry,
+        "hedging": HedgePolicy(args.hedge_percentile) if args.hedge_percentile else HedgePolicy.from_env()
+    }
+    if args.fake or os.getenv("LLM_BACKEND") == "fake":
+        llm_client = FakeLLMClient.from_env(**client_options)
+    else:
+        llm_client = LLMClient(**client_options)
+    run_store = RunStore(args.run_store) if args.run_store else None
+    similarity_index = SimilarityIndex(
+        args.similarity_index, args.reuse_threshold, args.adapt_threshold, auto_reuse=args.auto_reuse
+    ) if args.similarity_index else None
+    routes = {}
+    if args.routing:
+        with open(args.routing, encoding="utf-8") as f:
+            routes = json.load(f)
+    if args.escalation_model:
+        routing = RoutingPolicy.cheap_first(args.worker_model, args.escalation_model, routes)
+    else:
+        routing = RoutingPolicy(routes, args.worker_model) if routes else None
+
+    budget_options = {
+        key: value for key, value in (
+            ("max_tokens", args.max_run_tokens), ("max_cost", args.max_run_cost),
+            ("fallback_model", args.budget_fallback_model)
+        ) if value
+    } if args.max_run_tokens or args.max_run_cost else None
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        runner = PipelineRunner(
+            llm_client, NDJSONWriter(output), args.master_model, args.worker_model,
+            args.max_projects, args.max_tasks, run_store, args.run_prefix, routing, similarity_index,
+            not args.flat_plan, budget_options
+        )
+        summary = asyncio.run(runner.run(read_projects(args.input)))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if similarity_index:
+        summary["similarity"] = similarity_index.stats()
+    summary["quota"] = {key: value for key, value in scheduler.stats().items() if key != "queued_by_tenant"}
+    print(json.dumps({"type": "summary", **summary, "llm": telemetry.summary()["totals"]}, ensure_ascii=False),
+          file=sys.stderr)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import io
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+from openai.types.chat import ChatCompletion
+
+from utils.llm_client import LLMClient
+
+
+class BatchTransport(ABC):
+    @abstractmethod
+    def submit(self, requests: List[Dict]) -> str:
+        ...
+
+    @abstractmethod
+    def poll(self, batch_id: str) -> str:
+        ...
+
+    @abstractmethod
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        ...
+
+
+class OpenAIBatchTransport(BatchTransport):
+    STATUS = {
+        "completed": "completed",
+        "failed": "failed",
+        "expired": "failed",
+        "cancelled": "failed",
+        "cancelling": "failed"
+    }
+
+    def __init__(self, client):
+        if client is None:
+            raise ValueError("OpenAI API key chưa được cấu hình. Vui lòng thêm API key ở sidebar.")
+        self.client = client
+
+    def submit(self, requests: List[Dict]) -> str:
+        lines = [
+            json.dumps({
+                "custom_id": request["custom_id"],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": LLMClient._openai_kwargs(
+                    request["messages"], request["model"], request["temperature"], request["max_tokens"]
+                )
+            }, ensure_ascii=False)
+            for request in requests
+        ]
+        input_file = self.client.files.create(
+            file=("batch.jsonl", io.BytesIO("\n".join(lines).encode("utf-8"))),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        return self.STATUS.get(self.client.batches.retrieve(batch_id).status, "in_progress")
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if entry.get("error") or response.get("status_code", 200) >= 400:
+                    error = entry.get("error") or response.get("body", {}).get("error")
+                    results[entry["custom_id"]] = {"error": str(error)}
+                    continue
+                completion = ChatCompletion.model_validate(response["body"])
+                results[entry["custom_id"]] = {
+                    "content": LLMClient._openai_text(completion),
+                    "usage": LLMClient._openai_usage(completion.usage)
+                }
+        return results
+
+
+class AnthropicBatchTransport(BatchTransport):
+    def __init__(self, client):
+        if client is None:
+            raise ValueError("Anthropic API key chưa được cấu hình. Vui lòng thêm API key ở sidebar.")
+        self.client = client
+
+    def submit(self, requests: List[Dict]) -> str:
+        batch = self.client.messages.batches.create(requests=[
+            {
+                "custom_id": request["custom_id"],
+                "params": LLMClient._anthropic_kwargs(
+                    request["messages"], request["model"], request["temperature"], request["max_tokens"]
+                )
+            }
+            for request in requests
+        ])
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        status = self.client.messages.batches.retrieve(batch_id).processing_status
+        return "completed" if status == "ended" else "in_progress"
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = {
+                    "content": LLMClient._anthropic_text(entry.result.message),
+                    "usage": LLMClient._anthropic_usage(entry.result.message.usage)
+                }
+            else:
+                error = getattr(entry.result, "error", None) or entry.result.type
+                results[entry.custom_id] = {"error": str(error)}
+        return results
+
+
+class FileBatchTransport(BatchTransport):
+    def __init__(self, directory: str = ".batches"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, requests: List[Dict]) -> str:
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        with open(self._path(batch_id, "input"), "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        return batch_id
+
+    def poll(self, batch_id: str) -> str:
+        return "completed" if os.path.exists(self._path(batch_id, "output")) else "in_progress"
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        results = {}
+        with open(self._path(batch_id, "output"), encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    results[entry["custom_id"]] = entry
+        return results
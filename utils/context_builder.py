@@ -0,0 +1,252 @@
+import json
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from utils.task_graph import plan_task_id
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base" if model.startswith(("gpt-4o", "o1")) else "cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return max(1, int(len(text) / 3.5))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _clip(text, max_chars: int) -> str:
+    text = str(text or "")
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class ContextBuilder:
+    TRUNCATION_STEPS = 7
+
+    def __init__(self, max_tokens: int = 1500, model: str = "gpt-4o-mini", shared_max_tokens: int = 2000):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.shared_max_tokens = shared_max_tokens
+        self._shared_cache: Dict[str, str] = {}
+
+    @staticmethod
+    def _locate(task: Dict, plan: Dict):
+        task_id = task.get("task_id")
+        for phase_idx, phase in enumerate(plan.get("phases", [])):
+            for task_idx, candidate in enumerate(phase.get("tasks", [])):
+                if candidate is task or (task_id and plan_task_id(candidate, phase_idx, task_idx) == task_id):
+                    return phase
+        for phase in plan.get("phases", []):
+            if any(candidate.get("name") == task.get("name") for candidate in phase.get("tasks", [])):
+                return phase
+        return None
+
+    @staticmethod
+    def find_tasks(plan: Dict, task_ids: List[str]) -> List[Dict]:
+        wanted = set(task_ids)
+        found = []
+        for phase_idx, phase in enumerate(plan.get("phases", [])):
+            for task_idx, candidate in enumerate(phase.get("tasks", [])):
+                if plan_task_id(candidate, phase_idx, task_idx) in wanted:
+                    found.append({**candidate, "task_id": plan_task_id(candidate, phase_idx, task_idx)})
+        return found
+
+    def project_slice(self, context: Dict) -> Dict:
+        idea = context.get("idea") or {}
+        if not isinstance(idea, dict):
+            return {"idea": _clip(idea, 2000)}
+        project = {
+            "name": idea.get("project_name"),
+            "overview": idea.get("overview"),
+            "target_users": idea.get("target_users"),
+            "features": idea.get("key_features") or [],
+            "tech_stack": idea.get("tech_stack_suggestions") or []
+        }
+        return {key: value for key, value in project.items() if value}
+
+    def plan_outline(self, context: Dict) -> List[Dict]:
+        plan = context.get("plan") or {}
+        if not isinstance(plan, dict):
+            return []
+        return [
+            {
+                "phase": phase.get("name"),
+                "tasks": [
+                    f"{plan_task_id(candidate, phase_idx, task_idx)}: {candidate.get('name')} ({candidate.get('assigned_agent')})"
+                    for task_idx, candidate in enumerate(phase.get("tasks", []))
+                ]
+            }
+            for phase_idx, phase in enumerate(plan.get("phases", []))
+        ]
+
+    def task_slice(self, task: Dict, context: Dict, include_siblings: bool = True) -> Dict:
+        plan = context.get("plan") or {}
+        if not isinstance(plan, dict):
+            return {}
+
+        sliced = {}
+        phase = self._locate(task, plan)
+        if phase:
+            sliced["phase"] = {
+                "name": phase.get("name"),
+                "description": phase.get("description")
+            }
+            if include_siblings:
+                sliced["phase"]["tasks"] = [
+                    candidate.get("name") for candidate in phase.get("tasks", [])
+                    if candidate.get("name") != task.get("name")
+                ]
+
+        dependencies = task.get("dependencies") or []
+        if isinstance(dependencies, str):
+            dependencies = [dependencies]
+        if dependencies:
+            sliced["dependencies"] = [
+                {
+                    "task_id": dep["task_id"],
+                    "name": dep.get("name"),
+                    "agent": dep.get("assigned_agent"),
+                    "description": dep.get("description")
+                }
+                for dep in self.find_tasks(plan, dependencies)
+            ]
+        return sliced
+
+    def _extra_slice(self, context: Dict) -> Dict:
+        return {key: value for key, value in context.items() if key not in ("idea", "plan") and value}
+
+    @staticmethod
+    def _shrink(parts: Dict, step: int):
+        project = parts["project"]
+        phase = parts.get("phase") or {}
+        dependencies = parts.get("dependencies") or []
+
+        if step == 0:
+            parts.pop("extra", None)
+        elif step == 1:
+            phase.pop("tasks", None)
+        elif step == 2:
+            for dep in dependencies:
+                dep["description"] = _clip(dep.get("description"), 200)
+        elif step == 3 and project:
+            if "overview" in project:
+                project["overview"] = _clip(project["overview"], 400)
+            for key in ("features", "tech_stack"):
+                if isinstance(project.get(key), list):
+                    project[key] = project[key][:6]
+        elif step == 4:
+            if phase:
+                phase["description"] = _clip(phase.get("description"), 200)
+        elif step == 5:
+            for dep in dependencies:
+                dep.pop("description", None)
+        elif step == 6:
+            project.pop("target_users", None)
+
+    def _fits(self, parts: Dict, budget: int, model: str) -> bool:
+        return count_tokens(_dumps(parts), model) <= budget
+
+    @staticmethod
+    def _trim(data) -> bool:
+        strings, lists, dicts = [], [], []
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            items = node.items() if isinstance(node, dict) else enumerate(node)
+            for key, value in items:
+                if isinstance(value, str):
+                    strings.append((len(value), node, key))
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+            if isinstance(node, list) and node:
+                lists.append(node)
+            elif isinstance(node, dict) and node and node is not data:
+                dicts.append(node)
+        length, node, key = max(strings, key=lambda entry: entry[0], default=(0, None, None))
+        if length > 80:
+            node[key] = _clip(node[key], int(length * 0.6))
+            return True
+        if lists:
+            max(lists, key=lambda items: len(_dumps(items))).pop()
+            return True
+        if dicts:
+            node = max(dicts, key=lambda items: len(_dumps(items)))
+            node.pop(max(node, key=lambda name: len(_dumps(node[name]))))
+            return True
+        if isinstance(data, dict) and data:
+            data.pop(max(data, key=lambda name: len(_dumps(data[name]))))
+            return True
+        return False
+
+    @classmethod
+    def _cut(cls, data: Dict, budget: int, model: str) -> str:
+        serialized = _dumps(data)
+        if count_tokens(serialized, model) <= budget:
+            return serialized
+        data = json.loads(serialized)
+        while count_tokens(serialized, model) > budget and cls._trim(data):
+            serialized = _dumps(data)
+        return serialized if count_tokens(serialized, model) <= budget else ""
+
+    def build_shared(self, context: Optional[Dict], model: Optional[str] = None) -> str:
+        if not context or not isinstance(context, dict):
+            return ""
+
+        model = model or self.model
+        cache_key = f"{model}:{self.shared_max_tokens}:{_dumps([context.get('idea'), context.get('plan')])}"
+        if cache_key in self._shared_cache:
+            return self._shared_cache[cache_key]
+
+        parts = {"project": self.project_slice(context), "plan": self.plan_outline(context)}
+        if not self._fits(parts, self.shared_max_tokens, model):
+            parts["plan"] = [{"phase": phase["phase"], "tasks": len(phase["tasks"])} for phase in parts["plan"]]
+        for step in (3, 6):
+            if self._fits(parts, self.shared_max_tokens, model):
+                break
+            self._shrink(parts, step)
+
+        shared = self._cut({key: value for key, value in parts.items() if value}, self.shared_max_tokens, model)
+        if len(self._shared_cache) >= 64:
+            self._shared_cache.clear()
+        self._shared_cache[cache_key] = shared
+        return shared
+
+    def build(self, task: Dict, context: Optional[Dict], model: Optional[str] = None,
+              max_tokens: Optional[int] = None, include_project: bool = True) -> str:
+        if not context:
+            return ""
+        if not isinstance(context, dict):
+            return _clip(context, 4000)
+
+        model = model or self.model
+        budget = max_tokens or self.max_tokens
+        parts = {"project": self.project_slice(context) if include_project else {},
+                 **self.task_slice(task, context, include_siblings=include_project)}
+        extra = self._extra_slice(context)
+        if extra:
+            parts["extra"] = extra
+
+        for step in range(self.TRUNCATION_STEPS):
+            if self._fits(parts, budget, model):
+                break
+            self._shrink(parts, step)
+
+        return self._cut({key: value for key, value in parts.items() if value}, budget, model)
@@ -0,0 +1,183 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.context_builder import count_tokens
+from utils.task_graph import content_hash
+
+CODE_BLOCK = re.compile(r"```([\w+#.-]*)[^\n]*\n(.*?)```", re.S)
+HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$", re.M)
+LIST_ITEM = re.compile(r"^\s*(?:[-*+•]|\d+[.)])\s+(.+)$")
+DECISION = re.compile(
+    r"quyết định|lựa chọn|chọn|sử dụng|khuyến nghị|đề xuất|kết luận|lưu ý|rủi ro|"
+    r"decid|decision|chose|choose|recommend|conclusion|trade-?off|risk",
+    re.I
+)
+FILE_NAME = re.compile(
+    r"(?<![\w/.-])((?:[\w.-]+/)*[\w-]+\.(?:py|ipynb|js|jsx|ts|tsx|java|kt|go|rs|rb|php|cs|cpp|c|h|swift|html|css|"
+    r"scss|sql|json|ya?ml|toml|ini|md|sh|txt|env|dockerfile))(?![\w-])",
+    re.I
+)
+
+
+def _clip_tokens(text: str, budget: int, model: str) -> str:
+    if budget <= 0:
+        return ""
+    tokens = count_tokens(text, model)
+    if tokens <= budget:
+        return text
+    return text[:max(1, int(len(text) * budget / tokens * 0.95))].rstrip() + "…"
+
+
+def _clip_lines(code: str, budget: int, model: str) -> str:
+    if count_tokens(code, model) <= budget:
+        return code
+    kept, used = [], 0
+    for line in code.splitlines():
+        size = count_tokens(line + "\n", model)
+        if kept and used + size > budget:
+            break
+        kept.append(line)
+        used += size
+    return "\n".join(kept) + "\n…"
+
+
+class DigestStore:
+    def __init__(self, model: str = "gpt-4o-mini", summary_tokens: int = 300, artifact_tokens: int = 600,
+                 max_artifacts: int = 4, max_decisions: int = 8, max_files: int = 20, max_entries: int = 5000):
+        self.model = model
+        self.summary_tokens = summary_tokens
+        self.artifact_tokens = artifact_tokens
+        self.max_artifacts = max_artifacts
+        self.max_decisions = max_decisions
+        self.max_files = max_files
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def extract(self, text: str) -> Dict:
+        artifacts = [
+            {"language": language or "", "code": _clip_lines(code.strip("\n"), self.artifact_tokens, self.model)}
+            for language, code in CODE_BLOCK.findall(text) if code.strip()
+        ][:self.max_artifacts]
+        prose = CODE_BLOCK.sub("", text)
+        headings = [heading.strip("*_ ") for heading in HEADING.findall(prose)]
+
+        decisions: List[str] = []
+        paragraphs: List[str] = []
+        for block in re.split(r"\n\s*\n", prose):
+            lines = [line for line in block.strip().splitlines() if line.strip() and not HEADING.match(line)]
+            for line in lines:
+                item = LIST_ITEM.match(line)
+                if item and DECISION.search(item.group(1)) and len(decisions) < self.max_decisions:
+                    decision = item.group(1).replace("**", "").strip()[:240]
+                    if decision not in decisions:
+                        decisions.append(decision)
+            if lines and not all(LIST_ITEM.match(line) for line in lines):
+                paragraphs.append(" ".join(line.strip() for line in lines).replace("**", ""))
+
+        summary, used = [], 0
+        if headings:
+            outline = "Các mục: " + "; ".join(headings[:12])
+            summary.append(outline)
+            used += count_tokens(outline, self.model)
+        for paragraph in paragraphs:
+            clipped = _clip_tokens(paragraph, self.summary_tokens - used, self.model)
+            if clipped:
+                summary.append(clipped)
+                used += count_tokens(clipped, self.model)
+            if clipped != paragraph:
+                break
+
+        files: List[str] = []
+        for name in FILE_NAME.findall(text):
+            if name not in files and len(files) < self.max_files:
+                files.append(name)
+
+        return {
+            "hash": content_hash(text),
+            "summary": "\n".join(part for part in summary if part),
+            "decisions": decisions,
+            "files": files,
+            "artifacts": artifacts,
+            "tokens": count_tokens(text, self.model)
+        }
+
+    def digest(self, task_id: str, result: Optional[Dict]) -> Optional[Dict]:
+        if not result or result.get("status") != "completed" or not result.get("result"):
+            return None
+        text = str(result["result"])
+        key = content_hash(text)
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry and entry["hash"] == key:
+                self._entries.move_to_end(task_id)
+                self.hits += 1
+                return entry
+        stored = result.get("digest")
+        if isinstance(stored, dict) and stored.get("hash") == key:
+            entry = stored
+        else:
+            entry = self.extract(text)
+        with self._lock:
+            if entry is stored:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._entries[task_id] = entry
+            self._entries.move_to_end(task_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def forget(self, task_ids: Iterable[str]):
+        with self._lock:
+            for task_id in task_ids:
+                self._entries.pop(task_id, None)
+
+    def render(self, digest: Dict, max_tokens: int, title: str = "", include_code: bool = True) -> str:
+        parts = [title] if title else []
+        used = count_tokens(title, self.model)
+        has_details = digest["decisions"] or digest["files"] or (include_code and digest["artifacts"])
+        summary_budget = (max_tokens - used) // 2 if has_details else max_tokens - used
+        summary = _clip_tokens(digest["summary"], summary_budget, self.model)
+        if summary:
+            parts.append(summary)
+            used += count_tokens(summary, self.model)
+
+        sections = []
+        if digest["decisions"]:
+            sections.append("Quyết định:\n" + "\n".join(f"- {decision}" for decision in digest["decisions"]))
+        if digest["files"]:
+            sections.append("File: " + ", ".join(digest["files"]))
+        for section in sections:
+            size = count_tokens(section, self.model)
+            if used + size <= max_tokens:
+                parts.append(section)
+                used += size
+
+        for artifact in digest["artifacts"] if include_code else []:
+            room = max_tokens - used - 10
+            if room < 50:
+                break
+            block = f"```{artifact['language']}\n{_clip_lines(artifact['code'], room, self.model)}\n```"
+            parts.append(block)
+            used += count_tokens(block, self.model)
+        return "\n".join(parts)
+
+    def render_many(self, entries: List[Tuple[str, Dict]], max_tokens: int, include_code: bool = True) -> str:
+        rendered = []
+        remaining = max_tokens
+        for index, (title, digest) in enumerate(entries):
+            share = remaining // (len(entries) - index)
+            text = self.render(digest, share, title, include_code)
+            rendered.append(text)
+            remaining -= min(share, count_tokens(text, self.model))
+        return "\n\n".join(rendered)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
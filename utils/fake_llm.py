@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Union
+
+from agents.routing import AGENT_TYPES
+from utils.context_builder import count_tokens
+from utils.hedging import abort_on_loss
+from utils.llm_client import EMPTY_USAGE, LLMClient
+from utils.task_graph import content_hash
+
+TASK_ID = re.compile(r'"task_id": "([^"]+)"')
+WORDS = ("hệ thống", "người dùng", "dữ liệu", "giao diện", "kiểm thử", "hiệu năng", "bảo mật", "tích hợp",
+         "module", "API", "triển khai", "tối ưu", "yêu cầu", "thiết kế", "báo cáo", "phân tích")
+
+Distribution = Union[float, Callable[[random.Random], float]]
+
+
+def fixed(seconds: float) -> Callable[[random.Random], float]:
+    return lambda rng: seconds
+
+
+def uniform(low: float, high: float) -> Callable[[random.Random], float]:
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(median: float, sigma: float = 0.5) -> Callable[[random.Random], float]:
+    return lambda rng: median * rng.lognormvariate(0, sigma)
+
+
+def exponential(mean: float) -> Callable[[random.Random], float]:
+    return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0.0
+
+
+def synthetic_idea(name: str = "Dự án mẫu") -> Dict:
+    return {
+        "project_name": name,
+        "overview": "Ứng dụng web quản lý công việc với nhắc việc, phân loại ưu tiên và báo cáo tiến độ.",
+        "key_features": ["Quản lý task", "Nhắc việc", "Phân loại ưu tiên", "Báo cáo tiến độ", "Chia sẻ nhóm"],
+        "target_users": "Nhân viên văn phòng và nhóm nhỏ",
+        "value_proposition": "Giảm thời gian quản lý công việc hằng ngày",
+        "tech_stack_suggestions": ["Python", "FastAPI", "React", "PostgreSQL"]
+    }
+
+
+def synthetic_plan(num_tasks: int, tasks_per_phase: int = 10, max_dependencies: int = 2, seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    phases = []
+    previous_ids: List[str] = []
+    for phase_idx in range(max(1, -(-num_tasks // tasks_per_phase))):
+        tasks = []
+        for task_idx in range(min(tasks_per_phase, num_tasks - phase_idx * tasks_per_phase)):
+            task_id = f"p{phase_idx + 1}_t{task_idx + 1}"
+            dependencies = rng.sample(previous_ids, min(len(previous_ids), rng.randint(0, max_dependencies)))
+            tasks.append({
+                "task_id": task_id,
+                "name": f"Task {phase_idx + 1}.{task_idx + 1}",
+                "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 40))),
+                "assigned_agent": AGENT_TYPES[(phase_idx + task_idx) % len(AGENT_TYPES)],
+                "estimated_duration": f"{rng.randint(1, 5)} ngày",
+                "dependencies": dependencies
+            })
+        phases.append({
+            "name": f"Phase {phase_idx + 1}",
+            "description": " ".join(rng.choice(WORDS) for _ in range(15)),
+            "tasks": tasks
+        })
+        previous_ids.extend(task["task_id"] for task in tasks)
+    return {
+        "phases": phases,
+        "timeline": f"{len(phases) * 2} tuần",
+        "resources_needed": ["Backend developer", "Frontend developer", "QA"]
+    }
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = type("FakeResponse", (), {"headers": headers or {}})()
+
+
+class FakeLLMClient(LLMClient):
+    def __init__(self, ttft: Distribution = 0.0, tokens_per_second: float = 0.0,
+                 output_tokens: Distribution = 300.0, failure_rate: float = 0.0,
+                 failure_status: int = 500, retry_after: Optional[float] = None, stall_rate: float = 0.0,
+                 stall_seconds: float = 5.0,
+                 idea: Optional[Dict] = None, plan: Optional[Dict] = None, plan_tasks: int = 12,
+                 time_scale: float = 1.0, seed: int = 0, **kwargs):
+        kwargs.setdefault("base_backoff", 0.01)
+        kwargs.setdefault("max_backoff", 0.05)
+        super().__init__(**kwargs)
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.retry_after = retry_after
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.idea = idea or synthetic_idea()
+        self.plan = plan or synthetic_plan(plan_tasks, seed=seed)
+        self.time_scale = time_scale
+        self.seed = seed
+        self.calls = 0
+        self.failures = 0
+        self.stalls = 0
+        self._attempts: Dict[str, int] = {}
+        self._fake_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "FakeLLMClient":
+        return cls(
+            ttft=lognormal(float(os.getenv("FAKE_LLM_TTFT", "0.3"))),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "150")),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+            stall_rate=float(os.getenv("FAKE_LLM_STALL_RATE", "0")),
+            stall_seconds=float(os.getenv("FAKE_LLM_STALL_SECONDS", "5")),
+            plan_tasks=int(os.getenv("FAKE_LLM_PLAN_TASKS", "12")),
+            **kwargs
+        )
+
+    def _provider(self, model: str) -> str:
+        return self.provider_name(model)
+
+    def available_models(self) -> List[str]:
+        return ["gpt-4o", "gpt-4o-mini", "claude-3-5-sonnet-20241022", "claude-3-5-haiku-20241022"]
+
+    @staticmethod
+    def _sample(distribution: Distribution, rng: random.Random) -> float:
+        return max(0.0, distribution(rng) if callable(distribution) else float(distribution))
+
+    def _rng(self, messages: List[Dict], model: str) -> random.Random:
+        key = content_hash([model, messages])
+        with self._fake_lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+            self.calls += 1
+        return random.Random(f"{self.seed}:{key}:{attempt}")
+
+    def _content(self, messages: List[Dict], json_schema: Optional[Dict], rng: random.Random) -> str:
+        if json_schema and json_schema.get("title") == "project_idea":
+            return json.dumps(self.idea, ensure_ascii=False)
+        if json_schema and json_schema.get("title") == "project_plan":
+            return json.dumps(self.plan, ensure_ascii=False)
+        if json_schema and json_schema.get("title") == "plan_skeleton":
+            listed = set(TASK_ID.findall(str(messages[-1].get("content", ""))))
+            return json.dumps(self._skeleton(listed), ensure_ascii=False)
+        if json_schema and json_schema.get("title") == "phase_detail":
+            requested = set(TASK_ID.findall(str(messages[-1].get("content", ""))))
+            tasks = [task for phase in self.plan["phases"] for task in phase["tasks"] if task["task_id"] in requested]
+            return json.dumps({"tasks": tasks}, ensure_ascii=False)
+
+        target = int(self._sample(self.output_tokens, rng))
+        words = [rng.choice(WORDS) for _ in range(max(1, target // 2))]
+        text = " ".join(words)
+        system = str(messages[0].get("content", "")) if messages else ""
+        if "software engineer" in system:
+            text += "\n\n```python\ndef main():\n    return \"ok\"\n```"
+        return text
+
+    def _skeleton(self, listed: Set[str]) -> Dict:
+        phases = []
+        for phase in self.plan["phases"]:
+            tasks = [
+                {key: task[key] for key in ("task_id", "name", "assigned_agent", "dependencies")}
+                for task in phase["tasks"] if task["task_id"] not in listed
+            ]
+            if tasks:
+                phases.append({"name": phase["name"], "description": phase.get("description", ""), "tasks": tasks})
+        return {
+            "phases": phases,
+            "timeline": self.plan.get("timeline", ""),
+            "resources_needed": self.plan.get("resources_needed", [])
+        }
+
+    def _plan_call(self, messages: List[Dict], model: str, max_tokens: int,
+                   json_schema: Optional[Dict] = None) -> Dict:
+        rng = self._rng(messages, model)
+        if rng.random() < self.failure_rate:
+            with self._fake_lock:
+                self.failures += 1
+            headers = {"retry-after": str(self.retry_after)} if self.retry_after is not None else {}
+            raise FakeAPIError(self.failure_status, f"Lỗi giả lập {self.failure_status}", headers)
+
+        content = self._content(messages, json_schema, rng)
+        output_tokens = count_tokens(content, model)
+        if output_tokens > max_tokens:
+            content = content[:len(content) * max_tokens // output_tokens]
+            output_tokens = max_tokens
+        input_tokens = count_tokens("".join(str(msg.get("content", "")) for msg in messages), model)
+        ttft = self._sample(self.ttft, rng) * self.time_scale
+        if self.stall_rate and rng.random() < self.stall_rate:
+            with self._fake_lock:
+                self.stalls += 1
+            ttft += self.stall_seconds * self.time_scale
+        generation = (output_tokens / self.tokens_per_second if self.tokens_per_second else 0.0) * self.time_scale
+        return {
+            "content": content,
+            "usage": {**EMPTY_USAGE, "input_tokens": input_tokens, "output_tokens": output_tokens},
+            "ttft": ttft,
+            "generation": generation
+        }
+
+    @staticmethod
+    def _chunks(content: str, count: int = 8) -> List[str]:
+        size = max(1, -(-len(content) // count))
+        return [content[index:index + size] for index in range(0, len(content), size)]
+
+    @staticmethod
+    def _wait(aborted: threading.Event, seconds: float):
+        if aborted.wait(seconds):
+            raise FakeAPIError(499, "Lượt gọi giả lập đã bị huỷ")
+
+    def _request(self, provider: str, messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                 json_schema: Optional[Dict] = None) -> Dict:
+        call = self._plan_call(messages, model, max_tokens, json_schema)
+        aborted = threading.Event()
+        with abort_on_loss(aborted.set):
+            self._wait(aborted, call["ttft"] + call["generation"])
+        return {"content": call["content"], "usage": call["usage"]}
+
+    def _cancellable_request(self, provider: str, messages: List[Dict], model: str, temperature: float,
+                             max_tokens: int, json_schema: Optional[Dict] = None) -> Dict:
+        return self._request(provider, messages, model, temperature, max_tokens, json_schema)
+
+    async def _arequest(self, state: Dict, provider: str, messages: List[Dict], model: str, temperature: float,
+                        max_tokens: int, json_schema: Optional[Dict] = None) -> Dict:
+        call = self._plan_call(messages, model, max_tokens, json_schema)
+        await asyncio.sleep(call["ttft"] + call["generation"])
+        return {"content": call["content"], "usage": call["usage"]}
+
+    def _stream_deltas(self, provider: str, messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                       usage: Dict, json_schema: Optional[Dict] = None) -> Iterator[str]:
+        call = self._plan_call(messages, model, max_tokens, json_schema)
+        aborted = threading.Event()
+        with abort_on_loss(aborted.set):
+            self._wait(aborted, call["ttft"])
+            chunks = self._chunks(call["content"])
+            for chunk in chunks:
+                self._wait(aborted, call["generation"] / len(chunks))
+                yield chunk
+        usage.update(call["usage"])
+
+    async def _astream_deltas(self, state: Dict, provider: str, messages: List[Dict], model: str,
+                              temperature: float, max_tokens: int, usage: Dict) -> AsyncIterator[str]:
+        call = self._plan_call(messages, model, max_tokens)
+        await asyncio.sleep(call["ttft"])
+        chunks = self._chunks(call["content"])
+        for chunk in chunks:
+            await asyncio.sleep(call["generation"] / len(chunks))
+            yield chunk
+        usage.update(call["usage"])
+
+    def _async_state(self) -> Dict:
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            state = self._async_states.get(loop)
+            if state is None:
+                state = {
+                    "openai": None,
+                    "anthropic": None,
+                    "semaphores": {
+                        provider: asyncio.Semaphore(limit) for provider, limit in self.max_concurrency.items()
+                    }
+                }
+                self._async_states[loop] = state
+            return state
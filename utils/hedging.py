@@ -0,0 +1,305 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+class _Stop(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self._hooks: List[Callable[[], None]] = []
+        self._hooks_lock = threading.Lock()
+
+    def set(self):
+        with self._hooks_lock:
+            super().set()
+            hooks, self._hooks = self._hooks, []
+            for hook in hooks:
+                hook()
+
+    def add(self, hook: Callable[[], None]):
+        with self._hooks_lock:
+            if not self.is_set():
+                self._hooks.append(hook)
+                return
+        hook()
+
+    def discard(self, hook: Callable[[], None]):
+        with self._hooks_lock:
+            if hook in self._hooks:
+                self._hooks.remove(hook)
+
+
+_current_stop: ContextVar[Optional[_Stop]] = ContextVar("hedge_stop", default=None)
+
+
+@contextmanager
+def abort_on_loss(hook: Callable[[], None]) -> Iterator[None]:
+    stop = _current_stop.get()
+    if stop is None:
+        yield
+        return
+    stop.add(hook)
+    try:
+        yield
+    finally:
+        stop.discard(hook)
+
+
+class HedgePolicy:
+    def __init__(self, percentile: float = 0.95, min_samples: int = 20, min_delay: float = 0.5,
+                 max_delay: Optional[float] = 30.0, window: int = 200):
+        if not 0 < percentile < 1:
+            raise ValueError("percentile phải nằm trong khoảng (0, 1)")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.window = window
+        self.fired = 0
+        self.won = 0
+        self._samples: Dict[Tuple[str, bool], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["HedgePolicy"]:
+        if os.getenv("LLM_HEDGE", "off").lower() != "on":
+            return None
+        return cls(
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+            min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+            min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+        )
+
+    def observe(self, model: str, stream: bool, seconds: float):
+        with self._lock:
+            self._samples.setdefault((model, stream), deque(maxlen=self.window)).append(seconds)
+
+    def delay(self, model: str, stream: bool = False) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get((model, stream), ()))
+        if len(samples) < self.min_samples:
+            return None
+        delay = max(self.min_delay, samples[min(len(samples) - 1, int(self.percentile * len(samples)))])
+        return min(delay, self.max_delay) if self.max_delay is not None else delay
+
+    def _record(self, state: Dict, winner: int):
+        with self._lock:
+            if winner:
+                self.won += 1
+        state["hedge_won"] = bool(winner)
+
+    def _fire(self, state: Dict):
+        with self._lock:
+            self.fired += 1
+        state["hedged"] = True
+
+    @staticmethod
+    def _run(index: int, attempt: Callable[[Dict], Iterator], usage: Dict, events: queue.Queue,
+             stop: _Stop):
+        _current_stop.set(stop)
+        deltas = attempt(usage)
+        try:
+            for delta in deltas:
+                if stop.is_set():
+                    return
+                events.put((index, "delta", delta))
+            events.put((index, "done", None))
+        except Exception as e:
+            events.put((index, "error", e))
+        finally:
+            close = getattr(deltas, "close", None)
+            if close:
+                close()
+
+    def stream(self, model: str, attempt: Callable[[Dict], Iterator[str]], usage: Dict,
+               can_hedge: Callable[[], bool], state: Dict, stream: bool = True,
+               duplicate: Optional[Callable[[Dict], Iterator[str]]] = None) -> Iterator[str]:
+        delay = self.delay(model, stream)
+        started_at = time.perf_counter()
+        if delay is None:
+            first = True
+            for delta in attempt(usage):
+                if first:
+                    self.observe(model, stream, time.perf_counter() - started_at)
+                    first = False
+                yield delta
+            return
+
+        events: queue.Queue = queue.Queue()
+        stops: List[_Stop] = []
+        usages: List[Dict] = []
+
+        def start():
+            runner = attempt if not stops else duplicate or attempt
+            stops.append(_Stop())
+            usages.append({})
+            threading.Thread(target=self._run, args=(len(stops) - 1, runner, usages[-1], events, stops[-1]),
+                             daemon=True).start()
+
+        start()
+        winner = None
+        failed = 0
+        try:
+            while winner is None:
+                try:
+                    index, kind, payload = events.get(timeout=delay if len(stops) == 1 else None)
+                except queue.Empty:
+                    if can_hedge():
+                        self._fire(state)
+                        start()
+                    delay = None
+                    continue
+                if kind == "error":
+                    failed += 1
+                    if failed == len(stops):
+                        raise payload
+                    continue
+                winner = index
+                self.observe(model, stream, time.perf_counter() - started_at)
+                self._record(state, winner)
+                for other, stop in enumerate(stops):
+                    if other != winner:
+                        stop.set()
+                if kind == "done":
+                    usage.update(usages[winner])
+                    return
+                yield payload
+
+            while True:
+                index, kind, payload = events.get()
+                if index != winner:
+                    continue
+                if kind == "delta":
+                    yield payload
+                elif kind == "done":
+                    usage.update(usages[winner])
+                    return
+                else:
+                    raise payload
+        finally:
+            for stop in stops:
+                stop.set()
+
+    def call(self, model: str, attempt: Callable[[], Dict], can_hedge: Callable[[], bool], state: Dict,
+             duplicate: Optional[Callable[[], Dict]] = None) -> Dict:
+        def single(usage: Dict) -> Iterator[Dict]:
+            yield attempt()
+
+        def single_duplicate(usage: Dict) -> Iterator[Dict]:
+            yield (duplicate or attempt)()
+
+        results = self.stream(model, single, {}, can_hedge, state, stream=False, duplicate=single_duplicate)
+        try:
+            return next(results)
+        finally:
+            results.close()
+
+    async def astream(self, model: str, attempt: Callable[[Dict], AsyncIterator[str]], usage: Dict,
+                      can_hedge: Callable[[], bool], state: Dict, stream: bool = True,
+                      duplicate: Optional[Callable[[Dict], AsyncIterator[str]]] = None) -> AsyncIterator[str]:
+        delay = self.delay(model, stream)
+        started_at = time.perf_counter()
+        if delay is None:
+            first = True
+            async for delta in attempt(usage):
+                if first:
+                    self.observe(model, stream, time.perf_counter() - started_at)
+                    first = False
+                yield delta
+            return
+
+        events: asyncio.Queue = asyncio.Queue()
+        tasks: List[asyncio.Task] = []
+        usages: List[Dict] = []
+
+        async def run(index: int):
+            runner = attempt if index == 0 else duplicate or attempt
+            try:
+                async for delta in runner(usages[index]):
+                    await events.put((index, "delta", delta))
+                await events.put((index, "done", None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await events.put((index, "error", e))
+
+        def start():
+            usages.append({})
+            tasks.append(asyncio.ensure_future(run(len(usages) - 1)))
+
+        start()
+        winner = None
+        failed = 0
+        try:
+            while winner is None:
+                try:
+                    if len(tasks) == 1 and delay is not None:
+                        index, kind, payload = await asyncio.wait_for(events.get(), delay)
+                    else:
+                        index, kind, payload = await events.get()
+                except asyncio.TimeoutError:
+                    if can_hedge():
+                        self._fire(state)
+                        start()
+                    delay = None
+                    continue
+                if kind == "error":
+                    failed += 1
+                    if failed == len(tasks):
+                        raise payload
+                    continue
+                winner = index
+                self.observe(model, stream, time.perf_counter() - started_at)
+                self._record(state, winner)
+                for other, task in enumerate(tasks):
+                    if other != winner:
+                        task.cancel()
+                if kind == "done":
+                    usage.update(usages[winner])
+                    return
+                yield payload
+
+            while True:
+                index, kind, payload = await events.get()
+                if index != winner:
+                    continue
+                if kind == "delta":
+                    yield payload
+                elif kind == "done":
+                    usage.update(usages[winner])
+                    return
+                else:
+                    raise payload
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def acall(self, model: str, attempt: Callable[[], Awaitable[Dict]], can_hedge: Callable[[], bool],
+                    state: Dict, duplicate: Optional[Callable[[], Awaitable[Dict]]] = None) -> Dict:
+        async def single(usage: Dict) -> AsyncIterator[Dict]:
+            yield await attempt()
+
+        async def single_duplicate(usage: Dict) -> AsyncIterator[Dict]:
+            yield await (duplicate or attempt)()
+
+        results = self.astream(model, single, {}, can_hedge, state, stream=False, duplicate=single_duplicate)
+        try:
+            return await results.__anext__()
+        finally:
+            await results.aclose()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            "fired": self.fired,
+            "won": self.won,
+            "percentile": self.percentile,
+            "delays": {f"{model} ({'stream' if stream else 'call'})": self.delay(model, stream) for model, stream in keys}
+        }
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import weakref
+from typing import Dict, Optional
+
+import httpx
+
+DEFAULT_MODEL_TIMEOUTS = {"o1": {"read": 600.0}}
+
+
+class HTTPTransport:
+    _shared: Optional["HTTPTransport"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, connect_timeout: float = 10.0, read_timeout: float = 120.0,
+                 model_timeouts: Optional[Dict[str, Dict[str, float]]] = None, max_connections: int = 200,
+                 max_keepalive_connections: int = 50, keepalive_expiry: float = 30.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.model_timeouts = {**DEFAULT_MODEL_TIMEOUTS, **(model_timeouts or {})}
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._client: Optional[httpx.Client] = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "HTTPTransport":
+        return cls(
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+            read_timeout=float(os.getenv("LLM_READ_TIMEOUT", "120")),
+            model_timeouts=json.loads(os.getenv("LLM_MODEL_TIMEOUTS", "{}")),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "200")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+        )
+
+    @classmethod
+    def shared(cls) -> "HTTPTransport":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls.from_env()
+            return cls._shared
+
+    def timeouts(self, model: str = "") -> Dict[str, float]:
+        matches = [prefix for prefix in self.model_timeouts if model.startswith(prefix)]
+        override = self.model_timeouts[max(matches, key=len)] if matches else {}
+        return {"connect": self.connect_timeout, "read": self.read_timeout, **override}
+
+    def timeout(self, model: str = "") -> httpx.Timeout:
+        config = self.timeouts(model)
+        return httpx.Timeout(config["read"], connect=config["connect"], write=config.get("write", config["read"]),
+                             pool=config.get("pool", config["read"]))
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(limits=self._limits(), timeout=self.timeout(), follow_redirects=True)
+            return self._client
+
+    def async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(limits=self._limits(), timeout=self.timeout(), follow_redirects=True)
+                self._async_clients[loop] = client
+            return client
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+            async_clients = list(self._async_clients.items())
+            self._async_clients.clear()
+        if client is not None:
+            client.close()
+        for loop, async_client in async_clients:
+            if loop.is_closed():
+                continue
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(async_client.aclose(), loop)
+            else:
+                loop.run_until_complete(async_client.aclose())
+
+    @staticmethod
+    def abort(response: Optional[httpx.Response]):
+        if response is None or response.is_closed:
+            return
+        stream = response.extensions.get("network_stream")
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        if sock is None:
+            return
+        try:
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            async_clients = len(self._async_clients)
+        return {
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "model_timeouts": self.model_timeouts,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "sync_client": self._client is not None,
+            "async_clients": async_clients
+        }
@@ -0,0 +1,187 @@
+import json
+import re
+from typing import Any, Dict, List
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = _FENCE.sub("", text).strip()
+    return text
+
+
+def _json_start(text: str) -> int:
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    return min(starts) if starts else -1
+
+
+def _remove_trailing_commas(text: str) -> str:
+    out = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "}]":
+            while out and out[-1] in " \t\r\n":
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+        out.append(char)
+    return "".join(out)
+
+
+def _scan(text: str):
+    stack = []
+    boundaries = []
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            boundaries.append(index + 1)
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            boundaries.append(index + 1)
+        elif char == ",":
+            boundaries.append(index)
+    return stack, boundaries, in_string
+
+
+def _repair_truncated(text: str, max_attempts: int = 200) -> str:
+    _, boundaries, in_string = _scan(text)
+    candidates = [text + '"' if in_string else text]
+    candidates.extend(text[:boundary] for boundary in reversed(boundaries[-max_attempts:]))
+
+    for candidate in candidates:
+        candidate = candidate.rstrip().rstrip(",").rstrip()
+        closing, _, still_in_string = _scan(candidate)
+        if still_in_string:
+            continue
+        repaired = candidate + "".join(reversed(closing))
+        try:
+            json.loads(repaired)
+            return repaired
+        except json.JSONDecodeError:
+            continue
+    return text
+
+
+def parse_json_response(text: str) -> Any:
+    cleaned = _strip_fences(text or "")
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError as first_error:
+        start = _json_start(cleaned)
+        if start == -1:
+            raise first_error
+        candidate = _remove_trailing_commas(cleaned[start:])
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+        try:
+            return json.loads(_repair_truncated(candidate))
+        except json.JSONDecodeError:
+            raise first_error
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool
+}
+
+
+def _coerce_scalar(data: Any, expected: str) -> Any:
+    if expected == "string" and isinstance(data, (int, float, bool)):
+        return str(data).lower() if isinstance(data, bool) else str(data)
+    if expected == "string" and isinstance(data, list) and all(isinstance(item, (str, int, float)) for item in data):
+        return ", ".join(str(item) for item in data)
+    if expected in ("integer", "number") and isinstance(data, str):
+        try:
+            number = float(data.strip())
+        except ValueError:
+            return data
+        return int(number) if expected == "integer" and number.is_integer() else number
+    if expected == "array" and isinstance(data, (str, int, float)) and not isinstance(data, bool):
+        return [data] if data != "" else []
+    if expected == "array" and data is None:
+        return []
+    return data
+
+
+def normalize_schema(data: Any, schema: Dict) -> Any:
+    expected = schema.get("type")
+    if expected:
+        data = _coerce_scalar(data, expected)
+
+    if isinstance(data, dict) and expected in (None, "object"):
+        required = set(schema.get("required", []))
+        for field, field_schema in schema.get("properties", {}).items():
+            if field not in data:
+                continue
+            data[field] = normalize_schema(data[field], field_schema)
+            if field not in required and validate_schema(data[field], field_schema):
+                del data[field]
+
+    if isinstance(data, list) and expected in (None, "array") and "items" in schema:
+        items = [normalize_schema(item, schema["items"]) for item in data if item is not None]
+        if schema["items"].get("type") in ("string", "integer", "number", "boolean"):
+            items = [item for item in items if not validate_schema(item, schema["items"])]
+        data[:] = items
+
+    return data
+
+
+def validate_schema(data: Any, schema: Dict, path: str = "$") -> List[str]:
+    errors = []
+    expected = schema.get("type")
+    if expected and (not isinstance(data, _TYPES[expected]) or
+                     (expected in ("integer", "number") and isinstance(data, bool))):
+        return [f"{path}: cần kiểu {expected}"]
+
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path}: giá trị không hợp lệ {data!r}")
+
+    if isinstance(data, dict):
+        for field in schema.get("required", []):
+            if field not in data:
+                errors.append(f"{path}: thiếu trường bắt buộc {field}")
+        for field, field_schema in schema.get("properties", {}).items():
+            if field in data:
+                errors.extend(validate_schema(data[field], field_schema, f"{path}.{field}"))
+
+    if isinstance(data, list):
+        if len(data) < schema.get("minItems", 0):
+            errors.append(f"{path}: cần ít nhất {schema['minItems']} phần tử")
+        if "items" in schema:
+            for index, item in enumerate(data):
+                errors.extend(validate_schema(item, schema["items"], f"{path}[{index}]"))
+
+    return errors
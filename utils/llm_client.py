@@ -1,78 +1,784 @@
+import asyncio
+import json
 import os
-from typing import List, Dict, Optional
-from openai import OpenAI
-from anthropic import Anthropic
+import random
+import threading
+import time
+import weakref
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Dict, Optional, Tuple
+import anthropic
+import openai
+from openai import OpenAI, AsyncOpenAI
+from anthropic import Anthropic, AsyncAnthropic
+from utils.context_builder import count_tokens
+from utils.hedging import HedgePolicy, abort_on_loss
+from utils.http_transport import HTTPTransport
+from utils.llm_cache import LLMCache
+from utils.quota_scheduler import DEFAULT_MAX_CONCURRENCY, QuotaScheduler
+from utils.rate_limiter import RateLimiter, retry_after_seconds
+from utils.telemetry import Telemetry, current_call_context
+
+EMPTY_USAGE = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0}
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
 
 class LLMClient:
-    def __init__(self):
+    def __init__(self, max_concurrency: Optional[Dict[str, int]] = None, cache: Optional[LLMCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None, max_retries: int = 5,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0, telemetry: Optional[Telemetry] = None,
+                 transport: Optional[HTTPTransport] = None, hedging: Optional[HedgePolicy] = None,
+                 scheduler: Optional[QuotaScheduler] = None, tenant: Optional[str] = None):
         self.openai_client = None
         self.anthropic_client = None
-        
-        openai_key = os.getenv("OPENAI_API_KEY")
-        anthropic_key = os.getenv("ANTHROPIC_API_KEY")
-        
-        if openai_key:
-            self.openai_client = OpenAI(api_key=openai_key)
-        if anthropic_key:
-            self.anthropic_client = Anthropic(api_key=anthropic_key)
-    
-    def chat(self, messages: List[Dict[str, str]], model: str = "gpt-4o", temperature: float = 0.7, max_tokens: int = 4000) -> str:
-        try:
-            if model.startswith("gpt") or model.startswith("o1"):
-                if not self.openai_client:
-                    raise ValueError("OpenAI API key chưa được cấu hình. Vui lòng thêm API key ở sidebar.")
-                
-                response = self.openai_client.chat.completions.create(
-                    model=model,
-                    messages=messages,  # type: ignore
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                content = response.choices[0].message.content
-                return content if content else ""
-            
-            elif model.startswith("claude"):
-                if not self.anthropic_client:
-                    raise ValueError("Anthropic API key chưa được cấu hình. Vui lòng thêm API key ở sidebar.")
-                
-                system_message = ""
-                user_messages = []
-                
-                for msg in messages:
-                    if msg["role"] == "system":
-                        system_message = msg["content"]
-                    else:
-                        user_messages.append(msg)
-                
-                response = self.anthropic_client.messages.create(
-                    model=model,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    system=system_message if system_message else "",
-                    messages=user_messages  # type: ignore
-                )
-                
-                for block in response.content:
-                    if hasattr(block, 'text'):
-                        return block.text
-                return ""
-            
+        self.cache = cache
+        self.telemetry = telemetry
+        self.scheduler = scheduler
+        self.tenant = tenant
+        self.rate_limiter = scheduler.rate_limiter if scheduler else rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.transport = transport or HTTPTransport.shared()
+        self.hedging = hedging
+
+        self.openai_key = os.getenv("OPENAI_API_KEY")
+        self.anthropic_key = os.getenv("ANTHROPIC_API_KEY")
+
+        if self.openai_key:
+            self.openai_client = OpenAI(api_key=self.openai_key, max_retries=0, http_client=self.transport.client)
+        if self.anthropic_key:
+            self.anthropic_client = Anthropic(api_key=self.anthropic_key, max_retries=0,
+                                              http_client=self.transport.client)
+
+        self.max_concurrency = {**DEFAULT_MAX_CONCURRENCY, **(max_concurrency or {})}
+        self._semaphores = {
+            provider: threading.BoundedSemaphore(limit) for provider, limit in self.max_concurrency.items()
+        }
+        self._async_states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+
+    @staticmethod
+    def provider_name(model: str) -> str:
+        if model.startswith("gpt") or model.startswith("o1"):
+            return "openai"
+        if model.startswith("claude"):
+            return "anthropic"
+        raise ValueError(f"Model không được hỗ trợ: {model}")
+
+    def _provider(self, model: str) -> str:
+        provider = self.provider_name(model)
+        if provider == "openai" and not self.openai_client:
+            raise ValueError("OpenAI API key chưa được cấu hình. Vui lòng thêm API key ở sidebar.")
+        if provider == "anthropic" and not self.anthropic_client:
+            raise ValueError("Anthropic API key chưa được cấu hình. Vui lòng thêm API key ở sidebar.")
+        return provider
+
+    def _async_state(self) -> Dict:
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            state = self._async_states.get(loop)
+            if state is None:
+                http_client = self.transport.async_client()
+                state = {
+                    "openai": AsyncOpenAI(api_key=self.openai_key, max_retries=0,
+                                          http_client=http_client) if self.openai_key else None,
+                    "anthropic": AsyncAnthropic(api_key=self.anthropic_key, max_retries=0,
+                                                http_client=http_client) if self.anthropic_key else None,
+                    "semaphores": {
+                        provider: asyncio.Semaphore(limit) for provider, limit in self.max_concurrency.items()
+                    }
+                }
+                self._async_states[loop] = state
+            return state
+
+    async def aclose(self):
+        with self._async_lock:
+            self._async_states.pop(asyncio.get_running_loop(), None)
+        await self.transport.aclose()
+
+    def _slot_args(self) -> Tuple[str, str]:
+        context = current_call_context()
+        return context.get("tenant") or self.tenant or "default", context.get("priority") or "interactive"
+
+    @contextmanager
+    def _slot(self, provider: str, model: str, estimated_tokens: int,
+              slot_args: Optional[Tuple[str, str]] = None) -> Iterator[None]:
+        if self.scheduler:
+            with self.scheduler.slot(provider, model, estimated_tokens, *(slot_args or self._slot_args())):
+                yield
+            return
+        self.rate_limiter.acquire(provider, model, estimated_tokens)
+        with self._semaphores[provider]:
+            yield
+
+    @asynccontextmanager
+    async def _aslot(self, state: Dict, provider: str, model: str, estimated_tokens: int) -> AsyncIterator[None]:
+        if self.scheduler:
+            async with self.scheduler.aslot(provider, model, estimated_tokens, *self._slot_args()):
+                yield
+            return
+        await self.rate_limiter.aacquire(provider, model, estimated_tokens)
+        async with state["semaphores"][provider]:
+            yield
+
+    def _cache_lookup(self, messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                      use_cache: bool, json_schema: Optional[Dict] = None) -> Tuple[Optional[str], Optional[Dict]]:
+        if not self.cache:
+            return None, None
+
+        request = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        if json_schema:
+            request["json_schema"] = json_schema
+        key = LLMCache.make_key(**request)
+        if use_cache or self.cache.replay_only:
+            cached = self.cache.get(key)
+            if cached is not None:
+                content = cached["content"] if isinstance(cached, dict) else cached
+                usage = cached.get("usage") or {} if isinstance(cached, dict) else {}
+                return key, {"content": content, "usage": {**EMPTY_USAGE, **usage, "local_cache_hit": True}}
+        if self.cache.replay_only:
+            raise ValueError("Chế độ replay-only: không tìm thấy phản hồi trong cache cho request này.")
+        return key, None
+
+    def _cache_store(self, key: Optional[str], response: Dict):
+        if self.cache and key:
+            self.cache.put(key, response)
+
+    @staticmethod
+    def _text_blocks(content, cacheable: bool) -> List[Dict]:
+        if isinstance(content, list):
+            blocks = [dict(block) for block in content]
+        else:
+            blocks = [{"type": "text", "text": content}]
+        if cacheable and blocks:
+            blocks[-1]["cache_control"] = {"type": "ephemeral"}
+        return blocks
+
+    @staticmethod
+    def _openai_kwargs(messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                       json_schema: Optional[Dict] = None) -> Dict:
+        kwargs = {
+            "model": model,
+            "messages": [{"role": msg["role"], "content": msg["content"]} for msg in messages],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if json_schema and model.startswith("gpt-4o"):
+            kwargs["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": json_schema.get("title", "response"), "schema": json_schema, "strict": False}
+            }
+        elif json_schema and model.startswith("gpt"):
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+    @classmethod
+    def _anthropic_kwargs(cls, messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                          json_schema: Optional[Dict] = None) -> Dict:
+        system_blocks = []
+        user_messages = []
+
+        for msg in messages:
+            if msg["role"] == "system":
+                system_blocks.extend(cls._text_blocks(msg["content"], msg.get("cache", False)))
+            elif msg.get("cache"):
+                user_messages.append({"role": msg["role"], "content": cls._text_blocks(msg["content"], True)})
             else:
-                raise ValueError(f"Model không được hỗ trợ: {model}")
-        
+                user_messages.append({"role": msg["role"], "content": msg["content"]})
+
+        kwargs = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": system_blocks if system_blocks else "",
+            "messages": user_messages
+        }
+        if json_schema:
+            tool_name = json_schema.get("title", "response")
+            kwargs["tools"] = [{
+                "name": tool_name,
+                "description": "Trả về kết quả theo đúng cấu trúc JSON này.",
+                "input_schema": json_schema
+            }]
+            kwargs["tool_choice"] = {"type": "tool", "name": tool_name}
+        return kwargs
+
+    @staticmethod
+    def _openai_text(response) -> str:
+        content = response.choices[0].message.content
+        return content if content else ""
+
+    @staticmethod
+    def _anthropic_text(response) -> str:
+        for block in response.content:
+            if getattr(block, 'type', None) == 'tool_use':
+                return json.dumps(block.input, ensure_ascii=False)
+            if hasattr(block, 'text'):
+                return block.text
+        return ""
+
+    @staticmethod
+    def _openai_usage(usage) -> Dict:
+        if usage is None:
+            return dict(EMPTY_USAGE)
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "input_tokens": usage.prompt_tokens or 0,
+            "output_tokens": usage.completion_tokens or 0,
+            "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+            "cache_write_tokens": 0
+        }
+
+    @staticmethod
+    def _anthropic_usage(usage) -> Dict:
+        if usage is None:
+            return dict(EMPTY_USAGE)
+        cached = getattr(usage, "cache_read_input_tokens", 0) or 0
+        written = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        return {
+            "input_tokens": (usage.input_tokens or 0) + cached + written,
+            "output_tokens": usage.output_tokens or 0,
+            "cached_tokens": cached,
+            "cache_write_tokens": written
+        }
+
+    @staticmethod
+    def _translate_error(e: Exception) -> ValueError:
+        error_msg = str(e)
+        if "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
+            return ValueError(f"Lỗi xác thực API: {error_msg}. Vui lòng kiểm tra lại API key.")
+        elif "rate" in error_msg.lower() or "quota" in error_msg.lower():
+            return ValueError(f"Lỗi giới hạn API: {error_msg}. Bạn có thể đã vượt quá giới hạn hoặc hết quota.")
+        elif "network" in error_msg.lower() or "connection" in error_msg.lower():
+            return ValueError(f"Lỗi kết nối mạng: {error_msg}. Vui lòng kiểm tra kết nối internet.")
+        else:
+            return ValueError(f"Lỗi từ LLM API: {error_msg}")
+
+    @staticmethod
+    def _start_call(model: str, stream: bool = False) -> Dict:
+        context = current_call_context()
+        return {
+            "model": model,
+            "agent_type": context.get("agent_type"),
+            "task_id": context.get("task_id"),
+            "stream": stream,
+            "started": time.perf_counter(),
+            "queue_wait": 0.0,
+            "latency": None,
+            "ttft": None,
+            "retries": 0,
+            "hedged": False
+        }
+
+    def _finish_call(self, call: Dict, usage: Optional[Dict] = None, error: Optional[Exception] = None):
+        if not self.telemetry:
+            return
+        total_time = time.perf_counter() - call["started"]
+        try:
+            provider = self.provider_name(call["model"])
+        except ValueError:
+            provider = "unknown"
+        usage = usage or {}
+        latency = call["latency"] if call["latency"] is not None else total_time
+        self.telemetry.record({
+            "timestamp": time.time(),
+            "provider": provider,
+            "model": call["model"],
+            "agent_type": call["agent_type"],
+            "task_id": call["task_id"],
+            "stream": call["stream"],
+            "cache_hit": bool(usage.get("local_cache_hit")),
+            "queue_wait": round(call["queue_wait"], 4),
+            "latency": round(latency, 4),
+            "ttft": round(call["ttft"] if call["ttft"] is not None else latency, 4),
+            "total_time": round(total_time, 4),
+            "retries": call["retries"],
+            "hedged": call.get("hedged", False),
+            **{kind: usage.get(kind, 0) for kind in EMPTY_USAGE},
+            "error": type(error).__name__ if error else None
+        })
+
+    def chat(self, messages: List[Dict], model: str = "gpt-4o", temperature: float = 0.7, max_tokens: int = 4000,
+             use_cache: bool = True, on_token: Optional[Callable[[str], None]] = None,
+             json_schema: Optional[Dict] = None) -> str:
+        return self.chat_with_usage(messages, model, temperature, max_tokens, use_cache, on_token, json_schema)["content"]
+
+    async def achat(self, messages: List[Dict], model: str = "gpt-4o", temperature: float = 0.7, max_tokens: int = 4000,
+                    use_cache: bool = True, on_token: Optional[Callable[[str], None]] = None,
+                    json_schema: Optional[Dict] = None) -> str:
+        response = await self.achat_with_usage(messages, model, temperature, max_tokens, use_cache, on_token, json_schema)
+        return response["content"]
+
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict], model: str, max_tokens: int) -> int:
+        text = "".join(
+            msg["content"] if isinstance(msg["content"], str) else str(msg["content"]) for msg in messages
+        )
+        return count_tokens(text, model) + max_tokens
+
+    def _retry_delay(self, provider: str, model: str, e: Exception, attempt: int) -> Optional[float]:
+        if attempt >= self.max_retries:
+            return None
+        status = getattr(e, "status_code", None)
+        connection_error = isinstance(e, (openai.APIConnectionError, anthropic.APIConnectionError))
+        if not connection_error and status not in RETRYABLE_STATUS:
+            return None
+        if getattr(e, "code", None) == "insufficient_quota":
+            return None
+
+        response = getattr(e, "response", None)
+        headers = getattr(response, "headers", None)
+        self.rate_limiter.update_from_headers(provider, model, headers)
+        retry_after = retry_after_seconds(headers)
+        if retry_after is not None:
+            delay = min(retry_after, self.max_backoff)
+        else:
+            delay = min(self.max_backoff, self.base_backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if status == 429:
+            self.rate_limiter.pause(provider, model, delay)
+        return delay
+
+    def _request(self, provider: str, messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                 json_schema: Optional[Dict] = None) -> Dict:
+        if provider == "openai":
+            raw = self.openai_client.chat.completions.with_raw_response.create(  # type: ignore
+                **self._openai_kwargs(messages, model, temperature, max_tokens, json_schema),
+                timeout=self.transport.timeout(model)
+            )
+            self.rate_limiter.update_from_headers(provider, model, raw.headers)
+            response = raw.parse()
+            return {"content": self._openai_text(response), "usage": self._openai_usage(response.usage)}
+
+        raw = self.anthropic_client.messages.with_raw_response.create(  # type: ignore
+            **self._anthropic_kwargs(messages, model, temperature, max_tokens, json_schema),
+            timeout=self.transport.timeout(model)
+        )
+        self.rate_limiter.update_from_headers(provider, model, raw.headers)
+        response = raw.parse()
+        return {"content": self._anthropic_text(response), "usage": self._anthropic_usage(response.usage)}
+
+    def _abort_on_loss(self, response):
+        return abort_on_loss(lambda: self.transport.abort(response))
+
+    def _cancellable_request(self, provider: str, messages: List[Dict], model: str, temperature: float,
+                             max_tokens: int, json_schema: Optional[Dict] = None) -> Dict:
+        if provider == "openai":
+            usage = dict(EMPTY_USAGE)
+            content = "".join(self._stream_deltas(provider, messages, model, temperature, max_tokens, usage,
+                                                  json_schema))
+            return {"content": content, "usage": usage}
+
+        with self.anthropic_client.messages.stream(  # type: ignore
+            **self._anthropic_kwargs(messages, model, temperature, max_tokens, json_schema),
+            timeout=self.transport.timeout(model)
+        ) as stream, self._abort_on_loss(stream.response):
+            self.rate_limiter.update_from_headers(provider, model, getattr(stream.response, "headers", None))
+            response = stream.get_final_message()
+        return {"content": self._anthropic_text(response), "usage": self._anthropic_usage(response.usage)}
+
+    async def _arequest(self, state: Dict, provider: str, messages: List[Dict], model: str, temperature: float,
+                        max_tokens: int, json_schema: Optional[Dict] = None) -> Dict:
+        if provider == "openai":
+            raw = await state["openai"].chat.completions.with_raw_response.create(
+                **self._openai_kwargs(messages, model, temperature, max_tokens, json_schema),
+                timeout=self.transport.timeout(model)
+            )
+            self.rate_limiter.update_from_headers(provider, model, raw.headers)
+            response = await raw.parse()
+            return {"content": self._openai_text(response), "usage": self._openai_usage(response.usage)}
+
+        raw = await state["anthropic"].messages.with_raw_response.create(
+            **self._anthropic_kwargs(messages, model, temperature, max_tokens, json_schema),
+            timeout=self.transport.timeout(model)
+        )
+        self.rate_limiter.update_from_headers(provider, model, raw.headers)
+        response = await raw.parse()
+        return {"content": self._anthropic_text(response), "usage": self._anthropic_usage(response.usage)}
+
+    def _hedge_gate(self, provider: str, model: str, estimated_tokens: int,
+                    state: Optional[Dict] = None) -> Callable[[], bool]:
+        def can_hedge() -> bool:
+            if self.scheduler:
+                return self.scheduler.has_capacity(provider, model, estimated_tokens)
+            if self.rate_limiter.wait_time(provider, model, estimated_tokens) > 0:
+                return False
+            if state is not None:
+                return not state["semaphores"][provider].locked()
+            if not self._semaphores[provider].acquire(blocking=False):
+                return False
+            self._semaphores[provider].release()
+            return True
+
+        return can_hedge
+
+    def _slotted(self, provider: str, model: str, estimated_tokens: int,
+                 request: Callable[..., Dict]) -> Callable[..., Dict]:
+        slot_args = self._slot_args()
+
+        def run(*args) -> Dict:
+            with self._slot(provider, model, estimated_tokens, slot_args):
+                return request(*args)
+
+        return run
+
+    def _slotted_stream(self, provider: str, model: str, estimated_tokens: int,
+                        request: Callable[[Dict], Iterator[str]]) -> Callable[[Dict], Iterator[str]]:
+        slot_args = self._slot_args()
+
+        def run(usage: Dict) -> Iterator[str]:
+            with self._slot(provider, model, estimated_tokens, slot_args):
+                yield from request(usage)
+
+        return run
+
+    def _leased(self, lease: ExitStack, request: Callable[..., Dict]) -> Callable[..., Dict]:
+        held = lease.pop_all()
+
+        def run(*args) -> Dict:
+            with held:
+                return request(*args)
+
+        return run
+
+    def _leased_stream(self, lease: ExitStack,
+                       request: Callable[[Dict], Iterator[str]]) -> Callable[[Dict], Iterator[str]]:
+        held = lease.pop_all()
+
+        def run(usage: Dict) -> Iterator[str]:
+            with held:
+                yield from request(usage)
+
+        return run
+
+    def _aslotted(self, state: Dict, provider: str, model: str, estimated_tokens: int,
+                  request: Callable[[], Awaitable[Dict]]) -> Callable[[], Awaitable[Dict]]:
+        async def run() -> Dict:
+            async with self._aslot(state, provider, model, estimated_tokens):
+                return await request()
+
+        return run
+
+    def _aslotted_stream(self, state: Dict, provider: str, model: str, estimated_tokens: int,
+                         request: Callable[[Dict], AsyncIterator[str]]) -> Callable[[Dict], AsyncIterator[str]]:
+        async def run(usage: Dict) -> AsyncIterator[str]:
+            async with self._aslot(state, provider, model, estimated_tokens):
+                async for delta in request(usage):
+                    yield delta
+
+        return run
+
+    def _hedged_request(self, call: Dict, lease: ExitStack, estimated_tokens: int, provider: str,
+                        messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                        json_schema: Optional[Dict] = None) -> Dict:
+        if not self.hedging:
+            return self._request(provider, messages, model, temperature, max_tokens, json_schema)
+
+        def request() -> Dict:
+            return self._cancellable_request(provider, messages, model, temperature, max_tokens, json_schema)
+
+        return self.hedging.call(
+            model, self._leased(lease, request), self._hedge_gate(provider, model, estimated_tokens), call,
+            self._slotted(provider, model, estimated_tokens, request)
+        )
+
+    async def _ahedged_request(self, call: Dict, estimated_tokens: int, state: Dict, provider: str,
+                               messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                               json_schema: Optional[Dict] = None) -> Dict:
+        def request() -> Awaitable[Dict]:
+            return self._arequest(state, provider, messages, model, temperature, max_tokens, json_schema)
+
+        if not self.hedging:
+            return await request()
+        return await self.hedging.acall(
+            model, request, self._hedge_gate(provider, model, estimated_tokens, state), call,
+            self._aslotted(state, provider, model, estimated_tokens, request)
+        )
+
+    def _hedged_stream(self, call: Dict, lease: ExitStack, estimated_tokens: int, provider: str,
+                       messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                       usage: Dict) -> Iterator[str]:
+        def request(attempt_usage: Dict) -> Iterator[str]:
+            return self._stream_deltas(provider, messages, model, temperature, max_tokens, attempt_usage)
+
+        if not self.hedging:
+            return request(usage)
+        return self.hedging.stream(
+            model, self._leased_stream(lease, request), usage, self._hedge_gate(provider, model, estimated_tokens),
+            call,
+            duplicate=self._slotted_stream(provider, model, estimated_tokens, request)
+        )
+
+    def _ahedged_stream(self, call: Dict, estimated_tokens: int, state: Dict, provider: str, messages: List[Dict],
+                        model: str, temperature: float, max_tokens: int, usage: Dict) -> AsyncIterator[str]:
+        def request(attempt_usage: Dict) -> AsyncIterator[str]:
+            return self._astream_deltas(state, provider, messages, model, temperature, max_tokens, attempt_usage)
+
+        if not self.hedging:
+            return request(usage)
+        return self.hedging.astream(
+            model, request, usage, self._hedge_gate(provider, model, estimated_tokens, state), call,
+            duplicate=self._aslotted_stream(state, provider, model, estimated_tokens, request)
+        )
+
+    def chat_with_usage(self, messages: List[Dict], model: str = "gpt-4o", temperature: float = 0.7,
+                        max_tokens: int = 4000, use_cache: bool = True,
+                        on_token: Optional[Callable[[str], None]] = None,
+                        json_schema: Optional[Dict] = None) -> Dict:
+        if on_token and not json_schema:
+            usage: Dict = {}
+            parts = []
+            for delta in self.stream_chat(messages, model, temperature, max_tokens, use_cache, usage):
+                parts.append(delta)
+                on_token(delta)
+            return {"content": "".join(parts), "usage": usage}
+
+        call = self._start_call(model)
+        try:
+            cache_key, cached = self._cache_lookup(messages, model, temperature, max_tokens, use_cache, json_schema)
+            if cached is not None:
+                self._finish_call(call, cached["usage"])
+                return cached
+
+            provider = self._provider(model)
+            estimated_tokens = self._estimate_tokens(messages, model, max_tokens)
+            attempt = 0
+
+            while True:
+                waiting_since = time.perf_counter()
+                try:
+                    with ExitStack() as lease:
+                        lease.enter_context(self._slot(provider, model, estimated_tokens))
+                        request_started = time.perf_counter()
+                        call["queue_wait"] += request_started - waiting_since
+                        result = self._hedged_request(call, lease, estimated_tokens, provider, messages, model,
+                                                      temperature, max_tokens, json_schema)
+                        call["latency"] = time.perf_counter() - request_started
+                    break
+                except Exception as e:
+                    delay = self._retry_delay(provider, model, e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    call["retries"] = attempt
+                    time.sleep(delay)
+
+            self._cache_store(cache_key, result)
+            self._finish_call(call, result["usage"])
+            return result
+
         except ValueError as e:
+            self._finish_call(call, error=e)
             raise e
         except Exception as e:
-            error_msg = str(e)
-            if "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
-                raise ValueError(f"Lỗi xác thực API: {error_msg}. Vui lòng kiểm tra lại API key.")
-            elif "rate" in error_msg.lower() or "quota" in error_msg.lower():
-                raise ValueError(f"Lỗi giới hạn API: {error_msg}. Bạn có thể đã vượt quá giới hạn hoặc hết quota.")
-            elif "network" in error_msg.lower() or "connection" in error_msg.lower():
-                raise ValueError(f"Lỗi kết nối mạng: {error_msg}. Vui lòng kiểm tra kết nối internet.")
-            else:
-                raise ValueError(f"Lỗi từ LLM API: {error_msg}")
-    
+            self._finish_call(call, error=e)
+            raise self._translate_error(e)
+
+    async def achat_with_usage(self, messages: List[Dict], model: str = "gpt-4o", temperature: float = 0.7,
+                               max_tokens: int = 4000, use_cache: bool = True,
+                               on_token: Optional[Callable[[str], None]] = None,
+                               json_schema: Optional[Dict] = None) -> Dict:
+        if on_token and not json_schema:
+            usage: Dict = {}
+            parts = []
+            async for delta in self.astream_chat(messages, model, temperature, max_tokens, use_cache, usage):
+                parts.append(delta)
+                on_token(delta)
+            return {"content": "".join(parts), "usage": usage}
+
+        call = self._start_call(model)
+        try:
+            cache_key, cached = self._cache_lookup(messages, model, temperature, max_tokens, use_cache, json_schema)
+            if cached is not None:
+                self._finish_call(call, cached["usage"])
+                return cached
+
+            provider = self._provider(model)
+            state = self._async_state()
+            estimated_tokens = self._estimate_tokens(messages, model, max_tokens)
+            attempt = 0
+
+            while True:
+                waiting_since = time.perf_counter()
+                try:
+                    async with self._aslot(state, provider, model, estimated_tokens):
+                        request_started = time.perf_counter()
+                        call["queue_wait"] += request_started - waiting_since
+                        result = await self._ahedged_request(call, estimated_tokens, state, provider, messages, model,
+                                                             temperature, max_tokens, json_schema)
+                        call["latency"] = time.perf_counter() - request_started
+                    break
+                except Exception as e:
+                    delay = self._retry_delay(provider, model, e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    call["retries"] = attempt
+                    await asyncio.sleep(delay)
+
+            self._cache_store(cache_key, result)
+            self._finish_call(call, result["usage"])
+            return result
+
+        except ValueError as e:
+            self._finish_call(call, error=e)
+            raise e
+        except Exception as e:
+            self._finish_call(call, error=e)
+            raise self._translate_error(e)
+
+    def _stream_deltas(self, provider: str, messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                       usage: Dict, json_schema: Optional[Dict] = None) -> Iterator[str]:
+        if provider == "openai":
+            stream = self.openai_client.chat.completions.create(  # type: ignore
+                **self._openai_kwargs(messages, model, temperature, max_tokens, json_schema),
+                stream=True, stream_options={"include_usage": True}, timeout=self.transport.timeout(model)
+            )
+            self.rate_limiter.update_from_headers(provider, model, getattr(stream.response, "headers", None))
+            with stream, self._abort_on_loss(stream.response):
+                for chunk in stream:
+                    if chunk.usage:
+                        usage.update(self._openai_usage(chunk.usage))
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+            return
+
+        with self.anthropic_client.messages.stream(  # type: ignore
+            **self._anthropic_kwargs(messages, model, temperature, max_tokens), timeout=self.transport.timeout(model)
+        ) as stream, self._abort_on_loss(stream.response):
+            self.rate_limiter.update_from_headers(provider, model, getattr(stream.response, "headers", None))
+            for delta in stream.text_stream:
+                if delta:
+                    yield delta
+            usage.update(self._anthropic_usage(stream.get_final_message().usage))
+
+    async def _astream_deltas(self, state: Dict, provider: str, messages: List[Dict], model: str,
+                              temperature: float, max_tokens: int, usage: Dict) -> AsyncIterator[str]:
+        if provider == "openai":
+            stream = await state["openai"].chat.completions.create(
+                **self._openai_kwargs(messages, model, temperature, max_tokens),
+                stream=True, stream_options={"include_usage": True}, timeout=self.transport.timeout(model)
+            )
+            self.rate_limiter.update_from_headers(provider, model, getattr(stream.response, "headers", None))
+            async for chunk in stream:
+                if chunk.usage:
+                    usage.update(self._openai_usage(chunk.usage))
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+            return
+
+        async with state["anthropic"].messages.stream(
+            **self._anthropic_kwargs(messages, model, temperature, max_tokens), timeout=self.transport.timeout(model)
+        ) as stream:
+            self.rate_limiter.update_from_headers(provider, model, getattr(stream.response, "headers", None))
+            async for delta in stream.text_stream:
+                if delta:
+                    yield delta
+            usage.update(self._anthropic_usage((await stream.get_final_message()).usage))
+
+    def stream_chat(self, messages: List[Dict], model: str = "gpt-4o", temperature: float = 0.7,
+                    max_tokens: int = 4000, use_cache: bool = True, usage: Optional[Dict] = None) -> Iterator[str]:
+        usage = usage if usage is not None else {}
+        call = self._start_call(model, stream=True)
+        try:
+            cache_key, cached = self._cache_lookup(messages, model, temperature, max_tokens, use_cache)
+            if cached is not None:
+                usage.update(cached["usage"])
+                self._finish_call(call, usage)
+                yield cached["content"]
+                return
+
+            provider = self._provider(model)
+            estimated_tokens = self._estimate_tokens(messages, model, max_tokens)
+            parts = []
+            attempt = 0
+
+            while True:
+                waiting_since = time.perf_counter()
+                try:
+                    with ExitStack() as lease:
+                        lease.enter_context(self._slot(provider, model, estimated_tokens))
+                        request_started = time.perf_counter()
+                        call["queue_wait"] += request_started - waiting_since
+                        for delta in self._hedged_stream(call, lease, estimated_tokens, provider, messages, model,
+                                                         temperature, max_tokens, usage):
+                            if not parts:
+                                call["ttft"] = time.perf_counter() - request_started
+                            parts.append(delta)
+                            yield delta
+                        call["latency"] = time.perf_counter() - request_started
+                    break
+                except Exception as e:
+                    delay = None if parts else self._retry_delay(provider, model, e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    call["retries"] = attempt
+                    time.sleep(delay)
+
+            self._cache_store(cache_key, {"content": "".join(parts), "usage": dict(usage)})
+            self._finish_call(call, usage)
+
+        except ValueError as e:
+            self._finish_call(call, usage, error=e)
+            raise e
+        except Exception as e:
+            self._finish_call(call, usage, error=e)
+            raise self._translate_error(e)
+
+    async def astream_chat(self, messages: List[Dict], model: str = "gpt-4o", temperature: float = 0.7,
+                           max_tokens: int = 4000, use_cache: bool = True,
+                           usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        usage = usage if usage is not None else {}
+        call = self._start_call(model, stream=True)
+        try:
+            cache_key, cached = self._cache_lookup(messages, model, temperature, max_tokens, use_cache)
+            if cached is not None:
+                usage.update(cached["usage"])
+                self._finish_call(call, usage)
+                yield cached["content"]
+                return
+
+            provider = self._provider(model)
+            state = self._async_state()
+            estimated_tokens = self._estimate_tokens(messages, model, max_tokens)
+            parts = []
+            attempt = 0
+
+            while True:
+                waiting_since = time.perf_counter()
+                try:
+                    async with self._aslot(state, provider, model, estimated_tokens):
+                        request_started = time.perf_counter()
+                        call["queue_wait"] += request_started - waiting_since
+                        async for delta in self._ahedged_stream(call, estimated_tokens, state, provider, messages,
+                                                                model, temperature, max_tokens, usage):
+                            if not parts:
+                                call["ttft"] = time.perf_counter() - request_started
+                            parts.append(delta)
+                            yield delta
+                        call["latency"] = time.perf_counter() - request_started
+                    break
+                except Exception as e:
+                    delay = None if parts else self._retry_delay(provider, model, e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    call["retries"] = attempt
+                    await asyncio.sleep(delay)
+
+            self._cache_store(cache_key, {"content": "".join(parts), "usage": dict(usage)})
+            self._finish_call(call, usage)
+
+        except ValueError as e:
+            self._finish_call(call, usage, error=e)
+            raise e
+        except Exception as e:
+            self._finish_call(call, usage, error=e)
+            raise self._translate_error(e)
+
     def available_models(self) -> List[str]:
         models = []
         if self.openai_client:
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from utils.rate_limiter import RateLimiter
+
+DEFAULT_MAX_CONCURRENCY = {"openai": 64, "anthropic": 64}
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+
+def _quantile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(q * len(values)))], 4)
+
+
+class QuotaScheduler:
+    _shared: Optional["QuotaScheduler"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_concurrency: Optional[Dict[str, int]] = None, rate_limiter: Optional[RateLimiter] = None,
+                 aging_seconds: Optional[float] = 60.0, window: int = 500):
+        self.max_concurrency = {**DEFAULT_MAX_CONCURRENCY, **(max_concurrency or {})}
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.aging_seconds = aging_seconds
+        self.granted = 0
+        self._waiters: List[Dict] = []
+        self._active: Dict[str, int] = {}
+        self._busy: Dict[str, int] = {}
+        self._virtual: Dict[str, float] = {}
+        self._clock = 0.0
+        self._seq = 0
+        self._timer_at: Optional[float] = None
+        self._waits: Dict[str, Deque[float]] = {priority: deque(maxlen=window) for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "QuotaScheduler":
+        aging = os.getenv("QUOTA_AGING_SECONDS", "60")
+        return cls(
+            max_concurrency=json.loads(os.getenv("LLM_MAX_CONCURRENCY", "{}")),
+            rate_limiter=RateLimiter(json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))),
+            aging_seconds=float(aging) if aging.lower() != "off" else None
+        )
+
+    @classmethod
+    def shared(cls) -> "QuotaScheduler":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls.from_env()
+            return cls._shared
+
+    def _order(self, waiter: Dict, now: float) -> Tuple[int, float, int]:
+        rank = PRIORITIES[waiter["priority"]]
+        if self.aging_seconds is not None and now - waiter["enqueued_at"] >= self.aging_seconds:
+            rank = 0
+        return rank, self._virtual[waiter["tenant"]], waiter["seq"]
+
+    def _next_waiter(self, now: float, blocked: Set[Tuple[str, str]]) -> Tuple[Optional[Dict], Optional[float]]:
+        retry = None
+        candidates = [
+            waiter for waiter in self._waiters
+            if self._active.get(waiter["provider"], 0) < self.max_concurrency.get(waiter["provider"], 1)
+        ]
+        for waiter in sorted(candidates, key=lambda waiter: self._order(waiter, now)):
+            provider, model = waiter["provider"], waiter["model"]
+            if self._active.get(provider, 0) >= self.max_concurrency.get(provider, 1):
+                continue
+            if (provider, model) in blocked:
+                continue
+            delay = self.rate_limiter.wait_time(provider, model, waiter["tokens"])
+            if delay > 0:
+                blocked.add((provider, model))
+                retry = delay if retry is None else min(retry, delay)
+                continue
+            return waiter, retry
+        return None, retry
+
+    def _dispatch(self):
+        now = time.monotonic()
+        blocked: Set[Tuple[str, str]] = set()
+        while True:
+            waiter, retry = self._next_waiter(now, blocked)
+            if waiter is None:
+                break
+            self.rate_limiter.reserve(waiter["provider"], waiter["model"], waiter["tokens"])
+            self._grant(waiter, now)
+        if retry is not None:
+            self._schedule(retry)
+
+    def _grant(self, waiter: Dict, now: float):
+        tenant = waiter["tenant"]
+        self._waiters.remove(waiter)
+        self._active[waiter["provider"]] = self._active.get(waiter["provider"], 0) + 1
+        self._clock = self._virtual[tenant]
+        self._virtual[tenant] += max(1, waiter["tokens"])
+        waiter["granted"] = True
+        waiter["waited"] = now - waiter["enqueued_at"]
+        self._waits[waiter["priority"]].append(waiter["waited"])
+        self.granted += 1
+        try:
+            waiter["wake"]()
+        except RuntimeError:
+            self._finish(waiter)
+
+    def _schedule(self, delay: float):
+        wake_at = time.monotonic() + delay
+        if self._timer_at is not None and self._timer_at <= wake_at:
+            return
+        self._timer_at = wake_at
+        timer = threading.Timer(delay, self._wakeup)
+        timer.daemon = True
+        timer.start()
+
+    def _wakeup(self):
+        with self._lock:
+            self._timer_at = None
+            self._dispatch()
+
+    def has_capacity(self, provider: str, model: str, tokens: int) -> bool:
+        with self._lock:
+            if self._active.get(provider, 0) >= self.max_concurrency.get(provider, 1):
+                return False
+            if any(waiter["provider"] == provider for waiter in self._waiters):
+                return False
+            return self.rate_limiter.wait_time(provider, model, tokens) == 0
+
+    def _enqueue(self, provider: str, model: str, tokens: int, tenant: str, priority: str,
+                 wake: Callable[[], None]) -> Dict:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Mức ưu tiên không hợp lệ: {priority}")
+        with self._lock:
+            if not self._busy.get(tenant):
+                self._virtual[tenant] = max(self._virtual.get(tenant, 0.0), self._clock)
+            self._busy[tenant] = self._busy.get(tenant, 0) + 1
+            self._seq += 1
+            waiter = {
+                "provider": provider,
+                "model": model,
+                "tokens": tokens,
+                "tenant": tenant,
+                "priority": priority,
+                "seq": self._seq,
+                "enqueued_at": time.monotonic(),
+                "granted": False,
+                "waited": 0.0,
+                "wake": wake
+            }
+            self._waiters.append(waiter)
+            self._dispatch()
+        return waiter
+
+    def _finish(self, waiter: Dict):
+        if waiter["granted"]:
+            self._active[waiter["provider"]] -= 1
+        elif waiter in self._waiters:
+            self._waiters.remove(waiter)
+        tenant = waiter["tenant"]
+        self._busy[tenant] -= 1
+        if not self._busy[tenant]:
+            del self._busy[tenant]
+
+    def _release(self, waiter: Dict):
+        with self._lock:
+            self._finish(waiter)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, provider: str, model: str, tokens: int, tenant: str = "default",
+             priority: str = "interactive") -> Iterator[float]:
+        event = threading.Event()
+        waiter = self._enqueue(provider, model, tokens, tenant, priority, event.set)
+        try:
+            event.wait()
+            yield waiter["waited"]
+        finally:
+            self._release(waiter)
+
+    @asynccontextmanager
+    async def aslot(self, provider: str, model: str, tokens: int, tenant: str = "default",
+                    priority: str = "interactive") -> AsyncIterator[float]:
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def resolve():
+            if not granted.done():
+                granted.set_result(None)
+
+        waiter = self._enqueue(provider, model, tokens, tenant, priority,
+                               lambda: loop.call_soon_threadsafe(resolve))
+        try:
+            await granted
+            yield waiter["waited"]
+        finally:
+            self._release(waiter)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            waiting = list(self._waiters)
+            active = dict(self._active)
+            waits = {priority: sorted(samples) for priority, samples in self._waits.items()}
+            tenants = len(self._busy)
+        queued_by_tenant: Dict[str, int] = {}
+        for waiter in waiting:
+            queued_by_tenant[waiter["tenant"]] = queued_by_tenant.get(waiter["tenant"], 0) + 1
+        return {
+            "active": active,
+            "max_concurrency": dict(self.max_concurrency),
+            "queued": len(waiting),
+            "queued_by_priority": {
+                priority: sum(1 for waiter in waiting if waiter["priority"] == priority) for priority in PRIORITIES
+            },
+            "queued_by_tenant": queued_by_tenant,
+            "tenants": tenants,
+            "oldest_wait": round(max((now - waiter["enqueued_at"] for waiter in waiting), default=0.0), 4),
+            "granted": self.granted,
+            "wait_p50": {priority: _quantile(samples, 0.5) for priority, samples in waits.items()},
+            "wait_p95": {priority: _quantile(samples, 0.95) for priority, samples in waits.items()}
+        }
@@ -0,0 +1,169 @@
+import asyncio
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+HEADER_NAMES = {
+    "openai": {
+        "rpm": ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        "tpm": ("x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens")
+    },
+    "anthropic": {
+        "rpm": ("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining",
+                "anthropic-ratelimit-requests-reset"),
+        "tpm": ("anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-remaining",
+                "anthropic-ratelimit-tokens-reset")
+    }
+}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value.strip():
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+    except ValueError:
+        return None
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = min(amount, self.capacity) - self.tokens
+            return max(0.0, missing / self.refill_per_second)
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.refill_per_second
+
+    def sync(self, limit: float, remaining: float, reset_seconds: Optional[float] = None):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.capacity = limit
+            self.refill_per_second = limit / 60
+            if reset_seconds and limit > remaining:
+                self.refill_per_second = max(self.refill_per_second, (limit - remaining) / reset_seconds)
+            self.tokens = min(self.tokens, remaining)
+
+
+class RateLimiter:
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None):
+        self.limits = limits or {}
+        self._buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+        self._paused_until: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, provider: str, model: str, kind: str) -> Optional[TokenBucket]:
+        key = (provider, model, kind)
+        with self._lock:
+            if key not in self._buckets:
+                config = self.limits.get(model) or self.limits.get(provider) or {}
+                per_minute = config.get(kind)
+                if per_minute:
+                    self._buckets[key] = TokenBucket(per_minute, per_minute / 60)
+            return self._buckets.get(key)
+
+    def wait_time(self, provider: str, model: str, tokens: int) -> float:
+        delay = max(0.0, self._paused_until.get((provider, model), 0.0) - time.monotonic())
+        for kind, amount in (("rpm", 1), ("tpm", tokens)):
+            bucket = self._bucket(provider, model, kind)
+            if bucket:
+                delay = max(delay, bucket.wait_time(amount))
+        return delay
+
+    def reserve(self, provider: str, model: str, tokens: int) -> float:
+        delay = max(0.0, self._paused_until.get((provider, model), 0.0) - time.monotonic())
+        for kind, amount in (("rpm", 1), ("tpm", tokens)):
+            bucket = self._bucket(provider, model, kind)
+            if bucket:
+                delay = max(delay, bucket.reserve(amount))
+        return delay
+
+    def acquire(self, provider: str, model: str, tokens: int) -> float:
+        delay = self.reserve(provider, model, tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def aacquire(self, provider: str, model: str, tokens: int) -> float:
+        delay = self.reserve(provider, model, tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def pause(self, provider: str, model: str, seconds: float):
+        with self._lock:
+            key = (provider, model)
+            self._paused_until[key] = max(self._paused_until.get(key, 0.0), time.monotonic() + seconds)
+
+    def update_from_headers(self, provider: str, model: str, headers):
+        if not headers:
+            return
+        for kind, (limit_name, remaining_name, reset_name) in HEADER_NAMES.get(provider, {}).items():
+            try:
+                limit = float(headers.get(limit_name))
+                remaining = float(headers.get(remaining_name))
+            except (TypeError, ValueError):
+                continue
+            if limit <= 0:
+                continue
+            reset_seconds = parse_reset(headers.get(reset_name))
+            with self._lock:
+                bucket = self._buckets.setdefault((provider, model, kind), TokenBucket(limit, limit / 60))
+            bucket.sync(limit, remaining, reset_seconds)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            buckets = list(self._buckets.items())
+        return {
+            f"{provider}:{model}:{kind}": {"capacity": bucket.capacity, "available": round(bucket.tokens, 1)}
+            for (provider, model, kind), bucket in buckets
+        }
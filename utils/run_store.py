@@ -0,0 +1,140 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+RUN_FIELDS = ("description", "idea", "plan", "report", "status")
+JSON_FIELDS = ("idea", "plan")
+
+
+class RunStore:
+    def __init__(self, path: str = ".runs/runs.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "run_id TEXT PRIMARY KEY, description TEXT, idea TEXT, plan TEXT, report TEXT, "
+                "status TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_results ("
+                "run_id TEXT NOT NULL, task_id TEXT NOT NULL, status TEXT, result TEXT, notes TEXT, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (run_id, task_id))"
+            )
+
+    @staticmethod
+    def _encode(field: str, value):
+        if value is None:
+            return None
+        return json.dumps(value, ensure_ascii=False) if field in JSON_FIELDS else value
+
+    def create_run(self, description: str = "", idea: Optional[Dict] = None, plan: Optional[Dict] = None,
+                   run_id: Optional[str] = None) -> str:
+        run_id = run_id or uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO runs (run_id, description, idea, plan, report, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, NULL, 'created', ?, ?)",
+                (run_id, description, self._encode("idea", idea), self._encode("plan", plan), now, now)
+            )
+        return run_id
+
+    def update_run(self, run_id: str, **fields):
+        unknown = set(fields) - set(RUN_FIELDS)
+        if unknown:
+            raise ValueError(f"Trường không hợp lệ: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        values = [self._encode(field, value) for field, value in fields.items()]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE runs SET {assignments}, updated_at = ? WHERE run_id = ?",
+                (*values, time.time(), run_id)
+            )
+
+    def save_task_result(self, run_id: str, task_id: str, result: Dict):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO task_results (run_id, task_id, status, result, notes, updated_at) "
+                "VALUES (?, ?, ?, ?, '', ?) "
+                "ON CONFLICT(run_id, task_id) DO UPDATE SET status = excluded.status, result = excluded.result, "
+                "updated_at = excluded.updated_at",
+                (run_id, task_id, result.get("status"), json.dumps(result, ensure_ascii=False), now)
+            )
+            self._conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (now, run_id))
+
+    def save_task_notes(self, run_id: str, task_id: str, notes: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO task_results (run_id, task_id, status, result, notes, updated_at) "
+                "VALUES (?, ?, NULL, NULL, ?, ?) "
+                "ON CONFLICT(run_id, task_id) DO UPDATE SET notes = excluded.notes, updated_at = excluded.updated_at",
+                (run_id, task_id, notes, time.time())
+            )
+
+    def delete_task_results(self, run_id: str, task_ids: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE task_results SET status = NULL, result = NULL, updated_at = ? WHERE run_id = ? AND task_id = ?",
+                [(time.time(), run_id, task_id) for task_id in task_ids]
+            )
+
+    def task_results(self, run_id: str, completed_only: bool = False) -> Dict[str, Dict]:
+        query = "SELECT task_id, result FROM task_results WHERE run_id = ? AND result IS NOT NULL"
+        if completed_only:
+            query += " AND status = 'completed'"
+        with self._lock:
+            rows = self._conn.execute(query, (run_id,)).fetchall()
+        return {task_id: json.loads(result) for task_id, result in rows}
+
+    def load_run(self, run_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id, description, idea, plan, report, status, created_at, updated_at FROM runs WHERE run_id = ?",
+                (run_id,)
+            ).fetchone()
+            task_rows = self._conn.execute(
+                "SELECT task_id, result, notes FROM task_results WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        if row is None:
+            return None
+
+        run = dict(zip(("run_id", "description", "idea", "plan", "report", "status", "created_at", "updated_at"), row))
+        for field in JSON_FIELDS:
+            run[field] = json.loads(run[field]) if run[field] else None
+        run["task_results"] = {task_id: json.loads(result) for task_id, result, _ in task_rows if result}
+        run["task_notes"] = {task_id: notes for task_id, _, notes in task_rows if notes}
+        return run
+
+    def list_runs(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.run_id, r.description, r.idea, r.status, r.updated_at, "
+                "(SELECT COUNT(*) FROM task_results t WHERE t.run_id = r.run_id AND t.status = 'completed') "
+                "FROM runs r ORDER BY r.updated_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        runs = []
+        for run_id, description, idea, status, updated_at, completed in rows:
+            project_name = (json.loads(idea) or {}).get("project_name") if idea else None
+            runs.append({
+                "run_id": run_id,
+                "name": project_name or (description or "")[:60] or run_id,
+                "status": status,
+                "updated_at": updated_at,
+                "completed_tasks": completed
+            })
+        return runs
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Set
+
+from utils.task_graph import content_hash
+
+MERSENNE_PRIME = (1 << 61) - 1
+SCOPE_MODES = ("global", "stack", "project")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFC", str(text or "")).lower()
+
+
+def shingles(text: str, size: int = 2) -> Set[str]:
+    words = _WORD.findall(normalize(text))
+    result = set(words)
+    result.update(" ".join(words[index:index + size]) for index in range(len(words) - size + 1))
+    return result
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class SimilarityIndex:
+    def __init__(self, path: str = ".cache/similarity.sqlite", reuse_threshold: float = 0.9,
+                 adapt_threshold: float = 0.6, scope_mode: str = "stack", num_perm: int = 64, bands: int = 16,
+                 max_entries: Optional[int] = 20000, auto_reuse: bool = False):
+        if scope_mode not in SCOPE_MODES:
+            raise ValueError(f"Phạm vi không hợp lệ: {scope_mode}")
+        if num_perm % bands:
+            raise ValueError("num_perm phải chia hết cho bands")
+        self.path = path
+        self.reuse_threshold = reuse_threshold
+        self.adapt_threshold = adapt_threshold
+        self.auto_reuse = auto_reuse
+        self.scope_mode = scope_mode
+        self.num_perm = num_perm
+        self.bands = bands
+        self.max_entries = max_entries
+        self.lookups = 0
+        self.reuse_hits = 0
+        self.adapt_hits = 0
+        self._lock = threading.Lock()
+
+        rng = random.Random(num_perm)
+        self._permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                              for _ in range(num_perm)]
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "entry_id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT NOT NULL, agent_type TEXT NOT NULL, "
+                "source TEXT, name TEXT, description TEXT, signature TEXT NOT NULL, result TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL, uses INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS bands ("
+                "band_key TEXT NOT NULL, scope TEXT NOT NULL, agent_type TEXT NOT NULL, entry_id INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_key ON bands(scope, agent_type, band_key)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_entry ON bands(entry_id)")
+
+    @classmethod
+    def from_env(cls) -> Optional["SimilarityIndex"]:
+        if os.getenv("SIMILARITY_INDEX", "on").lower() == "off":
+            return None
+        return cls(
+            path=os.getenv("SIMILARITY_INDEX_PATH", ".cache/similarity.sqlite"),
+            reuse_threshold=float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.9")),
+            adapt_threshold=float(os.getenv("SIMILARITY_ADAPT_THRESHOLD", "0.6")),
+            scope_mode=os.getenv("SIMILARITY_SCOPE", "stack"),
+            auto_reuse=os.getenv("SIMILARITY_AUTO_REUSE", "off").lower() == "on"
+        )
+
+    def scope(self, context: Optional[Dict]) -> str:
+        idea = (context or {}).get("idea") if isinstance(context, dict) else None
+        if self.scope_mode == "global" or not isinstance(idea, dict):
+            return "global"
+        if self.scope_mode == "project":
+            return content_hash(normalize(idea.get("project_name", "")))[:16]
+        stack = sorted(normalize(item) for item in idea.get("tech_stack_suggestions") or [])
+        return content_hash(stack)[:16] if stack else "global"
+
+    def signature(self, task: Dict) -> List[int]:
+        features = shingles(f"{task.get('name', '')} {task.get('description', '')}")
+        if not features:
+            return [MERSENNE_PRIME] * self.num_perm
+        hashes = [_hash64(feature) for feature in features]
+        return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in self._permutations]
+
+    def _band_keys(self, signature: List[int]) -> List[str]:
+        rows = self.num_perm // self.bands
+        return [
+            f"{band}:{content_hash(signature[band * rows:(band + 1) * rows])[:16]}"
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(left: List[int], right: List[int]) -> float:
+        return sum(1 for a, b in zip(left, right) if a == b) / len(left) if left else 0.0
+
+    def _best_match(self, task: Dict, scope: str, signature: List[int],
+                    exclude_source: Optional[str] = None) -> Optional[Dict]:
+        agent_type = task.get("assigned_agent", "research")
+        keys = self._band_keys(signature)
+        placeholders = ", ".join("?" for _ in keys)
+        rows = self._conn.execute(
+            "SELECT entry_id, name, description, signature, result FROM entries WHERE entry_id IN ("
+            f"SELECT entry_id FROM bands WHERE scope = ? AND agent_type = ? AND band_key IN ({placeholders})) "
+            "AND source IS NOT ?",
+            (scope, agent_type, *keys, exclude_source)
+        ).fetchall()
+
+        best = None
+        for entry_id, name, description, encoded_signature, result in rows:
+            score = self.similarity(signature, json.loads(encoded_signature))
+            if best is None or score > best["similarity"]:
+                best = {"entry_id": entry_id, "name": name, "description": description,
+                        "similarity": round(score, 4), "result": json.loads(result)}
+        return best
+
+    def lookup(self, task: Dict, context: Optional[Dict] = None, source: Optional[str] = None,
+               record: bool = True) -> Optional[Dict]:
+        signature = self.signature(task)
+        with self._lock:
+            best = self._best_match(task, self.scope(context), signature, source)
+            mode = None
+            if best and best["similarity"] >= self.reuse_threshold and self.auto_reuse:
+                mode = "reuse"
+            elif best and best["similarity"] >= self.adapt_threshold:
+                mode = "adapt"
+            if record:
+                self.lookups += 1
+                if mode == "reuse":
+                    self.reuse_hits += 1
+                elif mode == "adapt":
+                    self.adapt_hits += 1
+                if mode:
+                    with self._conn:
+                        self._conn.execute("UPDATE entries SET uses = uses + 1, last_used = ? WHERE entry_id = ?",
+                                           (time.time(), best["entry_id"]))
+        return {**best, "mode": mode} if mode else None
+
+    def add(self, task: Dict, result: Dict, context: Optional[Dict] = None,
+            source: Optional[str] = None) -> Optional[int]:
+        if result.get("status") != "completed" or result.get("reused_from") or not result.get("result"):
+            return None
+        scope = self.scope(context)
+        signature = self.signature(task)
+        stored = {key: result[key] for key in ("result", "agent_type", "model", "usage") if key in result}
+        now = time.time()
+        with self._lock, self._conn:
+            if source is not None:
+                self._delete("SELECT entry_id FROM entries WHERE source = ?", (source,))
+            else:
+                existing = self._best_match(task, scope, signature)
+                if existing and existing["similarity"] >= 0.98:
+                    self._conn.execute("UPDATE entries SET result = ?, last_used = ? WHERE entry_id = ?",
+                                       (json.dumps(stored, ensure_ascii=False), now, existing["entry_id"]))
+                    return existing["entry_id"]
+            agent_type = task.get("assigned_agent", "research")
+            cursor = self._conn.execute(
+                "INSERT INTO entries (scope, agent_type, source, name, description, signature, result, "
+                "created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, agent_type, source, task.get("name"), task.get("description"), json.dumps(signature),
+                 json.dumps(stored, ensure_ascii=False), now, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO bands (band_key, scope, agent_type, entry_id) VALUES (?, ?, ?, ?)",
+                [(key, scope, agent_type, cursor.lastrowid) for key in self._band_keys(signature)]
+            )
+            self._evict()
+            return cursor.lastrowid
+
+    def _delete(self, query: str, params=()):
+        entry_ids = [(row[0],) for row in self._conn.execute(query, params)]
+        self._conn.executemany("DELETE FROM bands WHERE entry_id = ?", entry_ids)
+        self._conn.executemany("DELETE FROM entries WHERE entry_id = ?", entry_ids)
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            self._delete("SELECT entry_id FROM entries ORDER BY last_used LIMIT ?", (count - self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bands")
+            self._conn.execute("DELETE FROM entries")
+        self.lookups = 0
+        self.reuse_hits = 0
+        self.adapt_hits = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        hits = self.reuse_hits + self.adapt_hits
+        return {
+            "lookups": self.lookups,
+            "reuse_hits": self.reuse_hits,
+            "adapt_hits": self.adapt_hits,
+            "misses": self.lookups - hits,
+            "hit_rate": hits / self.lookups if self.lookups else 0.0,
+            "entries": entries,
+            "reuse_threshold": self.reuse_threshold,
+            "adapt_threshold": self.adapt_threshold,
+            "auto_reuse": self.auto_reuse,
+            "scope_mode": self.scope_mode
+        }
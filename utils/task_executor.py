@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class TaskExecutor:
+    def __init__(self, max_workers: int = 8, retention_seconds: float = 3600.0):
+        self.max_workers = max_workers
+        self.retention_seconds = retention_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task-worker")
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _snapshot(job: Dict) -> Dict:
+        return {key: value for key, value in job.items() if key != "future"}
+
+    def _prune(self, now: float):
+        expired = [
+            key for key, job in self._jobs.items()
+            if job["finished_at"] is not None and now - job["finished_at"] > self.retention_seconds
+        ]
+        for key in expired:
+            del self._jobs[key]
+
+    def submit(self, key: str, fn: Callable, *args, **kwargs) -> bool:
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            existing = self._jobs.get(key)
+            if existing and existing["status"] in ACTIVE_STATUSES:
+                return False
+            job = {
+                "key": key,
+                "status": "queued",
+                "submitted_at": now,
+                "started_at": None,
+                "finished_at": None,
+                "partial": "",
+                "result": None,
+                "error": None
+            }
+            self._jobs[key] = job
+            job["future"] = self._pool.submit(self._run, job, fn, args, kwargs)
+        return True
+
+    def _run(self, job: Dict, fn: Callable, args, kwargs):
+        with self._lock:
+            if job["status"] != "queued":
+                return
+            job["status"] = "running"
+            job["started_at"] = time.time()
+
+        def on_token(delta: str):
+            job["partial"] += delta
+
+        try:
+            result = fn(*args, on_token=on_token, **kwargs)
+            status, error = "completed", None
+        except Exception as e:
+            result, status, error = None, "failed", str(e)
+
+        with self._lock:
+            job.update(result=result, status=status, error=error, finished_at=time.time())
+
+    def cancel(self, key: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(key)
+            if not job or job["status"] != "queued":
+                return False
+            job["future"].cancel()
+            job.update(status="cancelled", error="Đã hủy", finished_at=time.time())
+            return True
+
+    def jobs(self, prefix: str = "") -> Dict[str, Dict]:
+        with self._lock:
+            return {key: self._snapshot(job) for key, job in self._jobs.items() if key.startswith(prefix)}
+
+    def pop_finished(self, prefix: str = "") -> Dict[str, Dict]:
+        with self._lock:
+            finished = [
+                key for key, job in self._jobs.items()
+                if key.startswith(prefix) and job["status"] not in ACTIVE_STATUSES
+            ]
+            return {key: self._snapshot(self._jobs.pop(key)) for key in finished}
+
+    def stats(self, prefix: str = "") -> Dict:
+        jobs = self.jobs(prefix)
+        return {
+            "queued": sum(1 for job in jobs.values() if job["status"] == "queued"),
+            "running": sum(1 for job in jobs.values() if job["status"] == "running"),
+            "finished": sum(1 for job in jobs.values() if job["status"] not in ACTIVE_STATUSES),
+            "max_workers": self.max_workers
+        }
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
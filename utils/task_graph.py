@@ -0,0 +1,94 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Set
+
+
+def content_hash(data: Any) -> str:
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def plan_task_id(task: Dict, phase_idx: int, task_idx: int) -> str:
+    return task.get("task_id") or f"phase{phase_idx}_task{task_idx}"
+
+
+class TaskGraph:
+    def __init__(self, plan: Dict):
+        self.tasks: Dict[str, Dict] = {}
+        self.phase_of: Dict[str, int] = {}
+        self.order: List[str] = []
+        self.dependencies: Dict[str, List[str]] = {}
+        self.dependents: Dict[str, List[str]] = {}
+
+        for phase_idx, phase in enumerate(plan.get("phases", [])):
+            for task_idx, task in enumerate(phase.get("tasks", [])):
+                task_id = plan_task_id(task, phase_idx, task_idx)
+                if task_id in self.tasks:
+                    raise ValueError(f"Kế hoạch có task_id bị trùng: {task_id}")
+                self.tasks[task_id] = task
+                self.phase_of[task_id] = phase_idx
+                self.order.append(task_id)
+
+        for task_id in self.order:
+            deps = self.tasks[task_id].get("dependencies") or []
+            if isinstance(deps, str):
+                deps = [deps]
+            cleaned = []
+            for dep in deps:
+                if not dep or dep == task_id or dep in cleaned:
+                    continue
+                if dep not in self.tasks:
+                    raise ValueError(f"Task {task_id} phụ thuộc vào task không tồn tại: {dep}")
+                cleaned.append(dep)
+            self.dependencies[task_id] = cleaned
+            self.dependents.setdefault(task_id, [])
+            for dep in cleaned:
+                self.dependents.setdefault(dep, []).append(task_id)
+
+        self._check_cycles()
+
+    def _check_cycles(self):
+        visiting: Set[str] = set()
+        done: Set[str] = set()
+
+        for root in self.order:
+            if root in done:
+                continue
+            stack = [(root, iter(self.dependencies[root]))]
+            path = [root]
+            visiting.add(root)
+            while stack:
+                node, deps = stack[-1]
+                dep = next(deps, None)
+                if dep is None:
+                    stack.pop()
+                    path.pop()
+                    visiting.discard(node)
+                    done.add(node)
+                elif dep in visiting:
+                    cycle = path[path.index(dep):] + [dep]
+                    raise ValueError(f"Kế hoạch có phụ thuộc vòng: {' -> '.join(cycle)}")
+                elif dep not in done:
+                    visiting.add(dep)
+                    path.append(dep)
+                    stack.append((dep, iter(self.dependencies[dep])))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def ready_tasks(self, completed: Set[str], started: Set[str]) -> List[str]:
+        return [
+            task_id for task_id in self.order
+            if task_id not in started and all(dep in completed for dep in self.dependencies[task_id])
+        ]
+
+    def descendants(self, task_ids) -> Set[str]:
+        seen: Set[str] = set()
+        stack = list(task_ids)
+        while stack:
+            task_id = stack.pop()
+            for child in self.dependents.get(task_id, []):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return seen
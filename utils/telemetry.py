@@ -0,0 +1,232 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+PRICES_PER_MILLION = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075, 0.15),
+    "gpt-4o": (2.50, 10.00, 1.25, 2.50),
+    "gpt-4-turbo": (10.00, 30.00, 10.00, 10.00),
+    "o1-mini": (1.10, 4.40, 0.55, 1.10),
+    "o1": (15.00, 60.00, 7.50, 15.00),
+    "claude-3-5-sonnet": (3.00, 15.00, 0.30, 3.75),
+    "claude-3-5-haiku": (0.80, 4.00, 0.08, 1.00),
+    "claude-3-opus": (15.00, 75.00, 1.50, 18.75)
+}
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+HISTOGRAMS = {"latency": "llm_latency_seconds", "ttft": "llm_ttft_seconds", "queue_wait": "llm_queue_wait_seconds"}
+TOKEN_KINDS = ("input_tokens", "output_tokens", "cached_tokens", "cache_write_tokens")
+
+_CALL_CONTEXT: ContextVar[Dict] = ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def call_context(**fields):
+    token = _CALL_CONTEXT.set({**_CALL_CONTEXT.get(), **fields})
+    try:
+        yield
+    finally:
+        _CALL_CONTEXT.reset(token)
+
+
+def current_call_context() -> Dict:
+    return dict(_CALL_CONTEXT.get())
+
+
+def model_prices(model: str, prices: Optional[Dict[str, Tuple[float, float, float, float]]] = None):
+    prices = prices or PRICES_PER_MILLION
+    matches = [prefix for prefix in prices if model.startswith(prefix)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model: str, usage: Dict, prices: Optional[Dict] = None) -> float:
+    rates = model_prices(model, prices)
+    if not rates or not usage:
+        return 0.0
+    input_rate, output_rate, cached_rate, write_rate = rates
+    cached = usage.get("cached_tokens", 0)
+    written = usage.get("cache_write_tokens", 0)
+    uncached = max(0, usage.get("input_tokens", 0) - cached - written)
+    return (uncached * input_rate + cached * cached_rate + written * write_rate +
+            usage.get("output_tokens", 0) * output_rate) / 1_000_000
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels.items())
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Telemetry:
+    def __init__(self, max_events: int = 5000, prices: Optional[Dict] = None, events_path: Optional[str] = None):
+        self.prices = prices
+        self.events_path = events_path
+        self._events = deque(maxlen=max_events)
+        self._series: Dict[Tuple[str, str], Dict] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        if events_path and os.path.dirname(events_path):
+            os.makedirs(os.path.dirname(events_path), exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "Telemetry":
+        return cls(events_path=os.getenv("TELEMETRY_EVENTS_PATH") or None)
+
+    def _new_series(self) -> Dict:
+        return {
+            "calls": 0,
+            "errors": {},
+            "cache_hits": 0,
+            "hedged": 0,
+            "tokens": dict.fromkeys(TOKEN_KINDS, 0),
+            "cost_usd": 0.0,
+            "histograms": {name: {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0}
+                           for name in HISTOGRAMS},
+            "recent": {name: deque(maxlen=1000) for name in HISTOGRAMS}
+        }
+
+    def record(self, event: Dict) -> Dict:
+        cost = 0.0 if event.get("cache_hit") else estimate_cost(event.get("model", ""), event, self.prices)
+        event = {**event, "cost_usd": round(cost, 6)}
+        key = (event.get("agent_type") or "unknown", event.get("model") or "unknown")
+        with self._lock:
+            self._events.append(event)
+            series = self._series.setdefault(key, self._new_series())
+            series["calls"] += 1
+            if event.get("error"):
+                series["errors"][event["error"]] = series["errors"].get(event["error"], 0) + 1
+            if event.get("cache_hit"):
+                series["cache_hits"] += 1
+            if event.get("hedged"):
+                series["hedged"] += 1
+            for kind in TOKEN_KINDS if not event.get("cache_hit") else ():
+                series["tokens"][kind] += event.get(kind, 0) or 0
+            series["cost_usd"] += event["cost_usd"]
+            for name in HISTOGRAMS:
+                value = event.get(name)
+                if value is None:
+                    continue
+                histogram = series["histograms"][name]
+                histogram["buckets"][bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+                histogram["sum"] += value
+                histogram["count"] += 1
+                series["recent"][name].append(value)
+        if self.events_path:
+            line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+            with self._write_lock, open(self.events_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        return event
+
+    def events(self, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            return list(self._events)[-limit:]
+
+    def summary(self) -> Dict:
+        with self._lock:
+            rows = []
+            for (agent_type, model), series in sorted(self._series.items()):
+                row = {
+                    "agent_type": agent_type,
+                    "model": model,
+                    "calls": series["calls"],
+                    "errors": sum(series["errors"].values()),
+                    "error_classes": dict(series["errors"]),
+                    "cache_hits": series["cache_hits"],
+                    "hedged": series["hedged"],
+                    **series["tokens"],
+                    "cost_usd": round(series["cost_usd"], 6)
+                }
+                for name in HISTOGRAMS:
+                    values = list(series["recent"][name])
+                    row[f"{name}_p50"] = _percentile(values, 0.5)
+                    row[f"{name}_p95"] = _percentile(values, 0.95)
+                rows.append(row)
+
+        totals = {
+            "calls": sum(row["calls"] for row in rows),
+            "errors": sum(row["errors"] for row in rows),
+            "cache_hits": sum(row["cache_hits"] for row in rows),
+            "hedged": sum(row["hedged"] for row in rows),
+            **{kind: sum(row[kind] for row in rows) for kind in TOKEN_KINDS},
+            "cost_usd": round(sum(row["cost_usd"] for row in rows), 6)
+        }
+        return {"generated_at": time.time(), "totals": totals, "series": rows}
+
+    def prometheus(self) -> str:
+        families: Dict[str, Tuple[str, List[str]]] = {
+            name: ("counter", []) for name in
+            ("llm_calls_total", "llm_errors_total", "llm_cache_hits_total", "llm_hedged_total", "llm_tokens_total",
+             "llm_cost_usd_total")
+        }
+        families.update({metric: ("histogram", []) for metric in HISTOGRAMS.values()})
+        with self._lock:
+            for (agent_type, model), series in sorted(self._series.items()):
+                labels = _labels(agent_type=agent_type, model=model)
+                families["llm_calls_total"][1].append(f"llm_calls_total{{{labels}}} {series['calls']}")
+                for error_class, count in series["errors"].items():
+                    families["llm_errors_total"][1].append(
+                        f"llm_errors_total{{{labels},{_labels(error_class=error_class)}}} {count}"
+                    )
+                families["llm_cache_hits_total"][1].append(f"llm_cache_hits_total{{{labels}}} {series['cache_hits']}")
+                families["llm_hedged_total"][1].append(f"llm_hedged_total{{{labels}}} {series['hedged']}")
+                for kind, count in series["tokens"].items():
+                    families["llm_tokens_total"][1].append(
+                        f"llm_tokens_total{{{labels},{_labels(kind=kind.replace('_tokens', ''))}}} {count}"
+                    )
+                families["llm_cost_usd_total"][1].append(f"llm_cost_usd_total{{{labels}}} {series['cost_usd']:.6f}")
+                for name, metric in HISTOGRAMS.items():
+                    histogram = series["histograms"][name]
+                    samples = families[metric][1]
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram["buckets"]):
+                        cumulative += count
+                        samples.append(f"{metric}_bucket{{{labels},le=\"{bound}\"}} {cumulative}")
+                    samples.append(f"{metric}_sum{{{labels}}} {histogram['sum']:.6f}")
+                    samples.append(f"{metric}_count{{{labels}}} {histogram['count']}")
+
+        lines = []
+        for name, (metric_type, samples) in families.items():
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: Optional[str] = None) -> ThreadingHTTPServer:
+        host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body, content_type = telemetry.prometheus(), "text/plain; version=0.0.4"
+                elif path == "/metrics.json":
+                    body, content_type = json.dumps(telemetry.summary(), ensure_ascii=False), "application/json"
+                elif path == "/events":
+                    body, content_type = json.dumps(telemetry.events(), ensure_ascii=False, default=str), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                payload = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server